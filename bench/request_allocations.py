@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Measure per-request memory churn of a minimal Rhino application.
+
+For each request, reports the number of garbage-collector tracked objects
+(containers: instances, dicts, lists, tuples, ...) that are alive while the
+WSGI response iterator is still open, i.e. the per-request footprint that a
+server holds for every in-flight request. When `tracemalloc` is available
+(Python 3.4+), the number of bytes allocated per request is reported as well.
+
+Usage:
+
+    $ python bench/request_allocations.py [number_of_requests]
+"""
+from __future__ import print_function
+
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from rhino import Mapper, Resource, ok
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def make_app():
+    resource = Resource()
+
+    @resource.get
+    def index(request, name):
+        return ok('hello, %s' % name)
+
+    app = Mapper()
+    app.add('/hello/{name}', resource)
+    return app
+
+
+def make_environ():
+    return {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': '/hello/world',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_ACCEPT': 'text/plain',
+        'wsgi.url_scheme': 'http',
+    }
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def measure(app, n):
+    """Returns (objects, bytes) alive per in-flight request."""
+    environs = [make_environ() for i in range(n)]
+    gc.collect()
+    gc.disable()
+    try:
+        if tracemalloc:
+            tracemalloc.start()
+            before_bytes = tracemalloc.get_traced_memory()[0]
+        before = len(gc.get_objects())
+        in_flight = [app.wsgi(environ, start_response)
+                     for environ in environs]
+        objects = len(gc.get_objects()) - before
+        if tracemalloc:
+            size = tracemalloc.get_traced_memory()[0] - before_bytes
+            tracemalloc.stop()
+        else:
+            size = None
+        for app_iter in in_flight:
+            b''.join(app_iter)
+            app_iter.close()
+    finally:
+        gc.enable()
+    # Don't count the list holding the iterators
+    objects -= 1
+    return objects / float(n), (size / float(n) if size is not None else None)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    app = make_app()
+    measure(app, 10)  # warm up caches
+    objects, size = measure(app, n)
+    print("requests: %d" % n)
+    print("gc-tracked objects per request: %.1f" % objects)
+    if size is not None:
+        print("bytes allocated per request: %.0f" % size)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,9 @@ from .http import cache_control
 from .mapper import Mapper
 from .request import Request
 from .resource import Resource, get, post, put, delete, patch, options
-from .response import Response, Entity, \
+from .response import Response, FrozenResponse, Entity, \
         response, ok, created, no_content, redirect
-from .static import StaticFile, StaticDirectory
+from .static import StaticFile, StaticDirectory, StaticCache
 
 __version__ = '0.0.5'
 
@@ -14,9 +14,9 @@ __all__ = [
     'Mapper',
     'Resource',
     'get', 'post', 'put', 'delete', 'patch', 'options',
-    'StaticFile', 'StaticDirectory',
+    'StaticFile', 'StaticDirectory', 'StaticCache',
     'Request',
-    'Response', 'Entity',
+    'Response', 'FrozenResponse', 'Entity',
     'response', 'ok', 'created', 'no_content', 'redirect',
     'cache_control',
 ]
@@ -0,0 +1,633 @@
+"""
+Server-side HTTP response cache.
+
+The `ResponseCache` class is a wrapper (see `Mapper.add_wrapper`) that
+caches responses inside the application process, following the rules for
+shared caches (like a reverse proxy would):
+
+    from rhino import Mapper
+    from rhino.cache import ResponseCache, MemoryStorage
+
+    cache = ResponseCache(MemoryStorage(max_bytes=64 * 1024 * 1024))
+    app = Mapper()
+    app.add_wrapper(cache)
+
+Only "200 OK" responses to GET requests are stored, and only if the body
+is a string (or produced by a serializer) and the response is fresh for
+some time: it needs `s-maxage` or `max-age` in its Cache-Control header (see
+`rhino.http.cache_control`), or an Expires header, unless the cache has a
+`default_ttl`. Responses with Cache-Control `private`, `no-store` or
+`no-cache`, with `Vary: *`, or with a Set-Cookie header are never stored.
+Requests with an Authorization header only use and populate the cache for
+responses that are explicitly `public` or have `s-maxage`.
+
+Fresh cached responses are returned to GET and HEAD requests without calling
+the wrapped application, so no routing or handler code runs. They still go
+through the Mapper's conditional request handling, so requests with
+matching validators get a "304 Not Modified". Responses with a Vary header
+are cached separately for each combination of the listed request headers.
+Requests with Cache-Control `no-cache` or `max-age=0` bypass stored
+entries, and `no-store` bypasses the cache completely.
+
+Stale-while-revalidate: after a response has become stale, it can still be
+served for `stale-while-revalidate` seconds (a Cache-Control directive of
+the response, or the cache's default). During that time, the first request
+for it is passed on to the application to refresh the entry, while
+concurrent requests for the same entry get the stale response instead of
+waiting.
+
+Purging: responses can be tagged with a space-separated list of keys in a
+'Surrogate-Key' header. `ResponseCache.purge` removes all entries that have
+a given key. The header is removed before responses are sent.
+
+Wrappers that are added after the cache run for cached responses as well.
+To compress cached responses, add `rhino.compression.Compression` after the
+`ResponseCache`. Responses that already have body filters (e.g. from
+compression) are not stored.
+
+Handler results can also be cached individually, using a `HandlerCache`.
+Its `cached` decorator stores the return value of a handler (a Response, or
+the object that would be serialized by `produces`) for a fixed time:
+
+    from rhino import get
+    from rhino.cache import HandlerCache
+
+    handler_cache = HandlerCache(max_entries=1000, max_bytes=16 * 1024 * 1024)
+
+    @get(produces=json_repr)
+    @handler_cache.cached(ttl=300, query=['year'])
+    def sales_report(request, region):
+        # ...
+
+    # Later, e.g. after an update:
+    handler_cache.invalidate('sales_report', 'emea')
+
+Results are keyed on the handler name, the URL parameters, the selected
+query parameters and the negotiated media type. Unlike `ResponseCache`,
+the cached value is used regardless of the request's headers and the
+response's Cache-Control header.
+"""
+from __future__ import absolute_import
+
+import cPickle as pickle
+import functools
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from hashlib import sha1
+
+from .http import parse_cache_control, httpdate_to_timestamp
+from .response import Response, stored_response, store_response, \
+        restore_response
+from .util import LRUCache, dual_use_decorator_method, get_args
+from .vendor import mimeparse
+
+__all__ = [
+    'ResponseCache',
+    'MemoryStorage',
+    'DirectoryStorage',
+    'HandlerCache',
+]
+
+cache_entry = namedtuple('cache_entry', 'status headers body stored '
+                         'fresh_until stale_until tags shared')
+
+# Stored under the URL key of responses that have a Vary header.
+vary_entry = namedtuple('vary_entry', 'headers')
+
+handler_cache_stats = namedtuple('handler_cache_stats',
+                                 'hits misses entries bytes')
+
+_memo_entry = namedtuple('_memo_entry', 'expires value size')
+
+_missing = object()
+
+
+def _entry_size(entry):
+    if isinstance(entry, vary_entry):
+        return 64 + sum(len(name) for name in entry.headers)
+    return 256 + len(entry.body) + sum(
+            len(k) + len(v) for k, v in entry.headers)
+
+
+class MemoryStorage(object):
+    """In-memory storage that evicts least recently used entries.
+
+    Holds at most `max_bytes` (approximately) and, if given, `max_entries`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=None):
+        self._lock = threading.Lock()
+        self._items = LRUCache(max_entries, max_bytes=max_bytes,
+                               sizeof=_entry_size)
+
+    def get(self, key):
+        with self._lock:
+            return self._items.get(key)
+
+    def set(self, key, entry):
+        with self._lock:
+            self._items[key] = entry
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._items.keys())
+
+    def tags(self, key):
+        """Return the surrogate keys of an entry, or None."""
+        with self._lock:
+            entry = self._items.get(key)
+        return entry.tags if isinstance(entry, cache_entry) else None
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def _read_header(f):
+    header = pickle.load(f)
+    if type(header) is not tuple or len(header) != 2:
+        raise pickle.UnpicklingError("Invalid cache file header")
+    return header
+
+
+class DirectoryStorage(object):
+    """Storage that keeps one file per entry in a directory.
+
+    Can be shared by several processes. Entries are written to a temporary
+    file first and renamed, so readers never see partial entries.
+
+    Each file starts with a small header holding the time the entry expires
+    (including any stale-while-revalidate period) and its surrogate keys, so
+    that expired entries can be removed and entries purged without loading
+    them. Expired entries are deleted when they are read, and by `sweep`.
+    `sweep` runs when an entry is stored, at most every `sweep_interval`
+    seconds. It also removes the least recently stored entries while there
+    are more than `max_entries`, or while the files take up more than
+    `max_bytes` in total, so these limits are approximate. `clock` must
+    return the same time as the `ResponseCache`'s clock.
+    """
+
+    def __init__(self, path, max_entries=None, max_bytes=None,
+                 sweep_interval=60, clock=time.time):
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._next_sweep = 0
+        self._sweep_lock = threading.Lock()
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.path, key), 'rb') as f:
+                expires, tags = _read_header(f)
+                if expires is None or self.clock() < expires:
+                    return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        self.delete(key)
+        return None
+
+    def tags(self, key):
+        """Return the surrogate keys of an entry, or None."""
+        try:
+            with open(os.path.join(self.path, key), 'rb') as f:
+                return _read_header(f)[1]
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, entry):
+        if isinstance(entry, cache_entry):
+            header = (entry.stale_until, entry.tags)
+        else:
+            header = (None, frozenset())
+        filename = os.path.join(self.path, key)
+        tmp = '%s.%d.%d.tmp' % (filename, os.getpid(),
+                                threading.current_thread().ident)
+        with open(tmp, 'wb') as f:
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, filename)
+        if self.clock() >= self._next_sweep \
+                and self._sweep_lock.acquire(False):
+            try:
+                self.sweep()
+            finally:
+                self._sweep_lock.release()
+
+    def sweep(self):
+        """Remove expired entries, and the oldest entries while the
+        storage is over its limits.
+
+        Returns the number of entries removed.
+        """
+        now = self.clock()
+        self._next_sweep = now + self.sweep_interval
+        removed = 0
+        entries = []
+        for key in self.keys():
+            try:
+                with open(os.path.join(self.path, key), 'rb') as f:
+                    expires, tags = _read_header(f)
+                    stat = os.fstat(f.fileno())
+            except (IOError, EOFError, pickle.UnpicklingError):
+                continue
+            if expires is not None and now >= expires:
+                self.delete(key)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, key))
+        entries.sort(reverse=True)
+        count, size = len(entries), sum(e[1] for e in entries)
+        while entries and (
+                self.max_entries is not None and count > self.max_entries
+                or self.max_bytes is not None and size > self.max_bytes):
+            mtime, entry_size, key = entries.pop()
+            self.delete(key)
+            count -= 1
+            size -= entry_size
+            removed += 1
+        return removed
+
+    def delete(self, key):
+        try:
+            os.unlink(os.path.join(self.path, key))
+        except OSError:
+            pass
+
+    def keys(self):
+        return [name for name in os.listdir(self.path)
+                if not name.endswith('.tmp')]
+
+    def clear(self):
+        for key in self.keys():
+            self.delete(key)
+
+
+class ResponseCache(object):
+    """A wrapper that caches responses.
+
+    Parameters:
+
+    storage
+      : The storage backend. Defaults to a `MemoryStorage` with the default
+        size.
+
+    default_ttl
+      : Time (in seconds) to cache responses that have no explicit freshness
+        information. By default, such responses are not cached.
+
+    stale_while_revalidate
+      : Time (in seconds) a stale response may be served while it is being
+        refreshed, for responses that have no `stale-while-revalidate`
+        Cache-Control directive.
+
+    strip_surrogate_keys
+      : Remove the Surrogate-Key header from responses.
+    """
+
+    def __init__(self, storage=None, default_ttl=None,
+                 stale_while_revalidate=0, strip_surrogate_keys=True,
+                 clock=time.time):
+        self.storage = storage if storage is not None else MemoryStorage()
+        self.default_ttl = default_ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.strip_surrogate_keys = strip_surrogate_keys
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._revalidating = set()
+
+    def __call__(self, app):
+        def wrap(request, ctx):
+            return self.handle(request, ctx, app)
+        return wrap
+
+    def handle(self, request, ctx, app):
+        """Serve a request from the cache or pass it on to `app`."""
+        if request.method not in ('GET', 'HEAD'):
+            return app(request, ctx)
+        request_cc = parse_cache_control(request.headers.get('Cache-Control'))
+        if 'no-store' in request_cc:
+            return app(request, ctx)
+
+        base_key = sha1(request.url).hexdigest()
+        key, entry = self._lookup(request, base_key)
+        if entry is None or 'no-cache' in request_cc \
+                or request_cc.get('max-age') == '0' \
+                or not entry.shared and 'Authorization' in request.headers:
+            return self._fetch(request, ctx, app, base_key)
+
+        now = self.clock()
+        if now < entry.fresh_until:
+            return self._make_response(entry, now)
+        if now >= entry.stale_until:
+            self.storage.delete(key)
+            return self._fetch(request, ctx, app, base_key)
+
+        with self._lock:
+            revalidating = key in self._revalidating
+            if not revalidating:
+                self._revalidating.add(key)
+        if revalidating:
+            return self._make_response(entry, now)
+        try:
+            return self._fetch(request, ctx, app, base_key)
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def purge(self, tag):
+        """Remove all entries tagged with a surrogate key.
+
+        Returns the number of entries removed.
+        """
+        count = 0
+        for key in self.storage.keys():
+            tags = self.storage.tags(key)
+            if tags and tag in tags:
+                self.storage.delete(key)
+                count += 1
+        return count
+
+    def clear(self):
+        """Remove all entries."""
+        self.storage.clear()
+
+    def _lookup(self, request, base_key):
+        entry = self.storage.get(base_key)
+        if isinstance(entry, vary_entry):
+            key = self._variant_key(base_key, entry.headers, request)
+            return key, self.storage.get(key)
+        return base_key, entry
+
+    def _variant_key(self, base_key, header_names, request):
+        headers = request.headers
+        return sha1(base_key + ''.join(
+            '\0%s:%s' % (name, headers.get(name, u'').encode('utf-8'))
+            for name in header_names)).hexdigest()
+
+    def _make_response(self, entry, now):
+        return restore_response(
+                entry, [('Age', str(int(now - entry.stored)))])
+
+    def _fetch(self, request, ctx, app, base_key):
+        response = app(request, ctx)
+        if request.method == 'GET':
+            self._store(request, base_key, response)
+        if self.strip_surrogate_keys:
+            del response.headers['Surrogate-Key']
+        return response
+
+    def _ttl(self, cc, headers, now):
+        for directive in ('s-maxage', 'max-age'):
+            if directive in cc:
+                try:
+                    return int(cc[directive])
+                except (TypeError, ValueError):
+                    return None
+        expires = headers.get('Expires')
+        if expires is not None:
+            try:
+                return httpdate_to_timestamp(expires) - now
+            except Exception:
+                return None  # Invalid dates mean "already expired"
+        return self.default_ttl
+
+    def _store(self, request, base_key, response):
+        headers = response.headers
+        if response.code != 200 or response._body_filters \
+                or 'Set-Cookie' in headers:
+            return
+        cc = parse_cache_control(headers.get('Cache-Control'))
+        if 'no-store' in cc or 'private' in cc or 'no-cache' in cc:
+            return
+        shared = 'public' in cc or 's-maxage' in cc
+        if not shared and 'Authorization' in request.headers:
+            return
+        vary = sorted(set(
+            name.strip().lower()
+            for name in headers.get('Vary', '').split(',') if name.strip()))
+        if '*' in vary:
+            return
+        now = self.clock()
+        ttl = self._ttl(cc, headers, now)
+        if not ttl or ttl <= 0:
+            return
+
+        stored = store_response(response)
+        if stored is None:
+            return  # Don't buffer iterators and files
+
+        try:
+            swr = int(cc['stale-while-revalidate'])
+        except (KeyError, TypeError, ValueError):
+            swr = self.stale_while_revalidate
+        entry_headers = [(k, v) for k, v in stored.headers
+                         if k.lower() not in ('surrogate-key', 'age')]
+        entry = cache_entry(
+                status=stored.status,
+                headers=entry_headers,
+                body=stored.body,
+                stored=now,
+                fresh_until=now + ttl,
+                stale_until=now + ttl + swr,
+                tags=frozenset(headers.get('Surrogate-Key', '').split()),
+                shared=shared)
+        if vary:
+            self.storage.set(base_key, vary_entry(vary))
+            key = self._variant_key(base_key, vary, request)
+        else:
+            key = base_key
+        self.storage.set(key, entry)
+
+
+def _value_size(value):
+    if isinstance(value, stored_response):
+        return len(value.body) + sum(len(k) + len(v) for k, v in value.headers)
+    if isinstance(value, basestring):
+        return len(value)
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class HandlerCache(object):
+    """Caches the return values of handler functions in memory.
+
+    Parameters:
+
+    ttl
+      : The default time (in seconds) to keep results.
+
+    max_entries
+      : The maximum number of results to keep.
+
+    max_bytes
+      : The maximum total size of the results, if not None. The size of a
+        value is computed by `sizeof`, which by default uses the length of
+        strings and the size of the pickled representation of other objects.
+
+    Least recently used results are evicted when a limit is reached.
+    """
+
+    def __init__(self, ttl=60, max_entries=1000, max_bytes=None,
+                 sizeof=_value_size, clock=time.time):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.clock = clock
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._items = LRUCache(max_entries, max_bytes=max_bytes,
+                               sizeof=lambda entry: entry.size)
+
+    @dual_use_decorator_method
+    def cached(self, ttl=None, args=None, query=(), media_types=None,
+               name=None):
+        """Cache the results of the decorated handler.
+
+        Parameters:
+
+        ttl
+          : The time (in seconds) to keep results. Defaults to the cache's
+            `ttl`.
+
+        args
+          : The names of the URL parameters (`request.routing_args`) to
+            include in the key, in order. By default, all parameters are
+            included, sorted by name.
+
+        query
+          : The names of query parameters to include in the key.
+
+        media_types
+          : The media types the handler can produce. The best match for the
+            request's Accept header is included in the key. Defaults to the
+            `provides` media types from the handler decorators, if any.
+
+        name
+          : The first part of the key. Defaults to the function name.
+
+        The key is a tuple of `name`, the values of the URL parameters, the
+        query parameters (as a tuple of (name, values) pairs) and the media
+        type. Keys are used as prefixes in `invalidate`.
+
+        Only Response objects with a status of "200 OK" and a string body
+        (or a callable returning a string) are cached. Other return values are cached as-is; callers must not
+        modify them. The decorated function gets an `invalidate` attribute
+        that takes the rest of the key prefix after the name.
+
+        Apply this decorator before (below) the `get`, `post`, etc.
+        decorators, and before `Resource` methods used as decorators.
+        """
+        def decorator(fn):
+            fn_name = name or fn.__name__
+            timeout = self.ttl if ttl is None else ttl
+
+            def call(args_, kw):
+                request = args_[-1]
+                types = media_types
+                if types is None:
+                    types = [meta.provides
+                             for meta in getattr(wrapper, '_rhino_meta', ())
+                             if meta.provides]
+                key = self._make_key(fn_name, request, args, query, types)
+                entry = self._get(key)
+                if entry is not None:
+                    return self._thaw(entry.value)
+                rv = fn(*args_, **kw)
+                self._set(key, rv, timeout)
+                return rv
+
+            if 'ctx' in get_args(fn):
+                # apply_ctx() only passes ctx to functions that declare it.
+                def wrapper(_arg0, _arg1=_missing, ctx=None, **kw):
+                    args_ = (_arg0,) if _arg1 is _missing else (_arg0, _arg1)
+                    kw['ctx'] = ctx
+                    return call(args_, kw)
+            else:
+                def wrapper(*args_, **kw):
+                    return call(args_, kw)
+
+            functools.update_wrapper(wrapper, fn)
+            wrapper.invalidate = functools.partial(self.invalidate, fn_name)
+            return wrapper
+        return decorator
+
+    def invalidate(self, *prefix):
+        """Remove all results whose keys start with the given values.
+
+        Returns the number of results removed.
+        """
+        n = len(prefix)
+        with self._lock:
+            keys = [key for key in self._items.keys() if key[:n] == prefix]
+            for key in keys:
+                self._items.pop(key)
+        return len(keys)
+
+    def clear(self):
+        """Remove all results."""
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """Return a `handler_cache_stats` tuple (hits, misses, entries,
+        bytes)."""
+        with self._lock:
+            return handler_cache_stats(self.hits, self.misses,
+                                       len(self._items), self._items.bytes)
+
+    def _make_key(self, name, request, args, query, media_types):
+        routing_args = request.routing_args
+        if args is None:
+            args = sorted(routing_args)
+        key = (name,) + tuple(routing_args.get(arg) for arg in args)
+        if query:
+            q = request.query
+            key += (tuple((param, tuple(q.getall(param))) for param in query),)
+        if media_types:
+            accept = request.headers.get('Accept')
+            key += (mimeparse.best_match(reversed(media_types), accept)
+                    if accept else media_types[0],)
+        return key
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and self.clock() >= entry.expires:
+                self._items.pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def _set(self, key, value, ttl):
+        if isinstance(value, Response):
+            if value.code != 200:
+                return
+            # The Content-Type may still be set by the Resource or Mapper.
+            value = store_response(value, content_type=False)
+            if value is None:
+                return
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        entry = _memo_entry(self.clock() + ttl, value, size)
+        with self._lock:
+            self._items[key] = entry
+
+    def _thaw(self, value):
+        if isinstance(value, stored_response):
+            return restore_response(value)
+        return value
@@ -0,0 +1,153 @@
+"""
+Request coalescing.
+
+When many identical requests arrive at the same time (e.g. right after a
+cached value has expired), the `Coalescer` wrapper lets only one of them
+reach the application. The others wait for it to finish and get a copy of
+its response:
+
+    from rhino import Mapper
+    from rhino.coalesce import Coalescer
+
+    app = Mapper()
+    app.add_wrapper(Coalescer(timeout=5))
+
+To coalesce requests for some routes only, wrap their targets instead:
+
+    reports = Coalescer(headers=['Accept'])
+    app.add('/reports/{year}', reports(report_resource))
+
+Only GET requests are coalesced. Requests are identical when their URL
+(including the query string), the request headers listed in `headers`, and
+their conditional request headers are the same. Requests with credentials
+(an Authorization or Cookie header) are never coalesced, unless that header
+is listed in `headers`. Responses are shared only if their body is a string
+(or produced by a serializer), they have no Set-Cookie header, no body
+filters, and are not marked "private" or "no-store" in their Cache-Control
+header. Otherwise, and when the first request raises an exception, the
+waiting requests are passed on to the application after all.
+
+Add wrappers that modify responses for each request, such as
+`rhino.compression.Compression`, after the `Coalescer`.
+"""
+from __future__ import absolute_import
+
+import threading
+from collections import namedtuple
+
+from .http import parse_cache_control
+from .resource import Resource
+from .response import store_response, restore_response
+
+__all__ = [
+    'Coalescer',
+]
+
+coalescer_stats = namedtuple('coalescer_stats', 'leaders coalesced timeouts')
+
+_conditional_headers = ('If-None-Match', 'If-Modified-Since')
+
+_credential_headers = ('Authorization', 'Cookie')
+
+
+class _Flight(object):
+    __slots__ = ('done', 'result')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class Coalescer(object):
+    """A wrapper that coalesces concurrent identical GET requests.
+
+    Parameters:
+
+    headers
+      : Request headers that are part of the coalescing key, in addition to
+        the URL. Include 'Cookie' or 'Authorization' to coalesce requests
+        with the same credentials.
+
+    timeout
+      : Maximum time (in seconds) to wait for an in-flight request. Requests
+        that time out are passed on to the application.
+
+    The counters `leaders` (requests passed on to the application while
+    others could wait for them), `coalesced` (requests that got a shared
+    response) and `timeouts` are available as attributes and from `stats`.
+    """
+
+    def __init__(self, headers=('Accept', 'Accept-Encoding',
+                                'Accept-Language'), timeout=10):
+        self.headers = tuple(headers) + _conditional_headers
+        keyed = set(name.lower() for name in self.headers)
+        # Credentials that are not part of the key make requests unique.
+        self._bypass_headers = tuple(name for name in _credential_headers
+                                     if name.lower() not in keyed)
+        self.timeout = timeout
+        self.leaders = self.coalesced = self.timeouts = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def __call__(self, app):
+        # Allow wrapping standalone handlers, like `Mapper.add` does.
+        if hasattr(app, '_rhino_meta'):
+            app = Resource(app)
+
+        def wrap(request, ctx):
+            return self.handle(request, ctx, app)
+        if hasattr(app, 'build_url'):
+            wrap.build_url = app.build_url
+        return wrap
+
+    def handle(self, request, ctx, app):
+        """Pass a request on to `app`, or wait for an identical one."""
+        if request.method != 'GET' or any(
+                name in request.headers for name in self._bypass_headers):
+            return app(request, ctx)
+        key = self._make_key(request)
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+
+        if is_leader:
+            try:
+                response = app(request, ctx)
+                flight.result = self._freeze(response)
+                return response
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+
+        if not flight.done.wait(self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            return app(request, ctx)
+        result = flight.result
+        if result is None:
+            return app(request, ctx)
+        with self._lock:
+            self.coalesced += 1
+        return restore_response(result)
+
+    def stats(self):
+        """Return a `coalescer_stats` tuple (leaders, coalesced, timeouts)."""
+        with self._lock:
+            return coalescer_stats(self.leaders, self.coalesced, self.timeouts)
+
+    def _make_key(self, request):
+        headers = request.headers
+        return (request.url,) + tuple(headers.get(name) for name in self.headers)
+
+    def _freeze(self, response):
+        headers = response.headers
+        if response._body_filters or 'Set-Cookie' in headers:
+            return None
+        cc = parse_cache_control(headers.get('Cache-Control'))
+        if 'private' in cc or 'no-store' in cc:
+            return None
+        return store_response(response)
@@ -0,0 +1,247 @@
+"""
+Response compression.
+
+The `Compression` class is a wrapper (see `Mapper.add_wrapper`) that
+compresses response bodies using gzip or deflate, depending on the request's
+Accept-Encoding header:
+
+    from rhino import Mapper
+    from rhino.compression import Compression
+
+    app = Mapper()
+    app.add_wrapper(Compression(min_size=512))
+
+String bodies are compressed in one go. Iterator bodies are compressed
+incrementally, and the compressor is flushed after every chunk so that
+streaming responses (e.g. Server-Sent Events) are still delivered promptly.
+
+Compression is applied during finalization of the response, after
+conditional request handling. Responses that are eligible for compression
+get a 'Vary: Accept-Encoding' header. When a response is going to be
+compressed, its ETag is replaced with a weak ETag specific to the content
+coding, so that validators for the compressed and uncompressed variants
+never match each other.
+
+Responses to HEAD requests carry the same ETag and Content-Encoding headers
+as the corresponding GET response, but no Content-Length, as the compressed
+size is not known without compressing the body. (The body is not evaluated
+for HEAD requests, so a lazy body that turns out to be smaller than
+`min_size` is still described as compressed.)
+
+A `rhino.resource.Resource` with validator providers answers conditional
+requests before its handler is called, and thus before the response is
+compressed. Only the provider's ETag is compared at that point, so a
+request with the ETag of a compressed variant still calls the handler;
+the "304 Not Modified" response is then produced by the Mapper after
+compression. Early 304 responses get the 'Vary: Accept-Encoding' header.
+
+Responses that hand off sending a file to the front-end server (with an
+X-Accel-Redirect or X-Sendfile header, see `rhino.static`) are left alone,
+as their body is empty.
+"""
+from __future__ import absolute_import
+
+import zlib
+
+from .http import negotiate_encoding, etag_re
+from .response import FLUSH
+
+__all__ = [
+    'Compression',
+]
+
+DEFAULT_CONTENT_TYPES = (
+    'text/*',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/x-ndjson',
+    'image/svg+xml',
+)
+
+# Headers of responses whose body is sent by the front-end server.
+_offload_headers = ('X-Accel-Redirect', 'X-Sendfile')
+
+_wbits = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def _compress_iter(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if chunk is FLUSH:
+                yield FLUSH
+            elif chunk:
+                yield compressor.compress(chunk) \
+                        + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def is_compressible(content_type, content_types=DEFAULT_CONTENT_TYPES):
+    """Return True if a media type matches one of `content_types`.
+
+    Entries in `content_types` ending in '/*' match all subtypes.
+
+    >>> is_compressible('text/css; charset=utf-8')
+    True
+    >>> is_compressible('image/png')
+    False
+    """
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return media_type in content_types \
+            or media_type.split('/', 1)[0] + '/*' in content_types
+
+
+def variant_etag(etag, suffix):
+    """Derive a weak ETag for a variant of the entity with the given ETag.
+
+    Example:
+
+    >>> variant_etag('"abc"', 'gzip')
+    'W/"abc-gzip"'
+    >>> variant_etag('W/"abc"', 'gzip')
+    'W/"abc-gzip"'
+
+    """
+    m = etag_re.match(etag)
+    if not m:
+        return etag
+    return 'W/%s-%s"' % (m.group(2)[:-1], suffix)
+
+
+class Compression(object):
+    """A wrapper that compresses response bodies.
+
+    Parameters:
+
+    encodings
+      : The content-codings to support, in order of preference. Supported
+        values are 'gzip' and 'deflate'.
+
+    content_types
+      : A list of media types that should be compressed. Entries ending in
+        '/*' match all subtypes.
+
+    min_size
+      : String bodies smaller than this (in bytes) are sent uncompressed.
+        Iterator bodies are always compressed.
+
+    level
+      : The zlib compression level (1-9).
+    """
+
+    def __init__(self, encodings=('gzip', 'deflate'),
+                 content_types=DEFAULT_CONTENT_TYPES, min_size=1024, level=6):
+        for encoding in encodings:
+            if encoding not in _wbits:
+                raise ValueError("Unsupported encoding: '%s'" % encoding)
+        self.encodings = tuple(encodings)
+        self.content_types = frozenset(content_types)
+        self.min_size = min_size
+        self.level = level
+
+    def __call__(self, app):
+        def wrap(request, ctx):
+            response = app(request, ctx)
+            encoding = self.apply(request, response)
+            if encoding is not None and 'ETag' not in response.headers:
+                # An ETag may still be added later (see `Mapper.auto_etag`).
+                compress = response._body_filters[-1]
+                ctx.add_callback('finalize', lambda req, res:
+                                 compress.vary_etag(response.headers))
+            return response
+        return wrap
+
+    def is_compressible(self, content_type):
+        """Return True if a media type should be compressed."""
+        return is_compressible(content_type, self.content_types)
+
+    def apply(self, request, response):
+        """Set up compression for a response, if possible.
+
+        Returns the content-coding that will be used, or None.
+        """
+        code = response.code
+        if code != 304 and (not 200 <= code < 300 or code in (204, 206)):
+            return
+        headers = response.headers
+        if 'Content-Encoding' in headers:
+            return
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return
+        if any(name in headers for name in _offload_headers):
+            return
+        content_type = headers.get('Content-Type') \
+                or response.default_content_type
+        if not self.is_compressible(content_type):
+            return
+
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower() and vary != '*':
+            headers['Vary'] = vary + ', Accept-Encoding'
+        if code == 304:
+            # E.g. from a Resource's validator providers. It validates the
+            # representation the client has, so its ETag is left alone.
+            return
+
+        encoding = negotiate_encoding(
+                request.headers.get('Accept-Encoding', ''), self.encodings)
+        if encoding is None:
+            return
+        raw_body = response._raw_body
+        if response._body_writer is None and isinstance(raw_body, basestring) \
+                and len(raw_body) < self.min_size:
+            return
+
+        compress = _CompressFilter(self, encoding)
+        compress.vary_etag(headers)
+        response._body_filters += (compress,)
+        if request.method == 'HEAD':
+            # The filter doesn't run for HEAD requests.
+            headers['Content-Encoding'] = encoding
+            del headers['Content-Length']
+        return encoding
+
+
+class _CompressFilter(object):
+    """Body filter that compresses a response body.
+
+    The ETag is replaced with the variant ETag up front, so that conditional
+    requests (which are handled before the body is evaluated) match it. If
+    the body turns out to be too small to compress, the original ETag is
+    restored.
+    """
+    __slots__ = ('compression', 'encoding', 'etag')
+
+    def __init__(self, compression, encoding):
+        self.compression = compression
+        self.encoding = encoding
+        self.etag = None
+
+    def vary_etag(self, headers):
+        etag = headers.get('ETag')
+        if etag:
+            self.etag = etag
+            headers['ETag'] = variant_etag(etag, self.encoding)
+
+    def __call__(self, body, headers):
+        compression = self.compression
+        if type(body) is str and len(body) < compression.min_size:
+            if self.etag is not None and headers.get('ETag') \
+                    == variant_etag(self.etag, self.encoding):
+                headers['ETag'] = self.etag
+            return body
+        compressor = zlib.compressobj(
+                compression.level, zlib.DEFLATED, _wbits[self.encoding])
+        headers['Content-Encoding'] = self.encoding
+        del headers['Content-Length']
+        if type(body) is str:
+            return compressor.compress(body) + compressor.flush()
+        return _compress_iter(body, compressor)
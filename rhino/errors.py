@@ -1,11 +1,16 @@
 from __future__ import absolute_import
 
+import json
+import threading
 from cgi import escape
 
 from .http import status_codes
 from .response import Response
+from .util import LRUCache
+from .vendor import mimeparse
 
 __all__ = [
+    'ErrorResponses',
     'HTTPException',
     'Redirection',
     'ClientError',
@@ -21,6 +26,7 @@ __all__ = [
     'MethodNotAllowed',
     'NotAcceptable',
     'Gone',
+    'PreconditionFailed',
     'UnsupportedMediaType',
     'InternalServerError',
 ]
@@ -48,6 +54,37 @@ html_template = '''<!DOCTYPE html>
 </html>
 '''
 
+# Rendered error pages by (code, message, details).
+_html_cache = LRUCache(256)
+_html_cache_lock = threading.Lock()
+
+
+def render_html(code, message, details=None):
+    """Return the default HTML error page for a status code and message."""
+    key = (code, message, details)
+    with _html_cache_lock:
+        body = _html_cache.get(key)
+    if body is None:
+        body = html_template % {
+            'code': code,
+            'status': status_codes.get(code, "Unknown"),
+            'message': escape(message),
+            'details': details or '',
+        }
+        with _html_cache_lock:
+            _html_cache[key] = body
+    return body
+
+
+def render_json(code, message, details=None):
+    """Return a JSON error document for a status code and message."""
+    return json.dumps({
+        'code': code,
+        'status': status_codes.get(code, "Unknown"),
+        'message': message,
+    })
+
+
 class HTTPException(Exception):
     """Base class for HTTP Exceptions
 
@@ -62,7 +99,11 @@ class HTTPException(Exception):
     Instance properties:
 
     response
-      : The `rhino.Response` object that will be sent to the client.
+      : The `rhino.Response` object that will be sent to the client. It is
+        created on first access.
+
+    headers
+      : A list of additional response headers as (name, value) tuples.
 
     The constructor takes one argument, an optional message that will replace
     the default message. Subclasses can override the constructor to require
@@ -72,20 +113,34 @@ class HTTPException(Exception):
     message = None
     details = None  # TODO for displaying structured error data in debug mode
 
+    # Defaults for subclasses whose constructor doesn't call this one.
+    _message = None
+    _response = None
+    headers = ()
+
     def __init__(self, message=None):
-        if message is None:
-            message = self.message
-        if message is not None:
-            body = html_template % {
-                'code': self.code,
-                'status': status_codes.get(self.code, "Unknown"),
-                'message': escape(message),
-                'details': self.details or '',
-            }
-            headers = [('Content-Type', 'text/html')]
-        else:
-            body, headers = '', []
-        self.response = Response(self.code, body=body, headers=headers)
+        self._message = message
+        self._response = None
+        self.headers = []
+
+    @property
+    def response(self):
+        if self._response is None:
+            message = self._message
+            if message is None:
+                message = self.message
+            if message is not None:
+                body = render_html(self.code, message, self.details)
+                headers = [('Content-Type', 'text/html')]
+            else:
+                body, headers = '', []
+            self._response = Response(
+                    self.code, body=body, headers=headers + list(self.headers))
+        return self._response
+
+    @response.setter
+    def response(self, value):
+        self._response = value
 
 
 class Redirection(HTTPException):
@@ -113,7 +168,7 @@ class MovedPermanently(Redirection):
 
     def __init__(self, location):
         super(MovedPermanently, self).__init__()
-        self.response.headers['Location'] = location
+        self.headers.append(('Location', location))
 
 
 class Found(Redirection):
@@ -128,7 +183,7 @@ class Found(Redirection):
 
     def __init__(self, location):
         super(Found, self).__init__()
-        self.response.headers['Location'] = location
+        self.headers.append(('Location', location))
 
 
 class SeeOther(Redirection):
@@ -143,7 +198,7 @@ class SeeOther(Redirection):
 
     def __init__(self, location):
         super(SeeOther, self).__init__()
-        self.response.headers['Location'] = location
+        self.headers.append(('Location', location))
 
 
 class TemporaryRedirect(Redirection):
@@ -158,7 +213,7 @@ class TemporaryRedirect(Redirection):
 
     def __init__(self, location):
         super(TemporaryRedirect, self).__init__()
-        self.response.headers['Location'] = location
+        self.headers.append(('Location', location))
 
 
 class BadRequest(ClientError):
@@ -185,7 +240,7 @@ class Unauthorized(ClientError):
         param_str = ', '.join(['%s="%s"' % (k, v)
                                for k, v in sorted(params.items())])
         www_authenticate = "%s %s" % (scheme, param_str)
-        self.response.headers['WWW-Authenticate'] = www_authenticate
+        self.headers.append(('WWW-Authenticate', www_authenticate))
 
 
 class Forbidden(ClientError):
@@ -214,7 +269,8 @@ class MethodNotAllowed(ClientError):
 
     def __init__(self, allow):
         super(MethodNotAllowed, self).__init__()
-        self.response.headers['Allow'] = allow
+        self.allow = allow
+        self.headers.append(('Allow', allow))
 
 
 class NotAcceptable(ClientError):
@@ -233,6 +289,12 @@ class Gone(ClientError):
         Pilgrim
     """
 
+class PreconditionFailed(ClientError):
+    """412 Precondition Failed."""
+    code = 412
+    message = 'A precondition given in the request headers was not met.'
+
+
 class UnsupportedMediaType(ClientError):
     """415 Unsupported Media Type."""
     code = 415
@@ -243,3 +305,82 @@ class InternalServerError(ServerError):
     """500 Internal Server Error."""
     code = 500
     message = 'The server encountered an error while processing the request.'
+
+
+class ErrorResponses(object):
+    """Precomputed error responses for `HTTPException`s.
+
+    Install an instance on a Mapper using its `error_responses` attribute:
+
+        app = Mapper()
+        app.error_responses = ErrorResponses()
+
+    The media type of the error page is negotiated using the request's
+    Accept header, and defaults to the first entry in `media_types`.
+    Supported media types are 'text/html' and 'application/json', and any
+    media type with a body registered using `register`.
+
+    The response body is rendered once per exception class and media type,
+    as long as the exception has its default message. Every request gets a
+    new Response object, so responses can be modified freely. Exceptions
+    with a message or a response that has already been created (and
+    possibly modified), and exceptions without a message (like
+    redirections), use the exception's own `response`.
+    """
+    renderers = {
+        'text/html': render_html,
+        'application/json': render_json,
+    }
+
+    def __init__(self, media_types=('text/html', 'application/json')):
+        self.media_types = tuple(media_types)
+        self._registry = {}
+        self._rendered = {}  # (exception class, media type) -> (headers, body)
+        self._lock = threading.Lock()
+
+    def register(self, exc_class, media_type, body):
+        """Use a fixed body for an exception class and its subclasses.
+
+        Adds `media_type` to the negotiable media types if necessary.
+        """
+        with self._lock:
+            self._registry[exc_class, media_type] = body
+            self._rendered.clear()
+            if media_type not in self.media_types:
+                self.media_types += (media_type,)
+
+    def response_for(self, request, exc):
+        """Return the response for an exception raised during a request."""
+        cls = type(exc)
+        if exc._response is not None or exc._message is not None \
+                or cls.message is None:
+            return exc.response
+        accept = request.headers.get('Accept')
+        media_type = self.media_types[0]
+        if accept and len(self.media_types) > 1:
+            media_type = mimeparse.best_match(
+                    reversed(self.media_types), accept) or media_type
+        key = (cls, media_type)
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            rendered = self._render(cls, media_type)
+            with self._lock:
+                self._rendered[key] = rendered
+        headers, body = rendered
+        return Response(cls.code, headers=headers + list(exc.headers),
+                        body=body)
+
+    def _render(self, cls, media_type):
+        for klass in cls.__mro__:
+            body = self._registry.get((klass, media_type))
+            if body is not None:
+                break
+        else:
+            if media_type not in self.renderers:
+                media_type = 'text/html'
+            body = self.renderers[media_type](
+                    cls.code, cls.message, cls.details)
+        headers = [('Content-Type', media_type)]
+        if len(self.media_types) > 1:
+            headers.append(('Vary', 'Accept'))
+        return headers, body
@@ -3,6 +3,9 @@ from __future__ import absolute_import
 import httplib
 import re
 import time
+import zlib
+from Cookie import CookieError, Morsel, _quote, _unquote, _getdate, \
+        _LegalChars
 from calendar import timegm
 from collections import namedtuple
 from datetime import datetime, timedelta
@@ -24,6 +27,9 @@ _etag_header = r'^(?:(%s)|(?:%s(?:\s*,\s*|$))+)$' % (_etag_star, _etag)
 etag_re = re.compile(_etag)
 etag_header_re = re.compile(_etag_header)
 quoted_string_re = re.compile(_quoted_string)
+cache_directive_re = re.compile(
+        r'([^\s,=]+)\s*(?:=\s*(?:([^\s,"]+)|"([^"]*)"))?')
+cookie_name_re = re.compile(r'^[%s]*$' % re.escape(_LegalChars))
 
 status_codes = httplib.responses.copy()
 
@@ -79,6 +85,18 @@ def match_etag(etag, header, weak=False):
         return etag in [t[1] for t in parsed_header if not t[0]]
 
 
+def crc32_etag(data):
+    """Compute an entity tag (without quotes) for a string of bytes.
+
+    Uses the length and CRC-32 checksum of the data, which is fast but not
+    collision resistant.
+
+    >>> crc32_etag('hello')
+    '5-3610a686'
+    """
+    return '%x-%08x' % (len(data), zlib.crc32(data) & 0xffffffff)
+
+
 def datetime_to_timestamp(dt):
     """Convert datetime.datetime to Unix timestamp."""
     return timegm(dt.utctimetuple())
@@ -154,3 +172,224 @@ def cache_control(max_age=None, private=False, public=False, s_maxage=None,
     if must_revalidate: directives.append('must-revalidate')
     if proxy_revalidate: directives.append('proxy-revalidate')
     return ', '.join(directives)
+
+
+def parse_cache_control(header):
+    """Parse a Cache-Control header into a dict.
+
+    Directive names are lowercased. Directives without an argument map to
+    True.
+
+    Example:
+
+    >>> sorted(parse_cache_control('public, Max-Age=60, x="a, b"').items())
+    [('max-age', '60'), ('public', True), ('x', 'a, b')]
+
+    """
+    directives = {}
+    for m in cache_directive_re.finditer(header or ''):
+        name, token, quoted = m.groups()
+        if token is not None:
+            value = token
+        elif quoted is not None:
+            value = quoted
+        else:
+            value = True
+        directives[name.lower()] = value
+    return directives
+
+
+def parse_cookie_header(header):
+    """Parse a Cookie header into a dict mapping names to raw values.
+
+    Follows the RFC 6265 syntax (name=value pairs separated by ';'). Values
+    are returned as they appear in the header, without unquoting (see
+    `unquote_cookie_value`). If a name occurs more than once, the first value
+    wins. Pairs without a '=' and names starting with '$' are ignored.
+
+    Example:
+
+    >>> sorted(parse_cookie_header('a=1; b="x y"; a=2; $Version=1').items())
+    [('a', '1'), ('b', '"x y"')]
+
+    """
+    cookies = {}
+    for pair in header.split(';'):
+        name, sep, value = pair.partition('=')
+        if not sep:
+            continue
+        name = name.strip()
+        if name and name[0] != '$' and name not in cookies:
+            cookies[name] = value.strip()
+    return cookies
+
+
+def unquote_cookie_value(value):
+    """Unquote a cookie value, compatible with the stdlib's `SimpleCookie`.
+
+    Example:
+
+    >>> unquote_cookie_value('"\\342\\230\\203"').decode('utf-8')
+    u'\\u2603'
+    >>> unquote_cookie_value('plain')
+    'plain'
+
+    """
+    if value[:1] == '"':
+        return _unquote(value)
+    return value
+
+
+def format_cookie(key, value, max_age=None, expires=None, path=None,
+        domain=None, secure=False, httponly=False):
+    """Generate the value for a Set-Cookie header.
+
+    All arguments must be byte strings, except for `max_age` and `expires`,
+    which are given as an integer number of seconds (`expires` is relative
+    to the current time). The output is identical to that of the stdlib's
+    `SimpleCookie`, but doesn't create intermediate cookie objects.
+
+    Example:
+
+    >>> format_cookie('foo', 'bar baz', max_age=60, path='/', httponly=True)
+    'foo="bar baz"; httponly; Max-Age=60; Path=/'
+
+    """
+    if key.lower() in Morsel._reserved:
+        raise CookieError("Attempt to set a reserved key: %s" % key)
+    if not cookie_name_re.match(key):
+        raise CookieError("Illegal key value: %s" % key)
+    # Attributes in the same (alphabetical) order as SimpleCookie
+    parts = [key + '=' + _quote(value)]
+    if domain: parts.append('Domain=' + domain)
+    if expires is not None: parts.append('expires=' + _getdate(expires))
+    if httponly: parts.append('httponly')
+    if max_age is not None: parts.append('Max-Age=%d' % max_age)
+    if path: parts.append('Path=' + path)
+    if secure: parts.append('secure')
+    return '; '.join(parts)
+
+
+def parse_accept_encoding(header):
+    """Parse an Accept-Encoding header.
+
+    Returns a dict mapping lowercased content-codings (including '*') to
+    their quality values as floats. Invalid quality values count as 0.
+
+    Example:
+
+    >>> sorted(parse_accept_encoding('gzip, deflate;q=0.5, *;q=0').items())
+    [('*', 0.0), ('deflate', 0.5), ('gzip', 1.0)]
+
+    """
+    codings = {}
+    for item in header.split(','):
+        parts = item.split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate_encoding(header, available):
+    """Choose a content-coding given an Accept-Encoding header.
+
+    `available` is a sequence of content-codings in order of preference.
+    Returns the acceptable coding with the highest quality value (earlier
+    codings win ties), or None if none of them is acceptable.
+
+    Example:
+
+    >>> negotiate_encoding('deflate, gzip', ['gzip', 'deflate'])
+    'gzip'
+    >>> negotiate_encoding('gzip;q=0.5, deflate', ['gzip', 'deflate'])
+    'deflate'
+    >>> negotiate_encoding('*;q=0, identity', ['gzip'])
+
+    """
+    codings = parse_accept_encoding(header)
+    default_q = codings.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = codings.get(coding, default_q)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def parse_range_header(header, size):
+    """Parse a Range header for an entity of `size` bytes.
+
+    Returns a list of (first, last) byte positions (inclusive) of the
+    satisfiable ranges, in the order they were requested. Returns an empty
+    list if none of the ranges is satisfiable, and None if the header is
+    invalid or uses a unit other than 'bytes' (it should then be ignored).
+
+    Example:
+
+    >>> parse_range_header('bytes=0-9, 5-, -3', 100)
+    [(0, 9), (5, 99), (97, 99)]
+    >>> parse_range_header('bytes=200-', 100)
+    []
+    >>> parse_range_header('items=0-1', 100)
+
+    """
+    unit, _, ranges_spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    specs = [spec.strip() for spec in ranges_spec.split(',') if spec.strip()]
+    if not specs:
+        return None
+    for spec in specs:
+        first, sep, last = spec.partition('-')
+        first, last = first.strip(), last.strip()
+        if not sep or not (first.isdigit() or last.isdigit()) \
+                or (first and not first.isdigit()) \
+                or (last and not last.isdigit()):
+            return None
+        if not first:  # suffix range
+            length = int(last)
+            if length > 0 and size > 0:
+                ranges.append((max(size - length, 0), size - 1))
+        else:
+            first = int(first)
+            last = int(last) if last else None
+            if last is not None and last < first:
+                return None
+            if first < size:
+                if last is None or last >= size:
+                    last = size - 1
+                ranges.append((first, last))
+    return ranges
+
+
+def coalesce_ranges(ranges):
+    """Merge overlapping and adjacent byte ranges.
+
+    Takes a list of (first, last) byte positions (inclusive), as returned
+    by `parse_range_header`, and returns a sorted list of disjoint ranges.
+
+    Example:
+
+    >>> coalesce_ranges([(50, 99), (0, 9), (5, 19), (20, 29), (0, 0)])
+    [(0, 29), (50, 99)]
+
+    """
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
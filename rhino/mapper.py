@@ -73,8 +73,9 @@ import re
 import urllib
 
 from .errors import HTTPException, InternalServerError, NotFound
+from .http import crc32_etag
 from .request import Request
-from .response import Response
+from .response import Response, per_request
 from .resource import Resource
 from .util import apply_ctx, get_args, log_exception
 
@@ -322,16 +323,21 @@ def template2path(template, params, ranges=None):
 
 _callback_phases = ('enter', 'leave', 'finalize', 'teardown', 'close')
 
-def _callback_dict():
-    return dict((k, []) for k in _callback_phases)
+# Shared by all contexts that have no callbacks. Never modified.
+_no_callbacks = {}
 
 
 class Context(object):
-    def __init__(self, request=None):
-        self.config = {}
+    # '__dict__' is only allocated when a context property value is cached
+    # or an attribute is set by user code.
+    __slots__ = ('config', 'request', '_Context__properties',
+                 '_Context__callbacks', '__dict__')
+
+    def __init__(self, request=None, config=None):
+        self.config = {} if config is None else config
         self.request = request
-        self.__properties = {}
-        self.__callbacks = _callback_dict()
+        self.__properties = None
+        self.__callbacks = _no_callbacks
 
     def add_callback(self, phase, fn):
         """Adds a callback to the context.
@@ -384,15 +390,16 @@ class Context(object):
         spec. If that happens, all 'close' callbacks are called regardless
         of exceptions, like 'teardown' callbacks.
         """
-        try:
-            self.__callbacks[phase].append(fn)
-        except KeyError:
+        if phase not in _callback_phases:
             raise KeyError("Invalid callback phase '%s'. Must be one of %s" % (phase, _callback_phases))
+        if self.__callbacks is _no_callbacks:
+            self.__callbacks = {}
+        self.__callbacks.setdefault(phase, []).append(fn)
 
     def _run_callbacks(self, phase, args=None, log_errors=False):
         if args is None:
             args = tuple()
-        for fn in self.__callbacks[phase]:
+        for fn in self.__callbacks.get(phase, ()):
             try:
                 fn(*args)
             except Exception:
@@ -408,12 +415,14 @@ class Context(object):
         See `Mapper.add_ctx_property`, which uses this method to install
         the properties added on the Mapper level.
         """
-        if name in self.__properties:
+        if self.__properties is None:
+            self.__properties = {}
+        elif name in self.__properties:
             raise KeyError("Trying to add a property '%s' that already exists on this %s object." % (name, self.__class__.__name__))
         self.__properties[name] = (fn, cached)
 
     def __getattr__(self, name):
-        if name not in self.__properties:
+        if self.__properties is None or name not in self.__properties:
             raise AttributeError("'%s' object has no attribute '%s'"
                     % (self.__class__.__name__, name))
         fn, cached = self.__properties[name]
@@ -528,9 +537,31 @@ class Mapper(object):
       : When set, is used to override the `default_content_type` of outgoing
         Responses. See `rhino.Response` for details. Does not affect responses
         returned via exceptions.
+
+    auto_etag (default `False`):
+      : When True, "200 OK" responses to GET requests that have a buffered
+        (str or unicode) body, or a body produced by a serializer, and no
+        ETag, get a strong ETag computed from the body. This happens before
+        'finalize' callbacks and conditional request handling, so requests
+        with a matching If-None-Match header get a "304 Not Modified"
+        response. Lazy (callable), iterator and file bodies are left alone,
+        and for HEAD requests, only bodies that are already strings.
+
+    etag_function (default `rhino.http.crc32_etag`):
+      : The function used to compute automatic ETags. Called with the
+        encoded response body, must return the ETag without quotes.
+
+    error_responses (default `None`):
+      : A `rhino.errors.ErrorResponses` object used to build the responses
+        for HTTP exceptions, e.g. to send precomputed JSON error documents
+        to clients that prefer them. By default, the exception's own
+        `response` is used.
     """
     default_encoding = None
     default_content_type = None
+    auto_etag = False
+    etag_function = staticmethod(crc32_etag)
+    error_responses = None
 
     # TODO 'root' parameter for manually specifying a URL prefix not reflected
     # in SCRIPT_NAME (e.g. when proxying).
@@ -675,23 +706,54 @@ class Mapper(object):
     def wsgi(self, environ, start_response):
         """Implements the mapper's WSGI interface."""
         request = Request(environ)
-        ctx = Context(request)
+        ctx = Context(request, self.config)
         try:
             try:
-                response = self(request, ctx)
+                response = per_request(self(request, ctx))
+                if self.auto_etag:
+                    self._add_etag(request, response)
                 ctx._run_callbacks('finalize', (request, response))
-                response = response.conditional_to(request)
+                conditional_response = response.conditional_to(request)
+                if conditional_response is not response:
+                    response._discard_body()
+                    response = conditional_response
             except HTTPException as e:
-                response = e.response
+                response = self._error_response(request, e)
             except Exception:
                 self.handle_error(request, ctx)
-                response = InternalServerError().response
+                response = self._error_response(
+                        request, InternalServerError())
 
             response.add_callback(lambda: ctx._run_callbacks('close'))
             return response(environ, start_response)
         finally:
             ctx._run_callbacks('teardown', log_errors=True)
 
+    def _add_etag(self, request, response):
+        if response.code != 200 or 'ETag' in response.headers:
+            return
+        method, raw_body = request.method, response._raw_body
+        if method == 'GET':
+            if response._body_writer is None and callable(raw_body):
+                return
+        elif method == 'HEAD':
+            # Don't evaluate or serialize bodies that won't be sent.
+            if response._body_writer is not None \
+                    or not isinstance(raw_body, basestring):
+                return
+        else:
+            return
+        body = response.body
+        if isinstance(body, unicode):
+            body = body.encode(response.default_encoding)
+        if type(body) is str:
+            response.headers['ETag'] = '"%s"' % self.etag_function(body)
+
+    def _error_response(self, request, exc):
+        if self.error_responses is None:
+            return exc.response
+        return self.error_responses.response_for(request, exc)
+
     def handle_error(self, request, ctx):
         """Called when an exception occurs.
 
@@ -716,6 +778,7 @@ class Mapper(object):
             if response is not None:
                 if not isinstance(response, Response):
                     raise TypeError("Not a rhino.Response object: %s." % response)
+                response = per_request(response)
                 if self.default_encoding is not None:
                     response.default_encoding = self.default_encoding
                 if self.default_content_type is not None:
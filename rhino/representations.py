@@ -0,0 +1,254 @@
+"""
+Built-in representations for use with the `consumes` and `produces`
+arguments of the handler decorators.
+
+A representation is an object with the attributes `accepts` and/or
+`provides` (mime-types), and the functions `serialize` and/or `deserialize`:
+
+    from rhino import Resource
+    from rhino.representations import json_repr
+
+    data = Resource()
+
+    @data.put(consumes=json_repr, produces=json_repr)
+    def update(request):
+        obj = request.body  # parsed JSON
+        # ...
+        return obj
+
+For bulk uploads that consist of a large top-level JSON array, the
+`json_items_repr` representation parses the request body incrementally and
+returns an iterator over the array items instead of the complete array:
+
+    @data.post(consumes=json_items_repr)
+    def bulk_import(request):
+        for item in request.body:
+            # ...
+
+Only a bounded amount of the raw body is held in memory at any time, plus
+the item currently being processed.
+
+Newline-delimited JSON (`application/x-ndjson`) uploads can be processed in
+batches while the upload is still arriving, using `ingest_ndjson`:
+
+    @data.post(accepts='application/x-ndjson')
+    def bulk_insert(request):
+        summary = ingest_ndjson(request.input, db.insert_many, batch_size=500)
+        return ok('%d records, %d errors' % (
+            summary.records, len(summary.errors)))
+"""
+from __future__ import absolute_import
+
+import json
+import re
+from collections import namedtuple
+
+from .errors import BadRequest
+
+__all__ = [
+    'json_repr',
+    'json_items_repr',
+    'iter_json_items',
+    'iter_ndjson_batches',
+    'ingest_ndjson',
+]
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_value_start = frozenset('{["-0123456789tfn')
+_decoder = json.JSONDecoder()
+
+line_error = namedtuple('line_error', 'lineno line message')
+ndjson_summary = namedtuple('ndjson_summary', 'records batches errors')
+
+
+class _JSONStream(object):
+    """A buffer over a file-like object for decoding consecutive JSON values.
+
+    Keeps a read position into the buffer instead of slicing off decoded
+    values, so that decoding many small values from a large buffer doesn't
+    copy the remaining buffer each time.
+    """
+
+    def __init__(self, f, chunk_size, max_value_size=None):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """Read more data into the buffer. Returns False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.f.read(max(size or 0, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at EOF)."""
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def decode(self):
+        """Decode the next JSON value from the stream."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Possibly incomplete, unless it can't start a JSON value.
+                pending = len(self.buf) - self.pos
+                if self.buf[self.pos:self.pos + 1] not in _value_start:
+                    raise
+                if self.max_value_size is not None \
+                        and pending > self.max_value_size:
+                    raise ValueError("JSON value at position %d exceeds %d "
+                                     "bytes" % (self.pos, self.max_value_size))
+                # Grow the read size with the amount of buffered data to
+                # avoid quadratic behaviour for large values.
+                if not self.fill(pending):
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_items(f, chunk_size=65536, max_value_size=16 * 1024 * 1024):
+    """Incrementally parse a JSON array from a file-like object.
+
+    Returns an iterator that yields the items of the top-level array one by
+    one, reading `chunk_size` bytes from `f` at a time. Raises `ValueError`
+    during iteration if the input is not a valid JSON array, or if an item
+    could not be decoded from `max_value_size` bytes of input (if not None).
+    This limits the amount of an invalid body that is read into memory.
+    """
+    stream = _JSONStream(f, chunk_size, max_value_size)
+    if stream.peek() != '[':
+        raise ValueError("Expected '[' at position %d" % stream.pos)
+    stream.pos += 1
+    if stream.peek() == ']':
+        stream.pos += 1
+    else:
+        while True:
+            yield stream.decode()
+            c = stream.peek()
+            if c == ']':
+                stream.pos += 1
+                break
+            elif c != ',':
+                raise ValueError("Expected ',' or ']' at position %d"
+                                 % stream.pos)
+            stream.pos += 1
+    if stream.peek() != '':
+        raise ValueError("Extra data at position %d" % stream.pos)
+
+
+def iter_ndjson_batches(f, batch_size=1000, max_bytes=None, on_error=None):
+    """Parse newline-delimited JSON from a file-like object in batches.
+
+    Returns an iterator that yields lists of decoded records. A batch is
+    complete when it holds `batch_size` records, or when adding the next line
+    would exceed `max_bytes` bytes of raw input (if not None). Input is read
+    line by line, so batches are yielded as soon as enough lines have arrived.
+
+    Blank lines are skipped. When a line can't be decoded, `on_error` is
+    called with a `line_error` tuple (lineno, line, message) and parsing
+    continues with the next line. If `on_error` is None, `ValueError` is
+    raised instead.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive: %s" % batch_size)
+    batch, batch_bytes = [], 0
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = _decoder.decode(line)
+        except ValueError as e:
+            if on_error is None:
+                raise ValueError("Line %d: %s" % (lineno, e))
+            on_error(line_error(lineno, line, str(e)))
+            continue
+        if max_bytes is not None and batch \
+                and batch_bytes + len(line) > max_bytes:
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(obj)
+        batch_bytes += len(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+
+def ingest_ndjson(f, handler, batch_size=1000, max_bytes=None):
+    """Feed newline-delimited JSON from a file-like object to `handler`.
+
+    `f` is usually `request.input`. The input is parsed into batches as
+    described for `iter_ndjson_batches`, and `handler` is called with each
+    batch (a list of records) as soon as it is complete. Lines that can't be
+    decoded do not abort processing.
+
+    Returns a `ndjson_summary` tuple (records, batches, errors), where errors
+    is a list of `line_error` tuples (lineno, line, message).
+    """
+    errors = []
+    records = batches = 0
+    for batch in iter_ndjson_batches(
+            f, batch_size, max_bytes, on_error=errors.append):
+        handler(batch)
+        records += len(batch)
+        batches += 1
+    return ndjson_summary(records, batches, errors)
+
+
+class json_repr(object):
+    """JSON representation.
+
+    Deserializing raises `BadRequest` if the request body is not valid JSON.
+    """
+    provides = 'application/json'
+    accepts = 'application/json'
+
+    @staticmethod
+    def serialize(obj):
+        return json.dumps(obj)
+
+    @staticmethod
+    def deserialize(f):
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise BadRequest("Invalid JSON: %s" % e)
+
+
+class json_items_repr(json_repr):
+    """JSON representation that parses a top-level array lazily.
+
+    Deserializing returns an iterator over the items of the array (see
+    `iter_json_items`). Invalid input raises `BadRequest` during iteration.
+    """
+    chunk_size = 65536
+    max_value_size = 16 * 1024 * 1024
+
+    @classmethod
+    def deserialize(cls, f):
+        try:
+            for item in iter_json_items(f, cls.chunk_size,
+                                        cls.max_value_size):
+                yield item
+        except ValueError as e:
+            raise BadRequest("Invalid JSON: %s" % e)
@@ -4,16 +4,17 @@ import cgi
 import collections
 import urllib
 import urlparse
-from Cookie import SimpleCookie
 from StringIO import StringIO
 from wsgiref.util import request_uri, application_uri
 
+from .http import parse_cookie_header, unquote_cookie_value
 from .urls import request_context, build_url
 
 __all__ = [
     'Request',
     'RequestHeaders',
     'QueryDict',
+    'RequestCookies',
     'WsgiInput',
 ]
 
@@ -141,6 +142,50 @@ class QueryDict(collections.Mapping):
         return ((k, v)  for k, v in self._items)
 
 
+class RequestCookies(collections.Mapping):
+    """A dictionary-like object to access request cookies.
+
+    The Cookie header is only split into name/value pairs on first access,
+    and each value is unquoted and decoded only when it is looked up, so
+    looking up a single cookie doesn't pay for decoding all the others.
+    """
+
+    def __init__(self, header, encoding='utf-8'):
+        self.header = header or ''
+        self.encoding = encoding
+        self._raw = None
+        self._decoded = {}
+
+    def _items(self):
+        if self._raw is None:
+            self._raw = parse_cookie_header(self.header)
+        return self._raw
+
+    def __getitem__(self, key):
+        try:
+            return self._decoded[key]
+        except KeyError:
+            if isinstance(key, unicode):
+                raw_key = key.encode(self.encoding)
+            else:
+                raw_key = key
+            value = unquote_cookie_value(self._items()[raw_key]) \
+                    .decode(self.encoding)
+            self._decoded[key] = value
+            return value
+
+    def __contains__(self, key):
+        if isinstance(key, unicode):
+            key = key.encode(self.encoding)
+        return key in self._items()
+
+    def __iter__(self):
+        return (k.decode(self.encoding) for k in self._items())
+
+    def __len__(self):
+        return len(self._items())
+
+
 # Implementation taken from gevent.pywsgi.Input
 class WsgiInput(object):
     """Represents a WSGI input filehandle that is safe to use read() on.
@@ -194,11 +239,15 @@ class WsgiInput(object):
 
 class Request(object):
     """Represents an HTTP request built from a WSGI environment."""
+    # '__dict__' is only allocated when user code sets extra attributes.
+    __slots__ = ('environ', '_headers', '_url', '_input', '_body', '_form',
+                 '_query', '_cookies', '_context', '_application_uri',
+                 '_body_reader', '__dict__')
 
     def __init__(self, environ):
         environ.setdefault('wsgiorg.routing_args', ([], {}))
         self.environ = environ
-        self.headers = RequestHeaders(environ)
+        self._headers = None
         self._url = None
         self._input = None
         self._body = None
@@ -267,6 +316,13 @@ class Request(object):
         else:
             return urlparse.urljoin(self.application_uri, url)
 
+    @property
+    def headers(self):
+        """A `RequestHeaders` object."""
+        if self._headers is None:
+            self._headers = RequestHeaders(self.environ)
+        return self._headers
+
     @property
     def method(self):
         """The HTTP request method (verb)."""
@@ -419,11 +475,7 @@ class Request(object):
 
     @property
     def cookies(self):
-        """Returns a dictionary mapping cookie names to their values."""
+        """A `RequestCookies` object mapping cookie names to their values."""
         if self._cookies is None:
-            c = SimpleCookie(self.environ.get('HTTP_COOKIE'))
-            self._cookies = dict([
-                (k.decode('utf-8'), v.value.decode('utf-8'))
-                for k, v in c.items()
-            ])
+            self._cookies = RequestCookies(self.environ.get('HTTP_COOKIE'))
         return self._cookies
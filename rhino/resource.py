@@ -4,8 +4,9 @@ import types
 from collections import defaultdict, namedtuple
 
 from .errors import NotFound, MethodNotAllowed, UnsupportedMediaType, \
-        NotAcceptable
-from .response import Response
+        NotAcceptable, PreconditionFailed
+from .http import match_etag, parse_etag_header, httpdate_to_timestamp
+from .response import Response, per_request, response as make_validators
 from .util import dual_use_decorator, dual_use_decorator_method, apply_ctx
 from .vendor import mimeparse
 
@@ -20,12 +21,16 @@ class_types = (type, types.ClassType)  # new-style and old-style classes
 VIEW_SEPARATOR = ';'
 MIMEPARSE_NO_MATCH = (-1, 0)
 
+# Methods for which If-Match and If-Unmodified-Since are checked.
+PRECONDITION_METHODS = frozenset(['PUT', 'PATCH', 'DELETE'])
+
 
 class handler_metadata(namedtuple(
-        'handler_metadata', 'verb view accepts provides produces consumes')):
+        'handler_metadata',
+        'verb view accepts provides produces consumes etag last_modified')):
     @classmethod
     def create(cls, verb, view=None, accepts=None, provides=None,
-                consumes=None, produces=None):
+                consumes=None, produces=None, etag=None, last_modified=None):
         if (accepts and consumes):
             raise ValueError("accepts and consumes are mutually exclusive")
         if (provides and produces):
@@ -39,7 +44,8 @@ class handler_metadata(namedtuple(
         if view and VIEW_SEPARATOR in view:
             raise ValueError("View name cannot contain '%s': %s"
                     % (VIEW_SEPARATOR, view))
-        return cls(verb, view, accepts, provides, produces, consumes)
+        return cls(verb, view, accepts, provides, produces, consumes,
+                   etag, last_modified)
 
 
 def _make_handler_decorator(*args, **kw):
@@ -92,7 +98,7 @@ def make_response(obj):
     if obj is None:
         raise TypeError("Handler return value cannot be None.")
     if isinstance(obj, Response):
-        return obj
+        return per_request(obj)
     return Response(200, body=obj)
 
 
@@ -151,6 +157,34 @@ def resolve_handler(request, view_handlers):
     return handlers[0], vary
 
 
+def preconditions_met(request, etag=None, last_modified=None):
+    """Check the If-Match and If-Unmodified-Since headers of a request.
+
+    `etag` and `last_modified` are the current values of the resource's
+    ETag and Last-Modified headers, or None. Returns False if the request
+    should fail with "412 Precondition Failed".
+
+    'If-Match: *' succeeds when the resource exists, i.e. when it has an
+    ETag or a Last-Modified date. Otherwise, If-Match uses the strong
+    comparison function and fails when the resource has no ETag.
+    If-Unmodified-Since is only evaluated when there is no If-Match header,
+    and invalid dates are ignored.
+    """
+    if_match = request.headers.get('If-Match')
+    if if_match:
+        if parse_etag_header(if_match) == '*':
+            return etag is not None or last_modified is not None
+        return etag is not None and match_etag(etag, if_match, weak=False)
+    if_unmodified_since = request.headers.get('If-Unmodified-Since')
+    if if_unmodified_since and last_modified is not None:
+        try:
+            return httpdate_to_timestamp(last_modified) \
+                    <= httpdate_to_timestamp(if_unmodified_since)
+        except Exception:
+            pass  # Ignore invalid dates
+    return True
+
+
 def negotiate_content_type(content_type, handlers):
     """Filter handlers that accept a given content-type.
 
@@ -244,10 +278,38 @@ class Resource(object):
     When used as a standalone object, functions can be registered as handlers
     using the object's methods, as shown above. The `from_url` method can be
     used in the same way to register a filter for URL parameters.
+
+    Validator providers:
+
+    The `etag` and `last_modified` arguments (of the constructor, or of the
+    handler decorators, which take precedence) are functions that cheaply
+    compute the current ETag or last modification time (datetime or
+    timestamp) of the resource, e.g. from a version column:
+
+        @get(etag=lambda request, id: db.get_version(id))
+        def show(request, id):
+            # ...
+
+    Providers are called with the request and the URL parameters, before
+    any `from_url` filter, and may return None. For GET and HEAD requests,
+    they are evaluated before the handler: when the request's conditional
+    headers match, a "304 Not Modified" response is returned without
+    calling the handler. Otherwise the validators are added to the
+    handler's response, unless it already has them. Note that wrappers
+    like `rhino.compression.Compression` that derive a variant ETag from
+    the response's ETag only see the early 304 response; conditional
+    requests with a variant ETag are answered after the handler has run.
+
+    For PUT, PATCH and DELETE requests with an If-Match or
+    If-Unmodified-Since header, the providers are evaluated before the
+    handler as well, and `PreconditionFailed` (412) is raised if the
+    precondition is not met (see `preconditions_met`).
     """
 
-    def __init__(self, wrapped=None):
+    def __init__(self, wrapped=None, etag=None, last_modified=None):
         self._wrapped = wrapped
+        self._etag = etag
+        self._last_modified = last_modified
         self._handlers = defaultdict(lambda: defaultdict(list))
         self._handler_lookup = {}
         self._from_url = None
@@ -271,15 +333,13 @@ class Resource(object):
             handler, vary = resolve_handler(request, self._handlers)
         except MethodNotAllowed as e:
             # Handle 'OPTIONS' requests by default
-            allow = e.response.headers.get('Allow', '')
-            allowed_methods = set([s.strip() for s in allow.split(',')])
+            allowed_methods = set([s.strip() for s in e.allow.split(',')])
             allowed_methods.add('OPTIONS')
             allow = ', '.join(sorted(allowed_methods))
             if request.method == 'OPTIONS':
                 return Response(200, headers=[('Allow', allow)])
             else:
-                e.response.headers['Allow'] = allow
-                raise
+                raise MethodNotAllowed(allow)
 
         if handler.consumes:
             reader = handler.consumes.deserialize
@@ -287,6 +347,23 @@ class Resource(object):
 
         ctx._run_callbacks('enter', (request,))
 
+        validators = None
+        if request.method in ('GET', 'HEAD'):
+            validators = self._get_validators(request, ctx, handler)
+            if validators is not None:
+                response = validators.conditional_to(request)
+                if response is not validators:
+                    ctx._run_callbacks('leave', (request, response))
+                    return self._add_vary(response, vary)
+        elif request.method in PRECONDITION_METHODS and (
+                'If-Match' in request.headers
+                or 'If-Unmodified-Since' in request.headers):
+            validators = self._get_validators(request, ctx, handler)
+            if validators is not None and not preconditions_met(
+                    request, validators.headers.get('ETag'),
+                    validators.headers.get('Last-Modified')):
+                raise PreconditionFailed
+
         url_args_filter = self._from_url or getattr(resource, 'from_url', None)
         kw = request.routing_args
         if url_args_filter:
@@ -308,6 +385,33 @@ class Resource(object):
         if handler.provides:
             response.headers.setdefault('Content-Type', handler.provides)
 
+        if validators is not None and response.code == 200 \
+                and request.method in ('GET', 'HEAD'):
+            for name, value in validators.headers.items():
+                response.headers.setdefault(name, value)
+
+        return self._add_vary(response, vary)
+
+    def _get_validators(self, request, ctx, handler):
+        """Call the validator providers for a handler.
+
+        Returns a Response object holding the validator headers, or None if
+        there are no providers.
+        """
+        etag_fn = handler.etag or self._etag
+        last_modified_fn = handler.last_modified or self._last_modified
+        if etag_fn is None and last_modified_fn is None:
+            return None
+        kw = request.routing_args
+        etag = apply_ctx(etag_fn, ctx)(request, **kw) \
+                if etag_fn is not None else None
+        last_modified = apply_ctx(last_modified_fn, ctx)(request, **kw) \
+                if last_modified_fn is not None else None
+        if etag is not None and not isinstance(etag, basestring):
+            etag = str(etag)
+        return make_validators(200, etag=etag, last_modified=last_modified)
+
+    def _add_vary(self, response, vary):
         if vary:
             vary_header = response.headers.get('Vary', '')
             vary_items = set(filter(
@@ -1,20 +1,24 @@
 from __future__ import absolute_import
 
+import binascii
 import collections
+import os
 import urllib
 import urlparse
 import time
-import wsgiref.headers
-from Cookie import SimpleCookie
 from datetime import datetime, timedelta
+from wsgiref.headers import _formatparam
 from wsgiref.util import application_uri
 
 from .util import log_exception
 from .http import httpdate_to_timestamp, datetime_to_httpdate, \
-        timedelta_to_httpdate, total_seconds, match_etag, status_codes
+        timedelta_to_httpdate, total_seconds, match_etag, status_codes, \
+        format_cookie, parse_range_header, coalesce_ranges, crc32_etag
 
 __all__ = [
     'Response',
+    'FrozenResponse',
+    'FLUSH',
     'Entity',
     'response',
     'ok',
@@ -51,9 +55,184 @@ class Entity(object):
         self.headers = response(200, **kw).headers
 
 
-# Support 'add' as an alias for 'add_header'
-class ResponseHeaders(wsgiref.headers.Headers):
-    add = wsgiref.headers.Headers.add_header
+# Status lines by status code, filled on demand.
+_status_lines = {}
+
+
+def status_line(code):
+    """Return the status line (e.g. '200 OK') for an integer status code."""
+    try:
+        return _status_lines[code]
+    except KeyError:
+        line = "%s %s" % (code, status_codes.get(code, "Unknown"))
+        if 100 <= code < 1000:
+            _status_lines[code] = line
+        return line
+
+
+class ResponseHeaders(object):
+    """Manages a list of response headers.
+
+    Has the same interface as `wsgiref.headers.Headers`, and additionally
+    supports `add` as an alias for `add_header`. Header names are
+    case-insensitive. The headers are kept in the order they were added,
+    and each name can appear multiple times.
+
+    An index from lowercased names to values makes lookups (`in`, `get`,
+    `get_all`, `setdefault`) independent of the number of headers.
+    """
+    __slots__ = ('_headers', '_index')
+
+    def __init__(self, headers=None):
+        self._headers = []
+        self._index = {}
+        if headers:
+            for name, value in headers:
+                self.add_header(name, value)
+
+    def __len__(self):
+        """Return the total number of headers, including duplicates."""
+        return len(self._headers)
+
+    def __setitem__(self, name, value):
+        """Set the value of a header, replacing all existing values."""
+        del self[name]
+        self._headers.append((name, value))
+        self._index[name.lower()] = [value]
+
+    def __delitem__(self, name):
+        """Delete all occurrences of a header, if present."""
+        key = name.lower()
+        if key in self._index:
+            del self._index[key]
+            self._headers[:] = [kv for kv in self._headers
+                                if kv[0].lower() != key]
+
+    def __getitem__(self, name):
+        """Get the first header value for 'name', or None."""
+        return self.get(name)
+
+    def __contains__(self, name):
+        """Return true if the headers contain 'name'."""
+        return self.get(name) is not None
+
+    has_key = __contains__
+
+    def get(self, name, default=None):
+        """Get the first header value for 'name', or return 'default'"""
+        values = self._index.get(name.lower())
+        return values[0] if values else default
+
+    def get_all(self, name):
+        """Return a list of all the values for a header.
+
+        Returns an empty list if the header is missing.
+        """
+        return list(self._index.get(name.lower(), ()))
+
+    def keys(self):
+        """Return a list of all header names, including duplicates."""
+        return [k for k, v in self._headers]
+
+    def values(self):
+        """Return a list of all header values."""
+        return [v for k, v in self._headers]
+
+    def items(self):
+        """Return a list of all headers as (name, value) tuples."""
+        return self._headers[:]
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self._headers)
+
+    def __str__(self):
+        return '\r\n'.join(["%s: %s" % kv for kv in self._headers] + ['', ''])
+
+    def setdefault(self, name, value):
+        """Return the first value for 'name', adding the header if missing."""
+        result = self.get(name)
+        if result is None:
+            self._headers.append((name, value))
+            self._index.setdefault(name.lower(), []).append(value)
+            return value
+        return result
+
+    def add_header(self, _name, _value, **_params):
+        """Add a header, keeping existing headers with the same name.
+
+        Keyword arguments are added as header parameters, with underscores
+        converted to dashes (see `wsgiref.headers.Headers.add_header`).
+        """
+        if _params or _value is None:
+            parts = [] if _value is None else [_value]
+            for k, v in _params.items():
+                if v is None:
+                    parts.append(k.replace('_', '-'))
+                else:
+                    parts.append(_formatparam(k.replace('_', '-'), v))
+            _value = "; ".join(parts)
+        self._headers.append((_name, _value))
+        self._index.setdefault(_name.lower(), []).append(_value)
+
+    add = add_header
+
+    def copy(self):
+        """Return a copy of the headers."""
+        headers = ResponseHeaders()
+        headers._headers = self._headers[:]
+        headers._index = dict((k, v[:]) for k, v in self._index.iteritems())
+        return headers
+
+    def to_wsgi_list(self):
+        """Return the headers as a list for WSGI's `start_response`.
+
+        Unicode names and values are encoded as ASCII and Latin-1,
+        respectively.
+        """
+        return [(k if type(k) is str else k.encode('ascii'),
+                 v if type(v) is str else v.encode('latin-1'))
+                for k, v in self._headers]
+
+
+class _Flush(str):
+    def __repr__(self):
+        return 'FLUSH'
+
+# Yielded by iterator bodies to send all buffered output to the client.
+# Is an empty string, so it doesn't change the output.
+FLUSH = _Flush()
+
+
+def coalesce_chunks(chunks, max_bytes, max_delay=None, clock=time.time):
+    """Combine small chunks of output into larger ones.
+
+    Chunks are buffered until at least `max_bytes` bytes are buffered, or
+    until a chunk arrives more than `max_delay` seconds (if not None) after
+    the first buffered chunk. When `FLUSH` is encountered, the buffered
+    chunks are yielded immediately. The concatenated output is unchanged.
+
+    >>> list(coalesce_chunks(['a', 'b', 'c', FLUSH, 'd', 'ef', 'g'], 2))
+    ['ab', 'c', 'def', 'g']
+    """
+    buf, size, started = [], 0, None
+    for chunk in chunks:
+        if chunk is FLUSH:
+            if buf:
+                yield ''.join(buf)
+                buf, size = [], 0
+            continue
+        if not chunk:
+            continue
+        if not buf and max_delay is not None:
+            started = clock()
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes or (
+                max_delay is not None and clock() - started >= max_delay):
+            yield ''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf)
 
 
 class ResponseBody(object):
@@ -61,30 +240,145 @@ class ResponseBody(object):
 
     Holds the response body and a list of callbacks to be called when the
     response is closed by the WSGI server.
+
+    If `coalesce` is a (max_bytes, max_delay) tuple, small chunks of an
+    iterator body are combined using `coalesce_chunks`.
     """
+    __slots__ = ('body', 'environ', 'callbacks', 'chunks')
 
-    def __init__(self, body, environ, callbacks=None):
+    def __init__(self, body, environ, callbacks=None, coalesce=None):
         if callbacks is None:
-            callbacks = []
+            callbacks = ()
         if not hasattr(body, '__iter__'):
             body = iter([body])
         self.body = body
         self.environ = environ
         self.callbacks = callbacks
+        if coalesce is None:
+            self.chunks = body
+        else:
+            self.chunks = coalesce_chunks(body, *coalesce)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self.chunks)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            for fn in self.callbacks:
+                try:
+                    fn()
+                except Exception:
+                    stream = self.environ.get('wsgi.error')
+                    log_exception(stream)
+
+
+class FileIterator(object):
+    """Iterates over a file-like object in blocks of `block_size` bytes.
+
+    Closes the file when closed.
+    """
+    __slots__ = ('f', 'block_size')
+
+    def __init__(self, f, block_size=65536):
+        self.f = f
+        self.block_size = block_size
 
     def __iter__(self):
         return self
 
     def next(self):
-        return next(self.body)
+        chunk = self.f.read(self.block_size)
+        if not chunk:
+            raise StopIteration
+        return chunk
 
     def close(self):
-        for fn in self.callbacks:
-            try:
-                fn()
-            except Exception:
-                stream = self.environ.get('wsgi.error')
-                log_exception(stream)
+        if hasattr(self.f, 'close'):
+            self.f.close()
+
+
+class _ClosingFile(object):
+    """Proxy for a file-like object passed to `wsgi.file_wrapper`.
+
+    Servers can use the proxied file's fileno() to send the file efficiently
+    (e.g. with sendfile(2)). Closing the proxy closes the file and then runs
+    the response's close callbacks.
+    """
+    __slots__ = ('_f', '_response_body')
+
+    def __init__(self, f, response_body):
+        self._f = f
+        self._response_body = response_body
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def close(self):
+        self._response_body.close()
+
+
+class FileRange(object):
+    """A file-like object representing a byte range of another file.
+
+    The underlying file is positioned using seek() before the first read.
+    Closing the range closes the underlying file.
+    """
+    __slots__ = ('f', 'offset', 'remaining', '_seeked')
+
+    def __init__(self, f, offset, length):
+        self.f = f
+        self.offset = offset
+        self.remaining = length
+        self._seeked = False
+
+    def read(self, size=-1):
+        if not self._seeked:
+            self.f.seek(self.offset)
+            self._seeked = True
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return ''
+        chunk = self.f.read(size)
+        self.remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        if hasattr(self.f, 'close'):
+            self.f.close()
+
+
+def _multipart_byteranges(body, base, ranges, part_headers, boundary,
+                          block_size):
+    try:
+        for (first, last), part_header in zip(ranges, part_headers):
+            yield part_header
+            if type(body) is str:
+                yield body[first:last + 1]
+            else:
+                body.seek(base + first)
+                remaining = last - first + 1
+                while remaining:
+                    chunk = body.read(min(block_size, remaining))
+                    if not chunk:
+                        raise IOError("Unexpected end of file")
+                    remaining -= len(chunk)
+                    yield chunk
+        yield '\r\n--%s--\r\n' % boundary
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def is_file_like(obj):
+    """Returns True if `obj` can be used as a file-like response body."""
+    return hasattr(obj, 'read') and not isinstance(obj, basestring)
 
 
 class Response(object):
@@ -100,9 +394,32 @@ class Response(object):
       : When finalizing the response and the response body is not empty this is
         used as the default value for the Content-Type header, if none is
         provided (default: 'text/plain; charset=utf-8')
+
+    block_size
+      : The block size for reading file-like response bodies (default: 65536)
+
+    coalesce_bytes
+      : When not None, chunks produced by iterator bodies are buffered and
+        sent in blocks of at least this many bytes (default: None). Iterators
+        can yield `FLUSH` to send buffered output immediately.
+
+    coalesce_delay
+      : When `coalesce_bytes` is set, buffered output is also sent when a
+        chunk arrives more than this many seconds after the first buffered
+        chunk (default: None). Output is not sent while the iterator is
+        blocked, so streaming iterators should yield `FLUSH` before waiting
+        for new data.
     """
+    # '__dict__' is only allocated when an instance attribute is set, e.g.
+    # when a Mapper overrides default_encoding or default_content_type.
+    __slots__ = ('_status', '_status_code', '_headers', '_raw_body', '_body',
+                 '_body_writer', '_body_filters', '_callbacks', '__dict__')
+
     default_encoding = 'utf-8'
     default_content_type = 'text/plain; charset=utf-8'
+    block_size = 65536
+    coalesce_bytes = None
+    coalesce_delay = None
 
     def __init__(self, status, headers=None, body=''):
         """Create a new HTTP response.
@@ -132,7 +449,16 @@ class Response(object):
               : The response is streamed to the client using chunked
                 transfer-encoding (when implemented by the WSGI server).
 
-            A callable that returns a single str or unicode object
+            A file-like object (an object with a `read` method)
+              : The file is passed to the WSGI server's `wsgi.file_wrapper`,
+                if available, which allows the server to use optimizations
+                like sendfile(2). Otherwise it is read in blocks of
+                `block_size` bytes. The file is closed when the response is
+                closed. If the object is a real file and no Content-Length
+                header was set, the header is set to the remaining size of
+                the file.
+
+            A callable that returns any of the above
               : This is only useful in combination with an 'ETag' or
                 'Last-Modified' header, to delay construction of the
                 response body until after conditional request handling
@@ -146,8 +472,7 @@ class Response(object):
                 headers of the same name taking precedence.
         """
         if isinstance(status, int):
-            reason = status_codes.get(status, "Unknown")
-            status_code, status = status, "%s %s" % (status, reason)
+            status_code, status = status, status_line(status)
         else:
             status_code = int(status.split(None, 1)[0])
 
@@ -166,7 +491,10 @@ class Response(object):
         self._raw_body = body
         self._body = None
         self._body_writer = None
-        self._callbacks = []
+        # Functions called with (body, headers) during finalization that
+        # return a transformed body, e.g. for compression.
+        self._body_filters = ()
+        self._callbacks = ()
 
     @property
     def status(self):
@@ -205,7 +533,7 @@ class Response(object):
 
     def add_callback(self, fn):
         """Add a callback to be executed when the response is closed."""
-        self._callbacks.append(fn)
+        self._callbacks += (fn,)
 
     def set_cookie(self, key, value='', max_age=None, path='/', domain=None,
                    secure=False, httponly=False, expires=None):
@@ -236,27 +564,25 @@ class Response(object):
             Note: a value of type int or float is interpreted as a number of
             seconds in the future, *not* as Unix timestamp.
         """
-        key, value = key.encode('utf-8'), value.encode('utf-8')
-        cookie = SimpleCookie({key: value})
-        m = cookie[key]
         if max_age is not None:
             if isinstance(max_age, timedelta):
-                m['max-age'] = int(total_seconds(max_age))
+                max_age = int(total_seconds(max_age))
             else:
-                m['max-age'] = int(max_age)
-        if path is not None: m['path'] = path.encode('utf-8')
-        if domain is not None: m['domain'] = domain.encode('utf-8')
-        if secure: m['secure'] = True
-        if httponly: m['httponly'] = True
+                max_age = int(max_age)
+        if path is not None: path = path.encode('utf-8')
+        if domain is not None: domain = domain.encode('utf-8')
         if expires is not None:
             # 'expires' expects an offset in seconds, like max-age
             if isinstance(expires, datetime):
                 expires = total_seconds(expires - datetime.utcnow())
             elif isinstance(expires, timedelta):
                 expires = total_seconds(expires)
-            m['expires'] = int(expires)
+            expires = int(expires)
 
-        self.headers.add_header('Set-Cookie', m.OutputString())
+        self.headers.add_header('Set-Cookie', format_cookie(
+            key.encode('utf-8'), value.encode('utf-8'), max_age=max_age,
+            expires=expires, path=path, domain=domain, secure=secure,
+            httponly=httponly))
 
     def delete_cookie(self, key, path='/', domain=None):
         """Delete a cookie (by setting it to a blank value).
@@ -310,34 +636,199 @@ class Response(object):
             return Response(status=304, headers=headers, body='')
         return self
 
-    def __call__(self, environ, start_response):
-        """WSGI interface
+    def ranged_to(self, request, max_ranges=20):
+        """Return a response that honors the Range header of a request.
 
-        Finalizes the response body, calls `start_response` and returns a
-        response iterator.
+        Returns the Response object unchanged, or a new Response object with
+        a "206 Partial Content" or "416 Requested Range Not Satisfiable"
+        status code. Only applies to successful (200) responses to GET
+        requests whose body is a str or a seekable file-like object. Ranges
+        are read from files by seeking to the requested positions.
+
+        Multiple ranges are sent as a `multipart/byteranges` entity.
+        Overlapping and adjacent ranges are merged, so no part of the body
+        is sent more than once. Requests for more than `max_ranges` ranges
+        are answered with the full entity.
+
+        If the request has an If-Range header, it is validated against the
+        response's ETag (strong comparison) or Last-Modified header, and
+        the full entity is returned when it doesn't match.
+
+        This should be called after `conditional_to`, since conditional
+        requests are only handled for "200 OK" responses.
         """
-        code = self._status_code
-        headers = self._headers
+        range_header = request.headers.get('Range')
+        if not range_header or self.code != 200 or request.method != 'GET':
+            return self
+        headers = self.headers
+
+        if_range = request.headers.get('If-Range')
+        if if_range:
+            if if_range[:1] == '"' or if_range[:2] in ('W/', 'w/'):
+                try:
+                    if not match_etag(headers.get('ETag'), if_range):
+                        return self
+                except ValueError:
+                    return self
+            else:
+                last_modified = headers.get('Last-Modified')
+                try:
+                    if not last_modified or \
+                            httpdate_to_timestamp(last_modified) != \
+                            httpdate_to_timestamp(if_range):
+                        return self
+                except Exception:
+                    return self  # Ignore invalid dates
+
         body = self.body
-        request_method = environ.get('REQUEST_METHOD', '').upper()
+        if isinstance(body, unicode):
+            body = body.encode(self.default_encoding)
+        if type(body) is str:
+            base, size = 0, len(body)
+        elif is_file_like(body) and hasattr(body, 'seek'):
+            base = body.tell()
+            body.seek(0, os.SEEK_END)
+            size = body.tell() - base
+            body.seek(base)
+        else:
+            return self
 
-        # Validate response body
+        ranges = parse_range_header(range_header, size)
+        if ranges is None or len(ranges) > max_ranges:
+            return self
+        if not ranges:
+            if hasattr(body, 'close'):
+                body.close()
+            return self._derive(416, [
+                ('Content-Range', 'bytes */%d' % size)], '')
+        ranges = coalesce_ranges(ranges)
+
+        range_headers = [(k, v) for k, v in headers.items()
+                         if k.lower() not in ('content-length', 'content-range')]
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            length = last - first + 1
+            if type(body) is str:
+                part = body[first:last + 1]
+            else:
+                part = FileRange(body, base + first, length)
+            range_headers.extend([
+                ('Content-Range', 'bytes %d-%d/%d' % (first, last, size)),
+                ('Content-Length', str(length)),
+            ])
+            return self._derive(206, range_headers, part)
+
+        content_type = headers.get('Content-Type') or self.default_content_type
+        boundary = binascii.hexlify(os.urandom(12))
+        part_headers = [
+            '\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d'
+            '\r\n\r\n' % (boundary, content_type, first, last, size)
+            for first, last in ranges]
+        length = sum(len(h) for h in part_headers) \
+                + sum(last - first + 1 for first, last in ranges) \
+                + len(boundary) + 8
+        range_headers = [(k, v) for k, v in range_headers
+                         if k.lower() != 'content-type']
+        range_headers.extend([
+            ('Content-Type', 'multipart/byteranges; boundary=%s' % boundary),
+            ('Content-Length', str(length)),
+        ])
+        return self._derive(206, range_headers, _multipart_byteranges(
+            body, base, ranges, part_headers, boundary, self.block_size))
+
+    def _derive(self, status, headers, body):
+        # Create a response that keeps this response's callbacks and
+        # instance-level settings.
+        response = Response(status, headers=headers, body=body)
+        response._callbacks = self._callbacks
+        if hasattr(self, '__dict__'):
+            response.__dict__.update(self.__dict__)
+        return response
+
+    def _known_length(self):
+        """Return the length of the encoded body if it is known without
+        evaluating or reading the body, else None."""
+        body = self._body
+        if body is None and self._body_writer is None:
+            body = self._raw_body
+        if isinstance(body, unicode):
+            return len(body.encode(self.default_encoding))
+        elif type(body) is str:
+            return len(body)
+        elif isinstance(body, file):
+            return os.fstat(body.fileno()).st_size - body.tell()
+        return None
+
+    def _discard_body(self):
+        """Close the body (e.g. a file or generator) without evaluating it."""
+        body = self._body
+        if body is None:
+            body = self._raw_body
+        if not callable(body) and hasattr(body, 'close'):
+            body.close()
+
+    def _finalize_body(self, headers):
+        """Evaluate and validate the body, and apply the body filters."""
+        body = self.body
         if isinstance(body, unicode):
             body = body.encode(self.default_encoding)
+        elif is_file_like(body):
+            if 'Content-Length' not in headers and isinstance(body, file):
+                size = os.fstat(body.fileno()).st_size - body.tell()
+                headers['Content-Length'] = str(size)
         elif isinstance(body, collections.Iterator):
             body = (s.encode(self.default_encoding)
                     if isinstance(s, unicode) else s
                     for s in body)
         elif not isinstance(body, str):
             raise TypeError("response body must be of type unicode, str,"
-                            " or Iterator, not '%s'" % type(body))
+                            " Iterator or a file-like object, not '%s'"
+                            % type(body))
+
+        if self._body_filters:
+            if is_file_like(body):
+                body = FileIterator(body, self.block_size)
+            for fn in self._body_filters:
+                body = fn(body, headers)
+
+        # Make sure we have Content-Type and Content-Length headers.
+        if 'Content-Type' not in headers:
+            headers['Content-Type'] = self.default_content_type
+        if type(body) is str and 'Content-Length' not in headers:
+            headers['Content-Length'] = str(len(body))
+        return body
+
+    def __call__(self, environ, start_response):
+        """WSGI interface
 
-        # Make sure we have Content-Type and Content-Length headers if needed.
-        if code != 304:
-            if 'Content-Type' not in headers:
-                headers['Content-Type'] = self.default_content_type
-            if type(body) is str and 'Content-Length' not in headers:
-                headers['Content-Length'] = str(len(body))
+        Finalizes the response body, calls `start_response` and returns a
+        response iterator.
+        """
+        code = self._status_code
+        headers = self._headers
+        request_method = environ.get('REQUEST_METHOD', '').upper()
+
+        if code in (204, 304) or request_method == 'HEAD':
+            # No body will be sent, so don't evaluate or serialize it.
+            if code != 304:
+                if 'Content-Type' not in headers:
+                    headers['Content-Type'] = self.default_content_type
+                if 'Content-Length' not in headers and not self._body_filters:
+                    length = self._known_length()
+                    if length is not None:
+                        headers['Content-Length'] = str(length)
+            self._discard_body()
+            body = ''
+        else:
+            body = self._finalize_body(headers)
+
+        callbacks = self._callbacks
+        source = self._body
+        if source is not body and not isinstance(source, basestring) \
+                and hasattr(source, 'close'):
+            # The body has been wrapped (e.g. by body filters), so closing
+            # the response body won't close the original file or iterator.
+            callbacks = (source.close,) + callbacks
 
         # Special case for Location header: accept unicode, make absolute.
         location = headers.get('Location')
@@ -350,13 +841,135 @@ class Response(object):
             )
 
         # Send response
-        header_list = [(k.encode('ascii'), v.encode('latin-1'))
-                       for k, v in headers.items()]
-        if code in (204, 304) or request_method == 'HEAD':
-            body = ''
-
+        header_list = headers.to_wsgi_list()
         start_response(self.status, header_list)
-        return ResponseBody(body, environ, self._callbacks)
+        if is_file_like(body):
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                return file_wrapper(_ClosingFile(
+                    body, ResponseBody(body, environ, callbacks)),
+                    self.block_size)
+            body = FileIterator(body, self.block_size)
+        elif self.coalesce_bytes is not None and type(body) is not str:
+            return ResponseBody(body, environ, callbacks,
+                                (self.coalesce_bytes, self.coalesce_delay))
+        return ResponseBody(body, environ, callbacks)
+
+
+class FrozenResponse(Response):
+    """A response that is prepared once and can be returned many times.
+
+    Takes the same arguments as `Response`, but the body must be a string
+    (or a callable returning a string). The body is encoded, and the
+    Content-Type, Content-Length and (for "200 OK" responses without one)
+    ETag headers are added when the object is created. The status line and
+    the encoded header list are computed once as well.
+
+    A FrozenResponse object can be returned from handlers any number of
+    times, from many threads at once:
+
+        robots_txt = FrozenResponse(200, [('Content-Type', 'text/plain')],
+                                    'User-agent: *\nDisallow:\n')
+
+        @get
+        def robots(request):
+            return robots_txt
+
+    The Mapper and `Resource` work on a cheap per-request copy, so wrappers
+    and callbacks can still modify the response. As long as nothing has
+    been modified, the response is sent without any further validation or
+    encoding. Conditional requests are handled using the precomputed ETag.
+    Don't modify the original object after it has been created.
+    """
+    __slots__ = ('_frozen', '_shared')
+
+    def __init__(self, status, headers=None, body=''):
+        super(FrozenResponse, self).__init__(status, headers, body)
+        headers = self._headers
+        body = self._finalize_body(headers)
+        if type(body) is not str:
+            raise TypeError("FrozenResponse body must be a string, not '%s'"
+                            % type(body))
+        if self._status_code == 200 and 'ETag' not in headers:
+            headers['ETag'] = '"%s"' % crc32_etag(body)
+        self._raw_body = body
+        self._body = None
+        self._shared = True
+        if 'Location' in headers:
+            self._frozen = None  # Made absolute for each request
+        else:
+            self._frozen = (self._status, headers._headers[:],
+                            headers.to_wsgi_list(), body)
+
+    def _copy(self):
+        """Return a copy for use by a single request."""
+        response = object.__new__(FrozenResponse)
+        response._status = self._status
+        response._status_code = self._status_code
+        response._headers = self._headers.copy()
+        response._raw_body = self._raw_body
+        response._body = None
+        response._body_writer = None
+        response._body_filters = ()
+        response._callbacks = ()
+        response._frozen = self._frozen
+        response._shared = False
+        return response
+
+    def __call__(self, environ, start_response):
+        frozen = self._frozen
+        if frozen is not None and self._status is frozen[0] \
+                and self._headers._headers == frozen[1] \
+                and self._raw_body is frozen[3] \
+                and (self._body is None or self._body is frozen[3]) \
+                and self._body_writer is None and not self._body_filters:
+            start_response(self._status, frozen[2][:])
+            body = frozen[3]
+            if self._status_code in (204, 304) \
+                    or environ.get('REQUEST_METHOD', '').upper() == 'HEAD':
+                body = ''
+            return ResponseBody(body, environ, self._callbacks)
+        return super(FrozenResponse, self).__call__(environ, start_response)
+
+
+def per_request(response):
+    """Return a per-request copy of a shared `FrozenResponse`, or the
+    response unchanged."""
+    if isinstance(response, FrozenResponse) and response._shared:
+        return response._copy()
+    return response
+
+
+stored_response = collections.namedtuple(
+        'stored_response', 'status headers body')
+
+
+def store_response(response, content_type=True):
+    """Return the status, headers and encoded body of a response as a
+    `stored_response` tuple, for sharing the response between requests
+    (see `restore_response`).
+
+    The body is evaluated and serialized. Returns None if the body is not a
+    string (e.g. an iterator or a file). If `content_type` is True, the
+    response's `default_content_type` is added as Content-Type header when
+    there is none.
+    """
+    body = response.body
+    if isinstance(body, unicode):
+        body = body.encode(response.default_encoding)
+    if type(body) is not str:
+        return None
+    headers = response.headers.items()
+    if content_type and 'Content-Type' not in response.headers:
+        headers.append(('Content-Type', response.default_content_type))
+    return stored_response(response.status, headers, body)
+
+
+def restore_response(stored, headers=()):
+    """Create a new `Response` from a `stored_response` tuple, with
+    additional `headers`."""
+    return Response(stored.status, stored.headers + list(headers),
+                    stored.body)
 
 
 def response(code, body='', etag=None, last_modified=None, expires=None, **kw):
@@ -0,0 +1,243 @@
+"""
+Server-Sent Events broadcasting.
+
+An `SSEHub` sends published events to any number of subscribed clients.
+Each event is encoded once (see `rhino.util.sse_event`), and the encoded
+bytes are shared by all subscribers:
+
+    from rhino import Mapper, get
+    from rhino.sse import SSEHub
+
+    hub = SSEHub(history=1000, heartbeat_interval=15)
+
+    @get
+    def events(request):
+        return hub.response(request)
+
+    app = Mapper()
+    app.add('/events', events)
+
+    # Elsewhere, e.g. in a background thread:
+    hub.publish(json.dumps(stats), event='stats')
+
+Every subscriber has a bounded queue of events that have not been sent yet.
+When a client can't keep up and its queue is full, the subscriber is
+either disconnected (the default), or the oldest queued events are
+discarded so that the client skips ahead to the most recent ones
+(`coalesce=True`). Events that are queued when the client is ready to
+receive are sent together.
+
+Events get sequential ids, unless an id is given when publishing. The most
+recent events are kept in a ring buffer of size `history`. Clients that
+reconnect with a Last-Event-ID header (as browsers do automatically) first
+get the events they missed, if these are still in the buffer.
+
+If `heartbeat_interval` is set, a background thread sends a comment to all
+idle subscribers every `heartbeat_interval` seconds, to keep connections
+open and to detect disconnected clients. The comment is the same string
+for all subscribers.
+
+Each subscriber blocks a thread of the WSGI server (or a greenlet) while
+connected.
+"""
+from __future__ import absolute_import
+
+import threading
+from collections import deque
+
+from .response import Response
+from .util import sse_event
+
+__all__ = [
+    'SSEHub',
+]
+
+HEARTBEAT = ':\n\n'
+
+
+class Subscription(object):
+    """An iterator over the encoded events for one client.
+
+    Blocks until events are available. Ends when the subscription is closed,
+    or when the client was disconnected for being too slow.
+    """
+
+    def __init__(self, hub, max_queued, coalesce):
+        self.hub = hub
+        self.max_queued = max_queued
+        self.coalesce = coalesce
+        self.closed = False
+        self.dropped = 0  # Number of events discarded when coalescing
+        self._queue = deque()
+        self._cond = threading.Condition(threading.Lock())
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        with self._cond:
+            while not self._queue and not self.closed:
+                self._cond.wait()
+            if not self._queue:
+                raise StopIteration
+            if len(self._queue) == 1:
+                return self._queue.popleft()
+            chunks = list(self._queue)
+            self._queue.clear()
+        return ''.join(chunks)
+
+    def close(self):
+        """Unsubscribe. Events that are already queued are still returned."""
+        self.hub._unsubscribe(self)
+        self._close()
+
+    def _close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def _put(self, chunk):
+        """Queue an encoded event. Returns False if the subscriber has been
+        disconnected."""
+        with self._cond:
+            if self.closed:
+                return False
+            if len(self._queue) >= self.max_queued:
+                if not self.coalesce:
+                    # The client can resume using Last-Event-ID.
+                    self._queue.clear()
+                    self.closed = True
+                    self._cond.notify()
+                    return False
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append(chunk)
+            self._cond.notify()
+            return True
+
+    def _heartbeat(self):
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._queue.append(HEARTBEAT)
+                self._cond.notify()
+
+
+class SSEHub(object):
+    """Fans out Server-Sent Events to subscribers.
+
+    Parameters:
+
+    history
+      : The number of recent events kept for Last-Event-ID resumption.
+
+    max_queued
+      : The maximum number of events queued for a single subscriber.
+
+    coalesce
+      : When a subscriber's queue is full, discard its oldest queued event
+        instead of disconnecting it.
+
+    heartbeat_interval
+      : Time (in seconds) between heartbeat comments, or None.
+
+    retry
+      : If not None, the reconnection time (in milliseconds) sent to new
+        subscribers.
+    """
+
+    def __init__(self, history=100, max_queued=100, coalesce=False,
+                 heartbeat_interval=None, retry=None):
+        self.max_queued = max_queued
+        self.coalesce = coalesce
+        self.heartbeat_interval = heartbeat_interval
+        self.retry = retry
+        self.disconnected = 0  # Number of subscribers dropped for being slow
+        self._history = deque(maxlen=history)
+        self._next_id = 1
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+        self._stopped = threading.Event()
+
+    def __len__(self):
+        """Return the number of subscribers."""
+        return len(self._subscribers)
+
+    def publish(self, data=None, event=None, id=None, comment=None):
+        """Encode an event and queue it for all subscribers.
+
+        Returns the event id.
+        """
+        with self._lock:
+            if id is None:
+                id = str(self._next_id)
+                self._next_id += 1
+            chunk = sse_event(event=event, data=data, id=id, comment=comment)
+            self._history.append((id, chunk))
+            dropped = [sub for sub in self._subscribers if not sub._put(chunk)]
+            if dropped:
+                self._subscribers.difference_update(dropped)
+                self.disconnected += len(dropped)
+        return id
+
+    def subscribe(self, last_event_id=None):
+        """Return a new `Subscription`.
+
+        If `last_event_id` is the id of an event in the history, the events
+        published after it are queued first.
+        """
+        sub = Subscription(self, self.max_queued, self.coalesce)
+        if self.retry is not None:
+            sub._put(sse_event(retry=self.retry))
+        with self._lock:
+            if last_event_id is not None:
+                ids = [event_id for event_id, chunk in self._history]
+                if last_event_id in ids:
+                    replay = list(self._history)[ids.index(last_event_id) + 1:]
+                    sub._put(''.join(chunk for event_id, chunk in replay))
+            self._subscribers.add(sub)
+            if self.heartbeat_interval and self._heartbeat_thread is None:
+                self._start_heartbeat()
+        return sub
+
+    def response(self, request):
+        """Subscribe and return a streaming response for a request.
+
+        Uses the request's Last-Event-ID header for resumption. The
+        subscription ends when the response is closed.
+        """
+        sub = self.subscribe(request.headers.get('Last-Event-ID'))
+        response = Response(200, headers=[
+            ('Content-Type', 'text/event-stream'),
+            ('Cache-Control', 'no-cache'),
+        ], body=sub)
+        response.add_callback(sub.close)
+        return response
+
+    def heartbeat(self):
+        """Send a heartbeat comment to all idle subscribers."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub._heartbeat()
+
+    def close(self):
+        """End all subscriptions and stop the heartbeat thread."""
+        self._stopped.set()
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+        for sub in subscribers:
+            sub._close()
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _start_heartbeat(self):
+        def run():
+            while not self._stopped.wait(self.heartbeat_interval):
+                self.heartbeat()
+        thread = threading.Thread(target=run, name='SSEHub heartbeat')
+        thread.daemon = True
+        thread.start()
+        self._heartbeat_thread = thread
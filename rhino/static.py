@@ -1,48 +1,474 @@
 from __future__ import absolute_import
 
+import gzip
 import mimetypes
 import os
+import posixpath
+import re
+import stat as stat_module
+import threading
+import time
+import urllib
+from cStringIO import StringIO
+from datetime import datetime
+from cgi import escape
 from hashlib import md5
 
-from .errors import NotFound, MethodNotAllowed
-from .response import ok
+from .compression import is_compressible, DEFAULT_CONTENT_TYPES
+from .errors import NotFound, MethodNotAllowed, MovedPermanently
+from .http import negotiate_encoding, datetime_to_httpdate, \
+        timedelta_to_httpdate
+from .response import Response, ok
+from .util import LRUCache
+
+fingerprint_length = 10
+fingerprint_re = re.compile(r'^(.*)\.([0-9a-f]{%d})((?:\.[^./]*)?)$'
+                            % fingerprint_length)
+
+# File name suffixes of precompressed variants, by content-coding.
+sidecar_suffixes = {
+    'gzip': '.gz',
+    'br': '.br',
+}
+
+
+class FileInfo(object):
+    """Metadata of a static file, as cached by `StaticCache`.
+
+    `headers` holds the precomputed response headers that only depend on the
+    file itself.
+    """
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'content_type', 'headers',
+                 '_identity', '_sidecars')
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = md5('%d:%f:%d' % (
+            stat.st_ino, stat.st_mtime, stat.st_size)).hexdigest()
+        content_type, encoding = mimetypes.guess_type(path)
+        # Don't serve e.g. 'app.js.gz' as application/javascript.
+        if content_type is None or encoding is not None:
+            content_type = StaticFile.default_content_type
+        self.content_type = content_type
+        self.headers = [
+            ('Accept-Ranges', 'bytes'),
+            ('Content-Length', str(self.size)),
+            ('ETag', '"%s"' % self.etag),
+            ('Last-Modified', datetime_to_httpdate(self.mtime)),
+        ]
+        self._identity = (stat.st_dev, stat.st_ino, stat.st_mtime,
+                          stat.st_size)
+        self._sidecars = {}  # Cached `_find_sidecars` results
+
+
+def _stat_file(path):
+    """Return the stat result for a regular file, or None."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not stat_module.S_ISREG(stat.st_mode):
+        return None
+    return stat
+
+
+class _Descriptor(object):
+    """An open file descriptor shared by concurrent readers."""
+    __slots__ = ('fd', 'identity', 'lock', 'refs', 'evicted')
+
+    def __init__(self, fd, identity):
+        self.fd = fd
+        self.identity = identity
+        self.lock = threading.Lock()
+        self.refs = 0
+        self.evicted = False
+
+
+class _PooledFile(object):
+    """A read-only file-like object reading from a shared descriptor.
+
+    Each instance keeps its own position. Reads are positioned explicitly,
+    so that any number of instances can share a descriptor. Closing the
+    instance releases the descriptor back to the pool.
+    """
+    __slots__ = ('_cache', '_desc', '_size', '_pos', 'closed')
+
+    def __init__(self, cache, desc, size):
+        self._cache = cache
+        self._desc = desc
+        self._size = size
+        self._pos = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        remaining = self._size - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        chunks = []
+        desc = self._desc
+        with desc.lock:
+            os.lseek(desc.fd, self._pos, os.SEEK_SET)
+            while size > 0:
+                chunk = os.read(desc.fd, size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size -= len(chunk)
+        data = ''.join(chunks)
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise IOError("Invalid offset: %d" % offset)
+        self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._cache._release(self._desc)
+
+
+class StaticCache(object):
+    """A cache of static file metadata and open file descriptors.
+
+    Can be shared by any number of `StaticFile` and `StaticDirectory`
+    resources. File metadata (size, modification time, ETag and content
+    type) is cached for `interval` seconds before the file is checked again
+    with stat(2). Missing files are not cached, but the precompressed
+    sidecars found for a file (or their absence) are cached along with its
+    metadata.
+
+    If `max_fds` is greater than zero, up to that many files are kept open
+    and reused by subsequent requests. Response bodies read from the shared
+    descriptors using explicitly positioned reads. When a file changes on
+    disk, the open descriptor is replaced once its metadata is revalidated.
+
+    In the steady state, serving a cached file then needs no system calls
+    other than those transferring the data.
+
+    If `max_memory` is greater than zero, the contents of files no larger
+    than `max_file_size` bytes (including precompressed sidecars) are kept
+    in memory, up to a total of `max_memory` bytes, and served as a single
+    string. Contents are dropped when the file's metadata changes.
+    """
+
+    def __init__(self, interval=1.0, max_fds=0, max_memory=0,
+                 max_file_size=65536, clock=time.time):
+        self.interval = interval
+        self.max_fds = max_fds
+        self.max_memory = max_memory
+        self.max_file_size = max_file_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._fds = LRUCache(max_fds, on_evict=self._evict) \
+                if max_fds > 0 else None
+        self._data = LRUCache(max_bytes=max_memory,
+                              sizeof=lambda entry: len(entry[1])) \
+                if max_memory > 0 else None
+
+    def lookup(self, path):
+        """Return a `FileInfo` for a regular file, or None."""
+        now = self.clock()
+        entry = self._entries.get(path)
+        if entry is not None and now - entry[0] < self.interval:
+            return entry[1]
+        stat = _stat_file(path)
+        if stat is None:
+            self._entries.pop(path, None)
+            return None
+        info = FileInfo(path, stat)
+        self._entries[path] = (now, info)
+        return info
+
+    def open(self, info):
+        """Open the file described by a `FileInfo` for reading."""
+        if self._fds is None:
+            return open(info.path, 'rb')
+        with self._lock:
+            desc = self._fds.get(info.path)
+            if desc is not None and desc.identity != info._identity:
+                self._fds.pop(info.path)
+                desc = None
+            if desc is None:
+                desc = _Descriptor(os.open(info.path, os.O_RDONLY),
+                                   info._identity)
+                self._fds[info.path] = desc
+            desc.refs += 1
+        return _PooledFile(self, desc, info.size)
+
+    def body(self, info):
+        """Return a response body for the file described by a `FileInfo`.
+
+        Returns the file's contents as a string if it is eligible for the
+        memory cache, otherwise an open file.
+        """
+        data = self._read(info)
+        if data is None:
+            return self.open(info)
+        return data
+
+    def _read(self, info):
+        if self._data is None or info.size > self.max_file_size:
+            return None
+        with self._lock:
+            entry = self._data.get(info.path)
+        if entry is not None and entry[0] == info._identity:
+            return entry[1]
+        with open(info.path, 'rb') as f:
+            data = f.read(info.size + 1)
+        if len(data) != info.size:
+            return None  # Changed since the last stat, try again later.
+        with self._lock:
+            self._data[info.path] = (info._identity, data)
+        return data
+
+    def clear(self):
+        """Forget all cached metadata and contents, and close idle file
+        descriptors."""
+        with self._lock:
+            self._entries.clear()
+            if self._fds is not None:
+                self._fds.clear()
+            if self._data is not None:
+                self._data.clear()
+
+    def _evict(self, path, desc):
+        # Called with self._lock held.
+        desc.evicted = True
+        if not desc.refs:
+            os.close(desc.fd)
+
+    def _release(self, desc):
+        with self._lock:
+            desc.refs -= 1
+            if desc.evicted and not desc.refs:
+                os.close(desc.fd)
+
+
+def _check_encodings(encodings):
+    for encoding in encodings:
+        if encoding not in sidecar_suffixes:
+            raise ValueError("Unsupported encoding: '%s'" % encoding)
+    return tuple(encodings)
+
+
+def _find_sidecars(cache, info, encodings):
+    """Return the encodings of up-to-date sidecar files for a file.
+
+    The result (including missing sidecars) is cached with the file's
+    metadata, so it is checked again when the file is.
+    """
+    available = info._sidecars.get(encodings)
+    if available is not None:
+        return available
+    available = {}
+    for encoding in encodings:
+        sidecar = cache.lookup(info.path + sidecar_suffixes[encoding])
+        if sidecar is not None and sidecar.mtime >= info.mtime:
+            available[encoding] = sidecar
+    info._sidecars[encodings] = available
+    return available
+
+
+class _Offload(object):
+    """Describes how to hand off sending a file to the front-end server."""
+    modes = {
+        'x-accel-redirect': 'X-Accel-Redirect',
+        'x-sendfile': 'X-Sendfile',
+    }
+
+    def __init__(self, mode, location, base):
+        if mode not in self.modes:
+            raise ValueError("Unsupported offload mode: '%s'" % mode)
+        if mode == 'x-accel-redirect' and location is None:
+            raise ValueError("X-Accel-Redirect requires an offload_location")
+        self.header = self.modes[mode]
+        self.location = location.rstrip('/') + '/' \
+                if location is not None else None
+        self.base = base
+
+    def value(self, filepath):
+        if self.location is None:
+            return filepath
+        relpath = os.path.relpath(filepath, self.base)
+        return self.location + urllib.quote(
+                relpath.replace(os.path.sep, '/'))
+
+
+def _file_response(request, cache, info, content_type, expires,
+                   precompressed=(), cache_control=None, offload=None):
+    if request.method not in ('GET', 'HEAD'):
+        raise MethodNotAllowed(allow='GET, HEAD')
+    content_type = content_type or info.content_type
+    headers = []
+    if precompressed:
+        sidecars = _find_sidecars(cache, info, precompressed)
+        if sidecars:
+            headers.append(('Vary', 'Accept-Encoding'))
+            encoding = negotiate_encoding(
+                    request.headers.get('Accept-Encoding', ''),
+                    [e for e in precompressed if e in sidecars])
+            if encoding is not None:
+                info = sidecars[encoding]
+                headers.append(('Content-Encoding', encoding))
+    if cache_control is not None:
+        headers.append(('Cache-Control', cache_control))
+    if expires is not None:
+        headers.append(('Expires', datetime_to_httpdate(expires)
+                        if isinstance(expires, datetime)
+                        else timedelta_to_httpdate(expires)))
+    headers.append(('Content-Type', content_type))
+    if offload is not None:
+        # The front-end server sends the file, including Content-Length
+        # and byte ranges. An empty iterator body avoids a Content-Length
+        # header being added for the (empty) body.
+        headers.append((offload.header, offload.value(info.path)))
+        headers.extend(h for h in info.headers
+                       if h[0] in ('ETag', 'Last-Modified'))
+        return Response(200, headers, iter([])).conditional_to(request)
+    response = Response(200, info.headers + headers,
+                        lambda: cache.body(info))
+    conditional_response = response.conditional_to(request)
+    if conditional_response is not response:
+        return conditional_response
+    return response.ranged_to(request)
 
 
 class StaticFile(object):
-    """Resource for serving a static file."""
+    """Resource for serving a static file.
+
+    The file is returned as a file-like response body, so it can be sent by
+    the WSGI server's `wsgi.file_wrapper` (e.g. using sendfile(2)) when
+    available.
+
+    Supports conditional requests and byte-range requests (see
+    `Response.ranged_to`).
+
+    By default, the file is checked with stat(2) on every request. To cache
+    file metadata and open files, pass a `StaticCache` as `cache`:
+
+        cache = StaticCache(interval=5, max_fds=100)
+        app.add('/robots.txt', StaticFile('./robots.txt', cache=cache))
+
+    `precompressed` is a list of content-codings ('gzip', 'br') in order of
+    preference. When a precompressed copy of the file exists next to it
+    (e.g. 'app.js.gz' for 'app.js', see `sidecar_suffixes`) and is not older
+    than the file, it is served to clients that accept the encoding.
+    Sidecar files can be created with `precompress_directory`.
+
+    With `offload`, the file is not sent by the application. Instead, the
+    response carries a header instructing the front-end server to send
+    it, after the application has handled routing and conditional requests:
+
+    'x-accel-redirect'
+      : (nginx) The header value is an internal URI: `offload_location`,
+        the prefix of an internal location that maps to the file's
+        directory, followed by the file name.
+
+    'x-sendfile'
+      : (Apache mod_xsendfile, lighttpd) The header value is the absolute
+        path of the file.
+
+    Example nginx configuration for `offload_location='/_static/'`:
+
+        location /_static/ {
+            internal;
+            alias /path/to/static/;
+        }
+    """
 
-    block_size = 65536
     default_content_type = 'application/octet-stream'
 
-    def __init__(self, path, content_type=None, expires=None):
-        if not os.path.isfile(path):
+    def __init__(self, path, content_type=None, expires=None, cache=None,
+                 precompressed=(), offload=None, offload_location=None):
+        if cache is None:
+            cache = StaticCache(interval=0)
+        path = os.path.abspath(path)
+        if cache.lookup(path) is None:
             raise ValueError("No such file: %s" % path)
-        if content_type is None:
-            content_type = mimetypes.guess_type(path)[0] \
-                    or self.default_content_type
         self.path = path
         self.content_type = content_type
         self.expires = expires
+        self.cache = cache
+        self.precompressed = _check_encodings(precompressed)
+        self.offload = _Offload(offload, offload_location,
+                                os.path.dirname(path)) \
+                if offload is not None else None
 
     def __call__(self, request):
-        if request.method not in ('GET', 'HEAD'):
-            raise MethodNotAllowed(allow='GET, HEAD')
-        stat = os.stat(self.path)
-        etag = md5('%d:%f:%d' % (
-            stat.st_ino, stat.st_mtime, stat.st_size)).hexdigest()
+        info = self.cache.lookup(self.path)
+        if info is None:
+            raise NotFound
+        return _file_response(request, self.cache, info, self.content_type,
+                              self.expires, self.precompressed,
+                              offload=self.offload)
+
+
+listing_template = '''<!DOCTYPE html>
+<html>
+  <head>
+    <title>Index of %(path)s</title>
+  </head>
+  <body>
+    <h1>Index of %(path)s</h1>
+    <ul>
+%(items)s
+    </ul>
+  </body>
+</html>
+'''
+
+
+class _DirectoryIndex(object):
+    """A snapshot of the files and directories below a root directory.
+
+    Paths are relative to the root and use '/' as separator. The root
+    directory itself has the path ''.
+    """
 
-        def body():
-            with open(self.path) as f:
-                while True:
-                    chunk = f.read(self.block_size)
-                    if chunk == '':
-                        break
-                    yield chunk
+    def __init__(self, root, built):
+        self.built = built
+        self.files = {}    # path => absolute filesystem path
+        self.dirs = {}     # path => (subdirectory names, file names)
+        self.listings = {}  # path => rendered listing (str)
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel = os.path.relpath(dirpath, root)
+            rel = '' if rel == os.curdir else rel.replace(os.path.sep, '/')
+            base = rel + '/' if rel else ''
+            for name in filenames:
+                self.files[base + name] = os.path.join(dirpath, name)
+            self.dirs[rel] = (sorted(dirnames), sorted(filenames))
 
-        return ok(
-                body, content_length=str(stat.st_size),
-                content_type=self.content_type,
-                etag=etag, expires=self.expires)
+    def listing(self, path):
+        listing = self.listings.get(path)
+        if listing is None:
+            dirnames, filenames = self.dirs[path]
+            names = [name + '/' for name in dirnames] + filenames
+            if path:
+                names.insert(0, '../')
+            items = '\n'.join(
+                    '      <li><a href="%s">%s</a></li>' % (
+                        escape(urllib.quote(name), True), escape(name))
+                    for name in names)
+            listing = listing_template % {
+                'path': escape('/' + path + '/' if path else '/'),
+                'items': items,
+            }
+            self.listings[path] = listing
+        return listing
 
 
 class StaticDirectory(object):
@@ -58,35 +484,283 @@ class StaticDirectory(object):
 
     Setting the `path` parameter's range to `any`, which includes '/', enables
     serving files from subdirectories of './static'.
+
+    Parameters:
+
+    expires
+      : A value for the Expires header of file responses (see `response`).
+
+    cache
+      : A `StaticCache` for file metadata and open files (see `StaticFile`).
+
+    index
+      : If True, the directory tree is scanned once and kept in memory, so
+        that requests for paths that don't exist never touch the
+        filesystem. Files and directories created later are not found
+        until the index is refreshed, either every `refresh_interval`
+        seconds (checked on request) or by calling `refresh()`.
+        Symbolic links to directories are not followed.
+
+    index_file
+      : The name of a file to serve for requests to a directory, e.g.
+        'index.html'.
+
+    listings
+      : If True, directories without an `index_file` are shown as an HTML
+        directory listing. Requires `index`.
+
+    precompressed
+      : A list of content-codings for which precompressed sidecar files
+        are served (see `StaticFile`).
+
+    fingerprints
+      : If True, URLs built for the resource (e.g. using `url_for`) include
+        a hash of the file's contents, as in '/static/app.3f9a1c0b2e.js'.
+        Requests for a fingerprinted URL are served with the Cache-Control
+        header `immutable_cache_control` instead of Expires. If the hash
+        doesn't match the current contents of the file, the file is served
+        with the usual `expires`.
+
+        A file is hashed when a URL is first built for it, or when it is
+        first requested using a fingerprinted URL, and again after it has
+        changed. This reads the whole file during that request. The hashes
+        of up to `max_fingerprints` files are kept.
+
+    offload, offload_location
+      : Hand off sending files to the front-end server (see `StaticFile`).
+        For 'x-accel-redirect', `offload_location` is the prefix of an
+        internal location that maps to the root directory.
+
+    Requests for a directory without a trailing slash are redirected when
+    an index file or listing is served for the directory. To serve the root
+    directory itself, map the resource to a second route without the `path`
+    parameter (e.g. '/static/').
     """
 
-    # TODO add support for index.html, directory listings?
-    def __init__(self, root, expires=None):
+    def __init__(self, root, expires=None, cache=None, index=False,
+                 refresh_interval=None, index_file=None, listings=False,
+                 precompressed=(), fingerprints=False,
+                 immutable_cache_control='public, max-age=31536000, immutable',
+                 max_fingerprints=10000, offload=None, offload_location=None,
+                 clock=time.time):
+        if listings and not index:
+            raise ValueError("Directory listings require index=True")
         self.root = os.path.abspath(root)
         self.expires = expires
+        self.cache = cache if cache is not None else StaticCache(interval=0)
+        self.precompressed = _check_encodings(precompressed)
+        self.refresh_interval = refresh_interval
+        self.index_file = index_file
+        self.listings = listings
+        self.fingerprints = fingerprints
+        self.offload = _Offload(offload, offload_location, self.root) \
+                if offload is not None else None
+        self.immutable_cache_control = immutable_cache_control
+        self.clock = clock
+        self._prefix = self.root + os.path.sep
+        self._fingerprints = LRUCache(max_fingerprints)
+        self._fingerprints_lock = threading.Lock()
+        self._index = None
+        self._refresh_lock = threading.Lock()
+        if index:
+            self.refresh()
+
+    def refresh(self):
+        """Rebuild the directory index."""
+        self._index = _DirectoryIndex(self.root, self.clock())
+
+    def fingerprint(self, path):
+        """Return the content hash of a file, or None if it doesn't exist.
+
+        `path` is relative to the root directory. Hashes are cached and only
+        recomputed when the file changes.
+        """
+        info = self._lookup(path)
+        if info is None:
+            return None
+        return self._fingerprint(info)
+
+    def build_url(self, build_url, path):
+        """Build a URL for a file, including a fingerprint if enabled."""
+        if self.fingerprints:
+            digest = self.fingerprint(path)
+            if digest is not None:
+                head, sep, name = path.rpartition('/')
+                base, ext = os.path.splitext(name)
+                path = '%s%s%s.%s%s' % (head, sep, base, digest, ext)
+        return build_url(path=path)
 
     def __call__(self, request):
-        # Normalize path_info to always start with a slash.
-        path_info = '/' + request.routing_args.get('path', '').lstrip('/')
-        # Interpret path_info as an OS path, resolve any non-leading '..', and
+        if self._index is not None and self.refresh_interval is not None \
+                and self.clock() - self._index.built >= self.refresh_interval \
+                and self._refresh_lock.acquire(False):
+            # Only one thread refreshes, the others use the old index.
+            try:
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+
+        path = request.routing_args.get('path', '')
+        info = self._lookup(path)
+        expires, cache_control = self.expires, None
+        if info is None and self.fingerprints:
+            m = fingerprint_re.match(path)
+            if m:
+                info = self._lookup(m.group(1) + m.group(3))
+                if info is not None and \
+                        self._fingerprint(info) == m.group(2):
+                    expires, cache_control = None, self.immutable_cache_control
+        if info is None:
+            return self._directory_response(request, path)
+        return _file_response(request, self.cache, info, None, expires,
+                              self.precompressed, cache_control, self.offload)
+
+    def _os_path(self, path):
+        """Map a request path to an absolute path below the root, or None."""
+        # Normalize path to always start with a slash.
+        path = '/' + path.lstrip('/')
+        # Interpret path as an OS path, resolve any non-leading '..', and
         # require resulting path to be absolute.
         # This is to prevent enumeration of directory names: If 'foo.txt' is
         # a public file in self.root, and a request for '../bar/foo.txt'
         # succeeds, a client can learn that foo is in a directory named 'bar',
         # and continue like this until it knows the entire path of the file,
         # starting from '/'.
-        request_path = os.path.normpath(path_info)
+        request_path = os.path.normpath(path)
         if not os.path.isabs(request_path):
-            raise NotFound
+            return None
         # Concatenate with root path and do a prefix check to prevent path
         # traversal.
-        prefix = os.path.abspath(self.root) + os.path.sep
+        prefix = self._prefix
         # Use concatenation here instead of os.path.join because request_path
         # is absolute.
         filepath = os.path.abspath(prefix + request_path)
-        if os.path.commonprefix([prefix, filepath]) != prefix:
-            raise NotFound
-        try:
-            return StaticFile(filepath, expires=self.expires)(request)
-        except ValueError:
-            raise NotFound
+        if filepath == self.root:
+            return filepath
+        elif os.path.commonprefix([prefix, filepath]) != prefix:
+            return None
+        return filepath
+
+    def _index_path(self, index, path):
+        """Map a request path to a path in the directory index."""
+        path = path.strip('/')
+        if path not in index.files and path not in index.dirs:
+            # Resolve '..' and empty path segments; see _os_path.
+            path = posixpath.normpath('/' + path).lstrip('/')
+        return path
+
+    def _lookup(self, path):
+        """Return the `FileInfo` for a request path, or None."""
+        index = self._index
+        if index is not None:
+            filepath = index.files.get(self._index_path(index, path))
+        else:
+            filepath = self._os_path(path)
+        if filepath is None:
+            return None
+        return self.cache.lookup(filepath)
+
+    def _fingerprint(self, info):
+        with self._fingerprints_lock:
+            entry = self._fingerprints.get(info.path)
+        if entry is not None and entry[0] == info._identity:
+            return entry[1]
+        # Hash outside the lock; concurrent requests for a cold file may
+        # hash it more than once.
+        h = md5()
+        with open(info.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), ''):
+                h.update(chunk)
+        digest = h.hexdigest()[:fingerprint_length]
+        with self._fingerprints_lock:
+            self._fingerprints[info.path] = (info._identity, digest)
+        return digest
+
+    def _directory_response(self, request, path):
+        index = self._index
+        if index is None:
+            filepath = self._os_path(path)
+            if filepath is None or not self.index_file:
+                raise NotFound
+            info = self.cache.lookup(os.path.join(filepath, self.index_file))
+            if info is None:
+                raise NotFound
+        else:
+            path = self._index_path(index, path)
+            if path not in index.dirs:
+                raise NotFound
+            dirnames, filenames = index.dirs[path]
+            if self.index_file in filenames:
+                info = self.cache.lookup(index.files[
+                        path + '/' + self.index_file if path
+                        else self.index_file])
+                if info is None:
+                    raise NotFound
+            elif self.listings:
+                self._require_trailing_slash(request)
+                if request.method not in ('GET', 'HEAD'):
+                    raise MethodNotAllowed(allow='GET, HEAD')
+                listing = index.listing(path)
+                response = ok(listing, content_type='text/html; charset=utf-8',
+                              etag=md5(listing).hexdigest())
+                return response.conditional_to(request)
+            else:
+                raise NotFound
+        self._require_trailing_slash(request)
+        return _file_response(request, self.cache, info, None, self.expires,
+                              self.precompressed, offload=self.offload)
+
+    def _require_trailing_slash(self, request):
+        if not request.path_info.endswith('/'):
+            raise MovedPermanently(
+                    request.script_name + request.path_info + '/')
+
+
+def precompress_directory(root, content_types=DEFAULT_CONTENT_TYPES,
+                          min_size=1024, level=9, force=False):
+    """Create gzip sidecar files for the static files in a directory tree.
+
+    For every file below `root` whose content type matches `content_types`
+    and that is at least `min_size` bytes large, writes a gzip-compressed
+    copy with the suffix '.gz' next to it. Sidecars that are up-to-date are
+    left alone unless `force` is True. Files that don't get smaller when
+    compressed are skipped.
+
+    Returns a list with the paths of the sidecar files written.
+    """
+    suffixes = tuple(sidecar_suffixes.values())
+    written = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(suffixes):
+                continue
+            path = os.path.join(dirpath, name)
+            sidecar = path + sidecar_suffixes['gzip']
+            content_type = mimetypes.guess_type(path)[0]
+            if content_type is None \
+                    or not is_compressible(content_type, content_types):
+                continue
+            stat = _stat_file(path)
+            if stat is None or stat.st_size < min_size:
+                continue
+            sidecar_stat = _stat_file(sidecar)
+            if not force and sidecar_stat is not None \
+                    and sidecar_stat.st_mtime >= stat.st_mtime:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            buf = StringIO()
+            with gzip.GzipFile(filename='', mode='wb', compresslevel=level,
+                               fileobj=buf, mtime=stat.st_mtime) as gz:
+                gz.write(data)
+            compressed = buf.getvalue()
+            if len(compressed) >= len(data):
+                continue
+            # Write to a temporary file and rename, so that the sidecar is
+            # never served partially written.
+            tmp = '%s.%d.tmp' % (sidecar, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(compressed)
+            os.rename(tmp, sidecar)
+            written.append(sidecar)
+    return written
@@ -3,8 +3,10 @@ from __future__ import absolute_import
 import functools
 import inspect
 import sys
+from collections import OrderedDict
 
 __all__ = [
+    'LRUCache',
     'apply_ctx',
     'sse_event',
 ]
@@ -109,3 +111,83 @@ def log_exception(exc_info=None, stream=None):
         stream.flush()
     finally:
         exc_info = None  # Clear traceback to avoid circular reference
+
+
+class LRUCache(object):
+    """A mapping that holds at most `max_entries` items.
+
+    When full, storing a new item evicts the least recently used one(s). If
+    `max_bytes` is given, items are also evicted while the total size of all
+    values, as computed by `sizeof`, exceeds `max_bytes`. `on_evict`, if
+    given, is called with the key and value of every item that is evicted,
+    replaced, or removed using `pop` or `clear`. Not thread-safe.
+
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1; cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3
+    >>> sorted(cache.keys())
+    ['a', 'c']
+    """
+
+    def __init__(self, max_entries=None, on_evict=None, max_bytes=None,
+                 sizeof=len):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be positive: %s" % max_entries)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.bytes = 0
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def keys(self):
+        return self._items.keys()
+
+    def get(self, key, default=None):
+        """Return the value for `key` and mark it as recently used."""
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.pop(key)
+        self._items[key] = value
+        if self.max_bytes is not None:
+            self.bytes += self.sizeof(value)
+        while self._items and (
+                self.max_entries is not None
+                and len(self._items) > self.max_entries
+                or self.max_bytes is not None
+                and self.bytes > self.max_bytes):
+            self._evict(*self._items.popitem(last=False))
+
+    def pop(self, key, default=None):
+        """Remove `key` and return its value, or `default` if not present."""
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._evict(key, value)
+        return value
+
+    def clear(self):
+        items, self._items = self._items, OrderedDict()
+        for key, value in items.iteritems():
+            self._evict(key, value)
+
+    def _evict(self, key, value):
+        if self.max_bytes is not None:
+            self.bytes -= self.sizeof(value)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
@@ -0,0 +1,279 @@
+import json
+import threading
+
+from rhino.cache import ResponseCache, MemoryStorage, DirectoryStorage, \
+        HandlerCache
+from rhino.mapper import Mapper
+from rhino.representations import json_repr
+from rhino.resource import Resource, get
+from rhino.response import ok
+from rhino.test import TestClient
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(cache):
+    calls = []
+
+    def handler(headers):
+        def fn(request):
+            calls.append(request.path_info)
+            return ok('hit %d' % len(calls), etag='v%d' % len(calls), **headers)
+        return fn
+
+    app = Mapper()
+    app.add_wrapper(cache)
+    app.add('/fresh', handler({'cache_control': 'max-age=60'}))
+    app.add('/plain', handler({}))
+    app.add('/private', handler({'cache_control': 'private, max-age=60'}))
+    app.add('/public', handler({'cache_control': 'public, max-age=60'}))
+    app.add('/swr', handler({'cache_control':
+                             'max-age=10, stale-while-revalidate=30'}))
+    app.add('/vary', handler({'cache_control': 's-maxage=60',
+                              'vary': 'Accept-Language'}))
+    app.add('/tagged', handler({'cache_control': 'max-age=60',
+                                'surrogate_key': 'a b'}))
+    app.add('/expires', handler({'expires': 60}))
+    app.add('/cookie', lambda request: calls.append(request.path_info) or ok(
+        'x', cache_control='max-age=60', set_cookie='a=b'))
+    return TestClient(app.wsgi), calls
+
+
+def test_fresh_hit():
+    clock = Clock()
+    client, calls = make_client(ResponseCache(clock=clock))
+    assert client.get('/fresh').body == 'hit 1'
+    clock.now += 5
+    res = client.get('/fresh')
+    assert res.body == 'hit 1'
+    assert res.headers['Age'] == '5'
+    assert res.headers['ETag'] == '"v1"'
+    assert res.headers['Cache-Control'] == 'max-age=60'
+    assert client.head('/fresh').body == ''
+    assert calls == ['/fresh']
+
+    clock.now += 60
+    assert client.get('/fresh').body == 'hit 2'
+
+
+def test_conditional_hit():
+    client, calls = make_client(ResponseCache(clock=Clock()))
+    client.get('/fresh')
+    res = client.get('/fresh', if_none_match='"v1"')
+    assert res.code == 304
+    assert calls == ['/fresh']
+
+
+def test_not_stored():
+    client, calls = make_client(ResponseCache(clock=Clock()))
+    for path in ('/plain', '/private', '/cookie'):
+        client.get(path)
+        client.get(path)
+    assert calls == ['/plain', '/plain', '/private', '/private',
+                     '/cookie', '/cookie']
+
+
+def test_default_ttl_and_expires():
+    client, calls = make_client(ResponseCache(default_ttl=10, clock=Clock()))
+    client.get('/plain')
+    client.get('/plain')
+    client.get('/expires')
+    client.get('/expires')
+    assert calls == ['/plain', '/expires']
+
+
+def test_request_cache_control():
+    client, calls = make_client(ResponseCache(clock=Clock()))
+    client.get('/fresh')
+    assert client.get('/fresh', cache_control='no-cache').body == 'hit 2'
+    assert client.get('/fresh').body == 'hit 2'
+    assert client.get('/fresh', cache_control='no-store').body == 'hit 3'
+    assert client.get('/fresh').body == 'hit 2'
+
+
+def test_authorization():
+    client, calls = make_client(ResponseCache(clock=Clock()))
+    client.get('/fresh', authorization='Basic eDp5')
+    client.get('/fresh')
+    client.get('/fresh', authorization='Basic eDp5')
+    assert len(calls) == 3
+    client.get('/public', authorization='Basic eDp5')
+    client.get('/public', authorization='Basic eDp5')
+    assert len(calls) == 4
+
+
+def test_vary():
+    client, calls = make_client(ResponseCache(clock=Clock()))
+    assert client.get('/vary', accept_language='en').body == 'hit 1'
+    assert client.get('/vary', accept_language='de').body == 'hit 2'
+    assert client.get('/vary', accept_language='en').body == 'hit 1'
+    assert client.get('/vary', accept_language='de').body == 'hit 2'
+    assert len(calls) == 2
+
+
+def test_stale_while_revalidate():
+    clock = Clock()
+    cache = ResponseCache(clock=clock)
+    client, calls = make_client(cache)
+    client.get('/swr')
+    clock.now += 15
+    assert client.get('/swr').body == 'hit 2'
+    assert client.get('/swr').body == 'hit 2'
+    clock.now += 50
+    assert client.get('/swr').body == 'hit 3'
+
+
+def test_purge():
+    cache = ResponseCache(clock=Clock())
+    client, calls = make_client(cache)
+    res = client.get('/tagged')
+    assert 'Surrogate-Key' not in res.headers
+    client.get('/fresh')
+    assert cache.purge('b') == 1
+    assert cache.purge('b') == 0
+    client.get('/tagged')
+    client.get('/fresh')
+    assert calls == ['/tagged', '/fresh', '/tagged']
+    cache.clear()
+    client.get('/fresh')
+    assert len(calls) == 4
+
+
+def test_memory_storage_budget():
+    storage = MemoryStorage(max_bytes=700)
+    client, calls = make_client(ResponseCache(storage, clock=Clock()))
+    client.get('/fresh')
+    client.get('/public')
+    client.get('/tagged')
+    assert len(storage.keys()) < 3
+
+
+def test_directory_storage(tmpdir):
+    clock = Clock()
+    storage = DirectoryStorage(str(tmpdir.join('cache')), clock=clock)
+    cache = ResponseCache(storage, clock=clock)
+    client, calls = make_client(cache)
+    client.get('/fresh')
+    assert client.get('/fresh').body == 'hit 1'
+    assert len(storage.keys()) == 1
+    storage.clear()
+    assert storage.keys() == []
+    assert client.get('/fresh').body == 'hit 2'
+
+    client.get('/tagged')
+    assert storage.tags(storage.keys()[0]) is not None
+    assert cache.purge('a') == 1
+    assert len(storage.keys()) == 1
+
+    # Expired entries are removed when read, or by a sweep.
+    clock.now += 60
+    assert storage.sweep() == 1
+    assert storage.keys() == []
+    client.get('/fresh')
+    clock.now += 60
+    assert storage.get(storage.keys()[0]) is None
+    assert storage.keys() == []
+
+
+def test_directory_storage_limits(tmpdir):
+    clock = Clock()
+    storage = DirectoryStorage(str(tmpdir.join('cache')), max_entries=2,
+                               sweep_interval=0, clock=clock)
+    client, calls = make_client(ResponseCache(storage, clock=clock))
+    for path in ('/fresh', '/public', '/tagged', '/expires'):
+        client.get(path)
+    assert len(storage.keys()) == 2
+
+
+def test_concurrent_revalidation():
+    clock = Clock()
+    cache = ResponseCache(clock=clock)
+    entered, release = threading.Event(), threading.Event()
+
+    def slow(request):
+        if cache.storage.keys():
+            entered.set()
+            release.wait(5)
+        return ok('body %d' % clock.now,
+                  cache_control='max-age=10, stale-while-revalidate=30')
+
+    app = Mapper()
+    app.add_wrapper(cache)
+    app.add('/slow', slow)
+    client = TestClient(app.wsgi)
+    client.get('/slow')
+    clock.now += 15
+    results = []
+    t = threading.Thread(target=lambda: results.append(client.get('/slow')))
+    t.start()
+    entered.wait(5)
+    assert client.get('/slow').body == 'body 1000'
+    release.set()
+    t.join()
+    assert results[0].body == 'body 1015'
+
+
+def test_handler_cache():
+    clock = Clock()
+    cache = HandlerCache(ttl=60, clock=clock)
+    calls = []
+
+    @get(produces=json_repr)
+    @cache.cached(query=['year'])
+    def report(request, region, ctx):
+        assert ctx is not None
+        calls.append(region)
+        return {'region': region, 'year': request.query.get('year')}
+
+    app = Mapper()
+    app.add('/reports/{region}', report)
+    client = TestClient(app.wsgi)
+    for i in range(2):
+        res = client.get('/reports/emea', {'QUERY_STRING': 'year=2015'})
+        assert json.loads(res.body) == {'region': 'emea', 'year': '2015'}
+        assert res.headers['Content-Type'] == 'application/json'
+    client.get('/reports/emea', {'QUERY_STRING': 'year=2016&x=1'})
+    client.get('/reports/emea', {'QUERY_STRING': 'year=2016&x=2'})
+    client.get('/reports/apac')
+    assert calls == ['emea', 'emea', 'apac']
+    assert cache.stats() == (2, 3, 3, 0)
+
+    assert report.invalidate('emea') == 2
+    client.get('/reports/emea', {'QUERY_STRING': 'year=2015'})
+    assert len(calls) == 4
+    clock.now += 60
+    client.get('/reports/apac')
+    assert len(calls) == 5
+
+
+def test_handler_cache_responses():
+    cache = HandlerCache(max_entries=2, max_bytes=100)
+    calls = []
+    res = Resource()
+
+    @res.get(provides='text/csv')
+    @cache.cached(name='page')
+    def page(request, n):
+        calls.append(n)
+        if n == '0':
+            return ok('not cached', code=201)
+        return ok('x' * int(n) * 40, x_page=n)
+
+    app = Mapper()
+    app.add('/{n}', res)
+    client = TestClient(app.wsgi)
+    for n in ('0', '1', '2', '0', '1', '2'):
+        client.get('/' + n)
+    assert calls == ['0', '1', '2', '0', '1', '2']  # byte budget exceeded
+    response = client.get('/2')
+    assert response.headers['X-Page'] == '2'
+    assert response.headers['Content-Type'] == 'text/csv'
+    assert calls[-1] == '2' and len(calls) == 6
+    assert cache.invalidate('page') == 1
+    assert cache.stats().entries == 0
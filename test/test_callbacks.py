@@ -61,6 +61,27 @@ def test_callbacks():
     ])
 
 
+def test_callbacks_provided_validators():
+    resource = Resource(etag=lambda request: 'x')
+    resource.get(lambda request: ok('test'))
+    wrapper = Wrapper(resource)
+
+    app = Mapper()
+    app.add('/', wrapper)
+
+    client = TestClient(app.wsgi)
+    res = client.get('/', if_none_match='"x"')
+    assert res.code == 304
+
+    wrapper.cb.assert_has_calls([
+        call('enter', wrapper.request),
+        call('leave', wrapper.request, wrapper.response),
+        call('finalize', wrapper.request, wrapper.response),
+        call('teardown'),
+        call('close'),
+    ])
+
+
 def test_callbacks_exception():
     not_found = NotFound()
 
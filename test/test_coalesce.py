@@ -0,0 +1,145 @@
+import threading
+import time
+
+from rhino.coalesce import Coalescer
+from rhino.mapper import Mapper
+from rhino.resource import get
+from rhino.response import ok
+from rhino.test import TestClient
+
+
+def run_concurrently(client, paths, **kw):
+    results = [None] * len(paths)
+
+    def request(i):
+        results[i] = client.get(paths[i], **kw)
+
+    threads = [threading.Thread(target=request, args=(i,))
+               for i in range(len(paths))]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def make_app(coalescer, release, **headers):
+    calls = []
+    entered = threading.Event()
+
+    def slow(request):
+        calls.append(request.path_info)
+        entered.set()
+        release.wait(5)
+        return ok('result %d' % len(calls), **headers)
+
+    app = Mapper()
+    app.add_wrapper(coalescer)
+    app.add('/slow', slow)
+    app.add('/other', slow)
+    return app, calls, entered
+
+
+def test_coalesce():
+    coalescer = Coalescer()
+    release = threading.Event()
+    app, calls, entered = make_app(coalescer, release)
+    client = TestClient(app.wsgi)
+    leader, results = run_concurrently(client, ['/slow'])
+    entered.wait(5)
+    followers, results2 = run_concurrently(client, ['/slow'] * 3 + ['/other'])
+    time.sleep(0.1)  # Let the followers start waiting
+    release.set()
+    for t in leader + followers:
+        t.join()
+    assert sorted(calls) == ['/other', '/slow']
+    bodies = [r.body for r in results + results2[:3]]
+    assert len(set(bodies)) == 1
+    assert results2[0].headers['Content-Type'] == 'text/plain; charset=utf-8'
+    assert coalescer.stats() == (2, 3, 0)
+
+
+def run_pair(coalescer, request_headers=None, **headers):
+    request_headers = request_headers or {}
+    release = threading.Event()
+    app, calls, entered = make_app(coalescer, release, **headers)
+    client = TestClient(app.wsgi)
+    leader, results = run_concurrently(client, ['/slow'], **request_headers)
+    entered.wait(5)
+    followers, results2 = run_concurrently(client, ['/slow'],
+                                           **request_headers)
+    time.sleep(0.1)
+    release.set()
+    for t in leader + followers:
+        t.join()
+    return calls
+
+
+def test_not_shared():
+    for headers in ({'set_cookie': 'a=b'}, {'cache_control': 'private'},
+                    {'cache_control': 'no-store'}):
+        coalescer = Coalescer()
+        assert run_pair(coalescer, **headers) == ['/slow', '/slow']
+        assert coalescer.stats() == (1, 0, 0)
+
+
+def test_credentials():
+    for request_headers in ({'cookie': 'session=1'},
+                            {'authorization': 'Basic dTpw'}):
+        coalescer = Coalescer()
+        calls = run_pair(coalescer, request_headers)
+        assert calls == ['/slow', '/slow']
+        assert coalescer.stats() == (0, 0, 0)
+
+    coalescer = Coalescer(headers=['Cookie'])
+    assert run_pair(coalescer, {'cookie': 'session=1'}) == ['/slow']
+    assert coalescer.stats() == (1, 1, 0)
+
+
+def test_default_content_type():
+    coalescer = Coalescer()
+    release = threading.Event()
+    app, calls, entered = make_app(coalescer, release)
+    app.default_content_type = 'application/json'
+    client = TestClient(app.wsgi)
+    leader, results = run_concurrently(client, ['/slow'])
+    entered.wait(5)
+    followers, results2 = run_concurrently(client, ['/slow'] * 2)
+    time.sleep(0.1)
+    release.set()
+    for t in leader + followers:
+        t.join()
+    assert coalescer.stats() == (1, 2, 0)
+    assert [r.headers['Content-Type'] for r in results + results2] \
+            == ['application/json'] * 3
+
+
+def test_timeout():
+    coalescer = Coalescer(headers=['Accept'], timeout=0.01)
+    release = threading.Event()
+    app, calls, entered = make_app(coalescer, release)
+    client = TestClient(app.wsgi)
+    leader, results = run_concurrently(client, ['/slow'])
+    entered.wait(5)
+    followers, results2 = run_concurrently(client, ['/slow'])
+    deadline = time.time() + 5
+    while coalescer.stats().timeouts < 1 and time.time() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for t in leader + followers:
+        t.join()
+    assert len(calls) == 2
+    assert coalescer.stats() == (1, 0, 1)
+
+
+def test_route_target():
+    coalescer = Coalescer()
+
+    @get
+    def handler(request):
+        return ok('x')
+
+    app = Mapper()
+    app.add('/a', coalescer(handler), name='a')
+    client = TestClient(app.wsgi)
+    assert client.get('/a').body == 'x'
+    assert client.post('/a', {}).code == 405
+    assert coalescer.leaders == 1
@@ -0,0 +1,186 @@
+import zlib
+
+from rhino.compression import Compression, _compress_iter
+from rhino.mapper import Mapper
+from rhino.resource import Resource
+from rhino.response import ok
+from rhino.test import TestClient
+from rhino.util import sse_event
+
+text = 'hello, world! ' * 100
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def make_client(**kw):
+    app = Mapper()
+    app.add_wrapper(Compression(**kw))
+    app.add('/text', lambda request: ok(text, etag='abc'))
+    app.add('/small', lambda request: ok('small'))
+    app.add('/image', lambda request: ok(text, content_type='image/png'))
+    app.add('/deferred', lambda request: ok(lambda: text, etag='abc'))
+    app.add('/encoded', lambda request: ok(text, content_encoding='br'))
+    app.add('/small-deferred', lambda request: ok(lambda: 'small', etag='abc'))
+    return TestClient(app.wsgi)
+
+
+def test_gzip():
+    client = make_client()
+    res = client.get('/text', accept_encoding='gzip, deflate')
+    assert res.code == 200
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert res.headers['ETag'] == 'W/"abc-gzip"'
+    assert res.headers['Content-Length'] == str(len(res.body))
+    assert len(res.body) < len(text)
+    assert gunzip(res.body) == text
+
+
+def test_deflate():
+    client = make_client()
+    res = client.get('/deferred', accept_encoding='gzip;q=0.5, deflate')
+    assert res.headers['Content-Encoding'] == 'deflate'
+    assert res.headers['ETag'] == 'W/"abc-deflate"'
+    assert zlib.decompress(res.body) == text
+
+
+def test_no_compression():
+    client = make_client()
+    res = client.get('/text')
+    assert 'Content-Encoding' not in res.headers
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert res.headers['ETag'] == '"abc"'
+    assert res.body == text
+
+    res = client.get('/text', accept_encoding='gzip;q=0, identity')
+    assert 'Content-Encoding' not in res.headers
+
+    for path in ('/small', '/image', '/encoded'):
+        res = client.get(path, accept_encoding='gzip')
+        assert res.headers.get('Content-Encoding') in (None, 'br')
+        assert res.body in (text, 'small')
+    assert 'Vary' not in client.get('/image', accept_encoding='gzip').headers
+
+    res = client.get('/small-deferred', accept_encoding='gzip')
+    assert 'Content-Encoding' not in res.headers
+    assert res.headers['ETag'] == '"abc"'
+    assert res.body == 'small'
+
+
+def test_conditional_and_head():
+    client = make_client()
+    res = client.get('/text', accept_encoding='gzip',
+                     if_none_match='W/"abc-gzip"')
+    assert res.code == 304
+    assert res.body == ''
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert 'Content-Encoding' not in res.headers
+
+    res = client.get('/text', accept_encoding='gzip', if_none_match='"abc"')
+    assert res.code == 200
+
+    res = client.head('/text', accept_encoding='gzip')
+    assert res.code == 200
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.headers['ETag'] == 'W/"abc-gzip"'
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert 'Content-Length' not in res.headers
+    assert res.body == ''
+
+    res = client.head('/text')
+    assert 'Content-Encoding' not in res.headers
+    assert res.headers['ETag'] == '"abc"'
+    assert res.headers['Content-Length'] == str(len(text))
+
+
+def test_streaming():
+    events = []
+
+    def stream(request):
+        def body():
+            for data in ('a', 'b'):
+                yield sse_event(data=data)
+                events.append(data)
+        return ok(body(), content_type='text/event-stream')
+
+    app = Mapper()
+    app.add_wrapper(Compression())
+    app.add('/', stream)
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/',
+               'HTTP_ACCEPT_ENCODING': 'gzip'}
+    app_iter = app.wsgi(environ, lambda status, headers: None)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Every chunk can be decompressed on its own as soon as it is received.
+    assert decompressor.decompress(next(app_iter)) == 'data: a\n\n'
+    assert events == []
+    assert decompressor.decompress(next(app_iter)) == 'data: b\n\n'
+    rest = ''.join(app_iter)
+    app_iter.close()
+    assert decompressor.decompress(rest) + decompressor.flush() == ''
+
+
+def test_streaming_close():
+    closed = []
+
+    def body():
+        try:
+            while True:
+                yield 'chunk'
+        finally:
+            closed.append(True)
+
+    chunks = _compress_iter(body(), zlib.compressobj())
+    next(chunks)
+    chunks.close()
+    assert closed == [True]
+
+
+def test_auto_etag():
+    app = Mapper()
+    app.auto_etag = True
+    app.add_wrapper(Compression())
+    app.add('/text', lambda request: ok(text))
+    client = TestClient(app.wsgi)
+
+    res = client.get('/text')
+    etag = res.headers['ETag']
+    assert not etag.startswith('W/')
+    res = client.get('/text', accept_encoding='gzip')
+    gzip_etag = res.headers['ETag']
+    assert gzip_etag == 'W/%s-gzip"' % etag[:-1]
+
+    res = client.get('/text', accept_encoding='gzip', if_none_match=gzip_etag)
+    assert res.status == '304 Not Modified'
+    res = client.get('/text', accept_encoding='gzip', if_none_match=etag)
+    assert res.status == '200 OK'
+    res = client.get('/text', if_none_match=etag)
+    assert res.status == '304 Not Modified'
+
+
+def test_provider_validators():
+    calls = []
+    resource = Resource(etag=lambda request: 'x')
+
+    @resource.get
+    def handler(request):
+        calls.append(1)
+        return ok(text)
+
+    app = Mapper()
+    app.add_wrapper(Compression())
+    app.add('/', resource)
+    client = TestClient(app.wsgi)
+
+    res = client.get('/', accept_encoding='gzip', if_none_match='"x"')
+    assert res.code == 304
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert res.headers['ETag'] == '"x"'
+    assert calls == []
+
+    # Variant ETags are matched after the handler has run.
+    res = client.get('/', accept_encoding='gzip', if_none_match='W/"x-gzip"')
+    assert res.code == 304
+    assert res.headers['Vary'] == 'Accept-Encoding'
+    assert calls == [1]
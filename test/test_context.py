@@ -124,3 +124,53 @@ def test_wrapper_access_to_ctx_config():
     mapper.add('/', lambda _: ok())
     res = mapper(Request({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}))
     assert res.code == 200
+
+
+def test_callbacks_allocated_on_demand():
+    ctx1, ctx2 = Context(), Context()
+    assert ctx1._Context__callbacks is ctx2._Context__callbacks
+    ctx1._run_callbacks('enter')
+    ctx1.add_callback('leave', lambda: None)
+    assert ctx1._Context__callbacks is not ctx2._Context__callbacks
+    assert ctx2._Context__callbacks == {}
+
+
+def test_no_instance_dict():
+    ctx = Context()
+    assert not hasattr(ctx, '__dict__') or not ctx.__dict__
+    ctx.some_attribute = 1
+    assert ctx.some_attribute == 1
+
+
+def test_per_request_allocations():
+    import gc
+    mapper = Mapper()
+    mapper.add('/{name}', lambda request: ok('hello'))
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/test'}
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def in_flight_objects(n):
+        # gc-tracked objects alive while n requests are in flight
+        environs = [dict(environ) for i in range(n)]
+        gc.collect()
+        gc.disable()
+        try:
+            before = len(gc.get_objects())
+            in_flight = [mapper.wsgi(e, start_response) for e in environs]
+            count = len(gc.get_objects()) - before
+        finally:
+            gc.enable()
+        for app_iter in in_flight:
+            app_iter.close()
+        return count
+
+    in_flight_objects(100)  # Warm up caches (status lines, regexes, ...)
+    # The difference cancels out constant overhead, like the list itself.
+    n = 100
+    objects_per_request = (in_flight_objects(2 * n) - in_flight_objects(n)) \
+            / float(n)
+    # Number of gc-tracked objects held by an in-flight request. Update this
+    # consciously when adding per-request state.
+    assert objects_per_request <= 16
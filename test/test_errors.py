@@ -0,0 +1,116 @@
+import json
+
+from rhino.errors import ErrorResponses, NotFound, MethodNotAllowed, \
+        BadRequest, Found, ClientError, html_template, render_html
+from rhino.mapper import Mapper
+from rhino.test import TestClient
+
+
+def make_client(error_responses=None):
+    app = Mapper()
+    app.error_responses = error_responses
+
+    def fail(request):
+        kind = request.routing_args['kind']
+        if kind == 'message':
+            raise BadRequest('<Invalid> input')
+        elif kind == 'redirect':
+            raise Found('/elsewhere')
+        elif kind == 'modified':
+            e = NotFound()
+            e.response.headers['X-Modified'] = '1'
+            raise e
+        elif kind == 'crash':
+            raise ValueError
+        raise MethodNotAllowed('GET, PUT')
+
+    app.add('/{kind}', fail)
+    return TestClient(app.wsgi)
+
+
+def test_default_response():
+    e = NotFound()
+    assert e._response is None
+    assert e.response is e.response
+    assert e.response.headers['Content-Type'] == 'text/html'
+    assert 'The requested resource could not be found.' in e.response.body
+    assert render_html(404, NotFound.message) is e.response.body
+
+    e = MethodNotAllowed('GET')
+    assert e.response.headers['Allow'] == 'GET'
+    assert e.response.code == 405
+
+
+def test_message_escaped():
+    res = make_client().get('/message')
+    assert res.code == 400
+    assert '&lt;Invalid&gt; input' in res.body
+
+
+def test_error_responses():
+    client = make_client(ErrorResponses())
+    res = client.get('/x')
+    assert res.code == 405
+    assert res.headers['Content-Type'] == 'text/html'
+    assert res.headers['Vary'] == 'Accept'
+    assert res.headers['Allow'] == 'GET, PUT'
+    assert res.body == html_template % {
+        'code': 405, 'status': 'Method Not Allowed',
+        'message': MethodNotAllowed.message, 'details': ''}
+
+    res = client.get('/x', accept='application/json')
+    assert res.headers['Content-Type'] == 'application/json'
+    assert res.headers['Allow'] == 'GET, PUT'
+    assert json.loads(res.body) == {
+        'code': 405, 'status': 'Method Not Allowed',
+        'message': MethodNotAllowed.message}
+
+    res = client.get('/crash', accept='application/json')
+    assert res.code == 500
+    assert json.loads(res.body)['code'] == 500
+
+
+def test_error_responses_fallback():
+    client = make_client(ErrorResponses())
+    res = client.get('/message', accept='application/json')
+    assert res.headers['Content-Type'] == 'text/html'
+    assert '&lt;Invalid&gt; input' in res.body
+    res = client.get('/redirect', accept='application/json')
+    assert res.code == 302
+    assert res.headers['Location'].endswith('/elsewhere')
+    res = client.get('/modified')
+    assert res.headers['X-Modified'] == '1'
+
+
+def test_error_responses_register():
+    errors = ErrorResponses(media_types=['application/json'])
+    errors.register(ClientError, 'application/json', '{"error": true}')
+    errors.register(ClientError, 'text/plain', 'error')
+    client = make_client(errors)
+    res = client.get('/x')
+    assert res.body == '{"error": true}'
+    res = client.get('/x', accept='text/plain')
+    assert res.body == 'error'
+    assert res.headers['Content-Type'] == 'text/plain'
+    res = client.get('/crash', accept='text/plain')
+    assert res.headers['Content-Type'] == 'text/html'
+
+
+def test_exception_without_super_init():
+    class Teapot(ClientError):
+        code = 418
+        message = 'I am a teapot.'
+
+        def __init__(self, kind):
+            self.kind = kind
+
+    def brew(request):
+        raise Teapot('earl grey')
+
+    for error_responses in (None, ErrorResponses()):
+        app = Mapper()
+        app.error_responses = error_responses
+        app.add('/', brew)
+        res = TestClient(app.wsgi).get('/')
+        assert res.code == 418
+        assert 'I am a teapot.' in res.body
@@ -1,8 +1,11 @@
+import time
+from Cookie import SimpleCookie, CookieError
 from datetime import datetime, timedelta
 
+from mock import patch
 from pytest import raises as assert_raises
 from rhino.http import datetime_to_httpdate, match_etag, total_seconds, \
-        cache_control
+        cache_control, format_cookie, parse_cookie_header
 
 
 def test_datetime_to_httpdate():
@@ -47,3 +50,36 @@ def test_cache_control():
         must_revalidate=True, proxy_revalidate=True, no_cache=True,
         no_store=True) == 'public, max-age=60, s-maxage=120, no-cache, no-store, must-revalidate, proxy-revalidate'
     assert cache_control(max_age=timedelta(hours=2), s_maxage=timedelta(hours=1)) == 'max-age=7200, s-maxage=3600'
+
+
+def test_parse_cookie_header():
+    assert parse_cookie_header('') == {}
+    assert parse_cookie_header(' a = 1 ;b=;c="x;y') == \
+            {'a': '1', 'b': '', 'c': '"x'}
+
+
+def test_format_cookie_matches_simplecookie():
+    def simple_cookie(key, value, **attrs):
+        m = SimpleCookie({key: value})[key]
+        for k, v in attrs.items():
+            if v is not None:
+                m[k.replace('_', '-')] = v
+        return m.OutputString()
+
+    cases = [
+        ('foo', 'bar', {}),
+        ('foo', '', {'max_age': 0, 'path': '/', 'domain': 'example.net'}),
+        ('a', 'Sm\xc3\xb8rebr\xc3\xb8d', {'secure': True, 'httponly': True}),
+        ('a', 'with "quotes"; and \\ backslash', {'path': '/x y'}),
+        ('a', 'b', {'expires': 3600, 'max_age': 3600, 'path': ''}),
+    ]
+    with patch.object(time, 'time') as mock_time:
+        mock_time.return_value = 1.0
+        for key, value, attrs in cases:
+            assert format_cookie(key, value, **attrs) == \
+                    simple_cookie(key, value, **attrs)
+
+
+def test_format_cookie_invalid_key():
+    assert_raises(CookieError, format_cookie, 'path', 'x')
+    assert_raises(CookieError, format_cookie, 'a b', 'x')
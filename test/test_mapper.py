@@ -3,7 +3,8 @@ import unittest
 
 from rhino.mapper import Mapper, template2regex, template2path, \
         InvalidArgumentError, InvalidTemplateError
-from rhino.response import Response
+from rhino.response import Response, response
+from rhino.test import TestClient
 
 # Dispatcher and template2regex tests taken from Joe Gregorio's
 # wsgidispatcher.py (https://code.google.com/p/robaccia/) with minor
@@ -242,3 +243,62 @@ def test_path():
     app.add('/', fn, 'test')
     assert app.path('test', {}, []) == '/'
     assert app.path(fn, {}, []) == '/'
+
+
+def test_wsgi_304_closes_body():
+    closed = []
+    def generate():
+        try:
+            yield 'data'
+        finally:
+            closed.append(True)
+    def handler(request):
+        gen = generate()
+        next(gen)
+        return response(200, body=gen, etag='1')
+    app = Mapper()
+    app.add('/', handler)
+    client = TestClient(app.wsgi)
+    res = client.get('/', if_none_match='"1"')
+    assert res.status == "304 Not Modified"
+    assert closed
+
+
+def test_auto_etag():
+    import mock
+    from rhino.http import crc32_etag
+    from rhino.resource import Resource
+    from rhino.representations import json_repr
+    lazy = mock.Mock(return_value='lazy')
+    app = Mapper()
+    app.auto_etag = True
+    app.add('/text', lambda request: response(200, u'caf\xe9'))
+    app.add('/tagged', lambda request: response(200, 'text', etag='x'))
+    app.add('/lazy', lambda request: response(200, lazy))
+    app.add('/gen', lambda request: response(200, iter(['x'])))
+    app.add('/error', lambda request: response(404, 'nope'))
+    json_resource = Resource()
+    json_resource.get(produces=json_repr)(lambda request: {'a': 1})
+    app.add('/json', json_resource)
+    client = TestClient(app.wsgi)
+
+    res = client.get('/text')
+    etag = '"%s"' % crc32_etag(u'caf\xe9'.encode('utf-8'))
+    assert res.headers['ETag'] == etag
+    res = client.get('/text', if_none_match=etag)
+    assert res.status == "304 Not Modified"
+    assert res.body == ''
+    assert client.head('/text').headers['ETag'] == etag
+
+    assert client.get('/tagged').headers['ETag'] == '"x"'
+    assert 'ETag' not in client.get('/lazy').headers
+    assert 'ETag' not in client.get('/gen').headers
+    assert 'ETag' not in client.get('/error').headers
+
+    res = client.get('/json')
+    assert res.headers['ETag'] == '"%s"' % crc32_etag(res.body)
+    assert 'ETag' not in client.head('/json').headers
+    assert client.post('/text', {}).headers.get('ETag') is None
+
+    app.etag_function = lambda body: 'custom'
+    assert client.get('/text').headers['ETag'] == '"custom"'
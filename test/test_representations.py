@@ -1,9 +1,15 @@
+import json
 from StringIO import StringIO
 
+from pytest import raises as assert_raises
+
 from rhino.mapper import Context
 from rhino.request import Request
 from rhino.resource import Resource, get, put, post
 from rhino.errors import BadRequest
+from rhino.representations import iter_json_items, iter_ndjson_batches, \
+        ingest_ndjson
+import rhino.representations
 
 
 class json_repr(object):
@@ -102,3 +108,122 @@ def test_repr_context():
     }), ctx)
     assert response.body == 'serialize(deserialize(ok, %(id)s), %(id)s)' \
             % {'id': id(ctx)}
+
+
+def test_json_repr():
+
+    @post(consumes=rhino.representations.json_repr,
+          produces=rhino.representations.json_repr)
+    def post_data(request):
+        return {'received': request.body}
+
+    r = Resource(post_data)
+    body = '{"a": [1, 2]}'
+    response = r(Request({
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': StringIO(body),
+    }), Context())
+    assert response.headers['Content-Type'] == 'application/json'
+    assert response.body == '{"received": {"a": [1, 2]}}'
+
+    request = Request({
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': '1',
+        'wsgi.input': StringIO('{'),
+    })
+    assert_raises(BadRequest, r, request, Context())
+
+
+def test_json_items_repr():
+
+    @post(consumes=rhino.representations.json_items_repr)
+    def post_data(request):
+        return repr(list(request.body))
+
+    r = Resource(post_data)
+
+    def make_request(body):
+        return Request({
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': StringIO(body),
+        })
+
+    response = r(make_request(' [1, {"a": "b"}, "c" ] '), Context())
+    assert response.body == "[1, {u'a': u'b'}, u'c']"
+    response = r(make_request('[]'), Context())
+    assert response.body == "[]"
+    for body in ['{}', '[1 2]', '[1, 2', '[1]x', '[1, ]']:
+        assert_raises(BadRequest, r, make_request(body), Context())
+
+
+def test_iter_json_items_chunked():
+
+    items = [12345, u'\u2603 snowman', {'a': [1.5, None, True]}, 'x' * 50]
+    body = json.dumps(items)
+    for chunk_size in (1, 2, 3, 7, 64):
+        assert list(iter_json_items(StringIO(body), chunk_size)) == items
+
+
+def test_iter_json_items_is_lazy():
+
+    class CountingFile(object):
+        def __init__(self, data):
+            self.f = StringIO(data)
+            self.bytes_read = 0
+
+        def read(self, size):
+            chunk = self.f.read(size)
+            self.bytes_read += len(chunk)
+            return chunk
+
+    f = CountingFile('[' + ', '.join(['1000'] * 10000) + ']')
+    items = iter_json_items(f, chunk_size=100)
+    assert next(items) == 1000
+    assert f.bytes_read < 200
+
+    # Invalid input is not read to the end
+    f = CountingFile('[1, x' + ' ' * 10000 + ']')
+    assert_raises(ValueError, list, iter_json_items(f, chunk_size=100))
+    assert f.bytes_read < 200
+    f = CountingFile('[1, "' + 'x' * 100000 + '"]')
+    items = iter_json_items(f, chunk_size=100, max_value_size=1000)
+    assert_raises(ValueError, list, items)
+    assert f.bytes_read < 3000
+
+
+def test_iter_ndjson_batches():
+    body = '{"a": 1}\n\n[2]\n3\n"four"\n5'
+    batches = list(iter_ndjson_batches(StringIO(body), batch_size=2))
+    assert batches == [[{'a': 1}, [2]], [3, 'four'], [5]]
+
+    # Byte budget: '{"a": 1}\n' is 9 bytes, '[2]\n' is 4 bytes, ...
+    batches = list(iter_ndjson_batches(StringIO(body), max_bytes=13))
+    assert batches == [[{'a': 1}, [2]], [3, 'four', 5]]
+    batches = list(iter_ndjson_batches(StringIO(body), max_bytes=1))
+    assert batches == [[{'a': 1}], [[2]], [3], ['four'], [5]]
+
+    assert_raises(ValueError, list, iter_ndjson_batches(StringIO('1\nx\n')))
+    assert_raises(ValueError, list, iter_ndjson_batches(StringIO('1'), 0))
+
+
+def test_ingest_ndjson():
+    body = '1\n2\n{"x"\n3\n'
+    request = Request({
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/x-ndjson',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': StringIO(body),
+    })
+    received = []
+    summary = ingest_ndjson(request.input, received.append, batch_size=2)
+    assert received == [[1, 2], [3]]
+    assert summary.records == 3
+    assert summary.batches == 2
+    assert len(summary.errors) == 1
+    assert summary.errors[0].lineno == 3
+    assert summary.errors[0].line == '{"x"\n'
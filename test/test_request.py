@@ -5,7 +5,7 @@ from wsgiref.util import setup_testing_defaults
 import rhino
 from mock import patch
 from pytest import fixture, raises as assert_raises
-from rhino.request import Request, QueryDict, WsgiInput
+from rhino.request import Request, QueryDict, RequestCookies, WsgiInput
 
 body = 'x=1&x=2&%E2%98%85=%E2%98%83'
 body_multipart = u'''--xxx
@@ -213,6 +213,26 @@ def test_querydict_type():
     assert q.get('b', default='x', type=int) == 'x'
 
 
+def test_request_cookies():
+    c = RequestCookies('x="\\342\\230\\203"; a=b; $Path=/; a=c; junk')
+    assert c['x'] == u'☃'
+    assert c[u'a'] == u'b'
+    assert 'a' in c
+    assert u'x' in c
+    assert 'junk' not in c
+    assert sorted(c) == [u'a', u'x']
+    assert len(c) == 2
+    assert c == {u'x': u'☃', u'a': u'b'}
+    assert c.get('missing') is None
+    assert RequestCookies(None) == {}
+
+
+def test_request_cookies_lazy():
+    c = RequestCookies('a=1; bad="\\377"')
+    assert c['a'] == u'1'
+    assert_raises(UnicodeDecodeError, lambda: c['bad'])
+
+
 def test_file_upload(environ_multipart):
     req = Request(environ_multipart)
     assert set(req.form.keys()) == set([u'★', u'★★'])
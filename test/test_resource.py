@@ -195,3 +195,137 @@ def test_resource_from_url():
     ctx = Context()
     resource2(req, ctx)
     assert resource2.args == (3, 4)
+
+
+def test_resource_validator_providers():
+    import mock
+    from rhino.representations import json_repr
+    from rhino.response import datetime_to_httpdate
+
+    calls = []
+    resource = Resource(last_modified=lambda request, id: 1000000000)
+
+    @resource.get(produces=json_repr, etag=lambda request, ctx, id: 7)
+    def show(request, id):
+        calls.append(id)
+        return {'id': id}
+
+    @resource.get(provides='text/plain')
+    def show_text(request, id):
+        calls.append(id)
+        return ok('text')
+
+    def call(**environ):
+        environ.setdefault('REQUEST_METHOD', 'GET')
+        req = Request(environ)
+        req.routing_args.update({'id': '1'})
+        return resource(req, Context())
+
+    res = call(HTTP_ACCEPT='application/json')
+    assert calls == ['1']
+    assert res.headers['ETag'] == '"7"'
+    assert res.headers['Last-Modified'] == datetime_to_httpdate(1000000000)
+    assert res.headers['Vary'] == 'Accept'
+
+    res = call(HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH='"7"')
+    assert res.code == 304
+    assert res.headers['ETag'] == '"7"'
+    assert res.headers['Vary'] == 'Accept'
+    assert calls == ['1']
+
+    res = call(HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH='"6"',
+               HTTP_IF_MODIFIED_SINCE=datetime_to_httpdate(1000000000))
+    assert res.code == 200
+    assert calls == ['1', '1']
+
+    res = call(HTTP_ACCEPT='text/plain',
+               HTTP_IF_MODIFIED_SINCE=datetime_to_httpdate(1000000000))
+    assert res.code == 304
+    assert 'ETag' not in res.headers
+    res = call(REQUEST_METHOD='HEAD', HTTP_ACCEPT='text/plain',
+               HTTP_IF_MODIFIED_SINCE=datetime_to_httpdate(1000000000))
+    assert res.code == 304
+    assert calls == ['1', '1']
+
+    # Validators set by the handler take precedence.
+    tagged = Resource(etag=lambda request: 'provided')
+    tagged.get(lambda request: ok('x', etag='handler'))
+    res = tagged(Request({'REQUEST_METHOD': 'GET'}), Context())
+    assert res.headers['ETag'] == '"handler"'
+
+    # Providers are not called for other methods, or when they return None.
+    provider = mock.Mock(return_value=None)
+    untagged = Resource(etag=provider)
+    untagged.post(lambda request: ok('x'))
+    untagged.get(lambda request: ok('x'))
+    res = untagged(Request({'REQUEST_METHOD': 'POST'}), Context())
+    assert not provider.called
+    res = untagged(Request({'REQUEST_METHOD': 'GET',
+                            'HTTP_IF_NONE_MATCH': '*'}), Context())
+    assert provider.called
+    assert res.code == 200
+    assert 'ETag' not in res.headers
+
+
+def test_resource_preconditions():
+    from rhino.errors import PreconditionFailed
+    from rhino.resource import preconditions_met
+    from rhino.response import datetime_to_httpdate
+
+    versions = {'1': 3}
+    calls = []
+    resource = Resource(
+            etag=lambda request, id: versions.get(id),
+            last_modified=lambda request, id:
+                1000000000 if id in versions else None)
+
+    @resource.put
+    @resource.delete
+    def update(request, id):
+        calls.append(request.method)
+        return ok('updated', etag='new')
+
+    def call(method, id='1', **environ):
+        environ['REQUEST_METHOD'] = method
+        req = Request(environ)
+        req.routing_args.update({'id': id})
+        return resource(req, Context())
+
+    assert_raises(PreconditionFailed, call, 'PUT', HTTP_IF_MATCH='"2"')
+    assert_raises(PreconditionFailed, call, 'PUT', HTTP_IF_MATCH='W/"3"')
+    assert_raises(PreconditionFailed, call, 'PUT', id='2', HTTP_IF_MATCH='*')
+    assert_raises(PreconditionFailed, call, 'DELETE',
+                  HTTP_IF_UNMODIFIED_SINCE=datetime_to_httpdate(999999999))
+    assert calls == []
+
+    res = call('PUT', HTTP_IF_MATCH='"2", "3"')
+    assert res.headers['ETag'] == '"new"'
+    assert 'Last-Modified' not in res.headers
+    call('PUT', HTTP_IF_MATCH='*')
+    call('DELETE', HTTP_IF_UNMODIFIED_SINCE=datetime_to_httpdate(1000000000))
+    call('DELETE', HTTP_IF_UNMODIFIED_SINCE='invalid')
+    call('PUT')
+    assert calls == ['PUT', 'PUT', 'DELETE', 'DELETE', 'PUT']
+
+    # If-Match takes precedence over If-Unmodified-Since.
+    req = Request({'HTTP_IF_MATCH': '"a"',
+                   'HTTP_IF_UNMODIFIED_SINCE': datetime_to_httpdate(0)})
+    assert preconditions_met(req, '"a"', datetime_to_httpdate(1))
+    assert not preconditions_met(Request({'HTTP_IF_MATCH': '"a"'}))
+    assert preconditions_met(Request({}))
+
+
+def test_resource_if_match_any():
+    from rhino.errors import PreconditionFailed
+
+    resource = Resource(last_modified=lambda request, id:
+                        1000000000 if id == '1' else None)
+    resource.put(lambda request, id: ok('updated'))
+
+    def call(id):
+        req = Request({'REQUEST_METHOD': 'PUT', 'HTTP_IF_MATCH': '*'})
+        req.routing_args.update({'id': id})
+        return resource(req, Context())
+
+    assert call('1').body == 'updated'
+    assert_raises(PreconditionFailed, call, '2')
@@ -1,14 +1,16 @@
 # encoding: utf-8
 import time
+import zlib
 from datetime import datetime, timedelta
 from wsgiref.util import setup_testing_defaults
 
 import mock
 from mock import patch
 from pytest import raises as assert_raises
-from rhino.response import Entity, Response, \
-        response, ok, created, no_content, redirect, \
-        datetime_to_httpdate
+from rhino.response import (
+        Entity, Response, ResponseHeaders, FrozenResponse, FLUSH,
+        coalesce_chunks, per_request, response, ok, created, no_content,
+        redirect, datetime_to_httpdate)
 from rhino.request import Request
 
 
@@ -144,6 +146,33 @@ def test_headers():
     assert body == u'☃'.encode('utf-8')
 
 
+def test_response_headers_compatible():
+    from wsgiref.headers import Headers
+
+    def apply(h):
+        h.add_header('X-Foo', 'a')
+        h.add_header('x-foo', 'b')
+        h.add_header('Content-Disposition', 'attachment', filename='a b.txt')
+        h.add_header('X-Flag', None, flag=None)
+        h.add_header('X-Empty', None)
+        h['Content-Type'] = 'text/plain'
+        h['CONTENT-TYPE'] = 'text/html'
+        h.setdefault('X-Foo', 'c')
+        h.setdefault('X-Bar', 'd')
+        del h['x-bar']
+        del h['X-Missing']
+        h['X-Bar'] = 'e'
+        return [
+            h.items(), h.keys(), h.values(), len(h), str(h),
+            h.get_all('X-FOO'), h.get_all('X-Missing'),
+            h['x-foo'], h.get('X-Missing'), h.get('X-Missing', 1),
+            'content-type' in h, 'X-Missing' in h,
+        ]
+
+    assert apply(ResponseHeaders()) == apply(Headers([]))
+    assert ResponseHeaders([('A', '1'), ('a', '2')]).get_all('A') == ['1', '2']
+
+
 def test_location_is_absolute():
     environ = {}
     setup_testing_defaults(environ)
@@ -433,3 +462,229 @@ def test_add_header():
     res = Response(200, headers=[('X-Foo', 'bar')])
     res.headers.add('X-Foo', 'baz')
     assert res.headers.items() == [('X-Foo', 'bar'), ('X-Foo', 'baz')]
+
+
+def test_file_body():
+    from StringIO import StringIO
+    f = StringIO('x' * 10)
+    callback = mock.Mock()
+    res = Response(200, body=f)
+    res.add_callback(callback)
+    status, headers, body = wsgi_response(res)
+    assert body == 'x' * 10
+    assert f.closed
+    assert callback.called
+
+
+def test_file_body_file_wrapper(tmpdir):
+    from wsgiref.util import FileWrapper
+    path = tmpdir.join('file.txt')
+    path.write('0123456789')
+    f = open(str(path), 'rb')
+    f.read(2)
+    callback = mock.Mock()
+    res = Response(200, body=f)
+    res.add_callback(callback)
+    status, headers, body = wsgi_response(
+            res, {'wsgi.file_wrapper': FileWrapper})
+    assert ('Content-Length', '8') in headers
+    assert body == '23456789'
+    assert f.closed
+    assert callback.called
+
+
+def test_body_filters_close_file():
+    from StringIO import StringIO
+    f = StringIO('x' * 10)
+    res = Response(200, body=f)
+    res._body_filters = (lambda body, headers: (s.upper() for s in body),)
+    status, headers, body = wsgi_response(res)
+    assert body == 'X' * 10
+    assert f.closed
+
+    closed = []
+
+    def chunks():
+        try:
+            yield u'a'
+            yield u'b'
+        finally:
+            closed.append(True)
+    res = Response(200, body=chunks())
+    app_iter = res({}, lambda *args: None)
+    assert next(app_iter) == 'a'
+    app_iter.close()
+    assert closed == [True]
+
+
+def test_file_body_head():
+    from StringIO import StringIO
+    f = StringIO('test')
+    status, headers, body = wsgi_response(
+            Response(200, body=f), {'REQUEST_METHOD': 'HEAD'})
+    assert body == ''
+    assert f.closed
+
+
+def test_no_body_not_evaluated():
+    for environ, code in (({'REQUEST_METHOD': 'HEAD'}, 200),
+                          ({}, 204), ({}, 304)):
+        body = mock.create_autospec(lambda: None, return_value='ok')
+        res = Response(code, body=body)
+        status, headers, _ = wsgi_response(res, environ)
+        assert not body.called
+        assert 'Content-Length' not in dict(headers)
+
+        res = Response(code, body='1')
+        res._body_writer = mock.create_autospec(lambda x: None,
+                                                return_value='ok')
+        wsgi_response(res, environ)
+        assert not res._body_writer.called
+
+        closed = []
+        def generate():
+            try:
+                yield 'never'
+            finally:
+                closed.append(True)
+        gen = generate()
+        next(gen)
+        wsgi_response(Response(code, body=gen), environ)
+        assert closed
+
+
+def test_head_content_length(tmpdir):
+    head = {'REQUEST_METHOD': 'HEAD'}
+    _, headers, _ = wsgi_response(Response(200, body=u'\u2603'), head)
+    assert dict(headers)['Content-Length'] == '3'
+
+    path = tmpdir.join('file.txt')
+    path.write('content')
+    f = open(str(path), 'rb')
+    _, headers, _ = wsgi_response(Response(200, body=f), head)
+    assert dict(headers)['Content-Length'] == '7'
+    assert f.closed
+
+    res = Response(200, body='test')
+    res._body_filters = (lambda body, headers: body,)
+    _, headers, _ = wsgi_response(res, head)
+    assert 'Content-Length' not in dict(headers)
+
+    _, headers, _ = wsgi_response(Response(200, body=iter(['x'])), head)
+    assert 'Content-Length' not in dict(headers)
+
+
+def test_ranged_to_str_body():
+    req = Request({'REQUEST_METHOD': 'GET', 'HTTP_RANGE': 'bytes=1-2'})
+    orig = response(200, u'abcd')
+    res = orig.ranged_to(req)
+    assert res.code == 206
+    status, headers, body = wsgi_response(res)
+    assert body == 'bc'
+    assert ('Content-Range', 'bytes 1-2/4') in headers
+
+    req = Request({'REQUEST_METHOD': 'GET'})
+    assert orig.ranged_to(req) is orig
+    req = Request({'REQUEST_METHOD': 'GET', 'HTTP_RANGE': 'bytes=1-2'})
+    stream = response(200, iter(['abcd']))
+    assert stream.ranged_to(req) is stream
+
+
+def test_ranged_to_overlapping():
+    orig = response(200, 'abcdefghij')
+    req = Request({'REQUEST_METHOD': 'GET',
+                   'HTTP_RANGE': 'bytes=' + ','.join(['0-'] * 20)})
+    res = orig.ranged_to(req)
+    assert res.code == 206
+    status, headers, body = wsgi_response(res)
+    assert body == 'abcdefghij'
+    assert ('Content-Range', 'bytes 0-9/10') in headers
+
+    req = Request({'REQUEST_METHOD': 'GET', 'HTTP_RANGE': 'bytes=6-7,0-2,3-4'})
+    res = orig.ranged_to(req)
+    status, headers, body = wsgi_response(res)
+    assert 'Content-Range: bytes 0-4/10' in body
+    assert 'Content-Range: bytes 6-7/10' in body
+    assert body.count('Content-Range') == 2
+
+
+def test_ranged_to_unsatisfiable():
+    callback = mock.Mock()
+    orig = response(200, 'abcd')
+    orig.add_callback(callback)
+    req = Request({'REQUEST_METHOD': 'GET', 'HTTP_RANGE': 'bytes=10-'})
+    res = orig.ranged_to(req)
+    assert res.code == 416
+    status, headers, body = wsgi_response(res)
+    assert ('Content-Range', 'bytes */4') in headers
+    assert callback.called
+
+
+def test_frozen_response():
+    frozen = FrozenResponse(200, [('Content-Type', 'text/plain')], u'h\u00e9llo')
+    assert frozen.headers['Content-Length'] == '6'
+    assert frozen.headers['ETag'] == '"6-%08x"' % (
+        zlib.crc32('h\xc3\xa9llo') & 0xffffffff)
+    for i in range(2):
+        copy = per_request(frozen)
+        assert copy is not frozen and per_request(copy) is copy
+        copy.add_callback(lambda: None)
+        status, headers, body = wsgi_response(copy)
+        assert body == 'h\xc3\xa9llo'
+        assert headers == frozen._frozen[2]
+        assert headers is not frozen._frozen[2]
+    assert frozen._callbacks == ()
+    assert wsgi_response(frozen, {'REQUEST_METHOD': 'HEAD'})[2] == ''
+
+    copy = per_request(frozen)
+    copy.headers['Vary'] = 'Accept'
+    status, headers, body = wsgi_response(copy)
+    assert body == 'h\xc3\xa9llo'
+    assert ('Vary', 'Accept') in headers
+    assert 'Vary' not in frozen.headers
+
+    request = Request({'HTTP_IF_NONE_MATCH': frozen.headers['ETag']})
+    assert per_request(frozen).conditional_to(request).code == 304
+
+    with assert_raises(TypeError):
+        FrozenResponse(200, body=iter(['a']))
+
+
+def test_frozen_response_mapper():
+    from rhino.mapper import Mapper
+    from rhino.test import TestClient
+    frozen = FrozenResponse(200, body='frozen')
+    app = Mapper()
+    app.add('/', lambda request: frozen)
+    client = TestClient(app.wsgi)
+    res = client.get('/')
+    assert res.body == 'frozen'
+    assert client.get('/', if_none_match=res.headers['ETag']).code == 304
+    assert frozen._callbacks == ()
+
+
+def test_coalesce_chunks():
+    chunks = ['a', u'b', '', 'cd', FLUSH, 'e', 'fgh', 'i']
+    res = Response(200, body=iter(chunks))
+    res.coalesce_bytes = 3
+    environ = {}
+    setup_testing_defaults(environ)
+    rv = []
+    app_iter = res(environ, lambda *args: rv.extend(args))
+    assert list(app_iter) == ['abcd', 'efgh', 'i']
+    app_iter.close()
+
+    res = Response(200, body=iter(chunks))
+    assert wsgi_response(res)[2] == 'abcdefghi'
+
+
+def test_coalesce_chunks_delay():
+    now = [0]
+
+    def chunks():
+        for c in 'abcde':
+            yield c
+            now[0] += 0.4
+
+    assert list(coalesce_chunks(chunks(), 100, 1.0, clock=lambda: now[0])) \
+            == ['abcd', 'e']
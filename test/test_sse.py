@@ -0,0 +1,97 @@
+import threading
+import time
+
+from rhino.mapper import Mapper
+from rhino.sse import SSEHub, HEARTBEAT
+from rhino.test import TestClient
+from rhino.util import sse_event
+
+
+def test_publish():
+    hub = SSEHub()
+    a, b = hub.subscribe(), hub.subscribe()
+    assert len(hub) == 2
+    assert hub.publish('one') == '1'
+    hub.publish('two', event='update')
+    chunk = next(a)
+    assert chunk == sse_event(data='one', id='1') \
+            + sse_event(data='two', id='2', event='update')
+    assert next(b) == chunk
+    hub.publish('three')
+    assert next(a) is next(b)  # Encoded once
+    a.close()
+    assert len(hub) == 1
+    assert list(a) == []
+
+
+def test_resume():
+    hub = SSEHub(history=2, retry=1000)
+    for i in range(3):
+        hub.publish(str(i))
+    sub = hub.subscribe(last_event_id='2')
+    assert next(sub) == sse_event(retry=1000) + sse_event(data='2', id='3')
+    sub = hub.subscribe(last_event_id='1')  # Too old
+    hub.close()
+    assert list(sub) == [sse_event(retry=1000)]
+
+
+def test_slow_subscribers():
+    hub = SSEHub(max_queued=2)
+    sub = hub.subscribe()
+    for i in range(3):
+        hub.publish(str(i))
+    assert list(sub) == []
+    assert len(hub) == 0
+    assert hub.disconnected == 1
+
+    hub = SSEHub(max_queued=2, coalesce=True)
+    sub = hub.subscribe()
+    for i in range(3):
+        hub.publish(str(i))
+    assert next(sub) == sse_event(data='1', id='2') + sse_event(data='2', id='3')
+    assert sub.dropped == 1
+
+
+def test_heartbeat():
+    hub = SSEHub()
+    a, b = hub.subscribe(), hub.subscribe()
+    hub.publish('x')
+    next(a)
+    hub.heartbeat()
+    assert next(a) == HEARTBEAT
+    assert next(b) == sse_event(data='x', id='1')
+
+
+def test_response():
+    hub = SSEHub()
+    app = Mapper()
+    app.add('/events', hub.response)
+    client = TestClient(app.wsgi)
+    hub.publish('a')
+    hub.publish('b')
+    results = []
+    t = threading.Thread(target=lambda: results.append(
+        client.get('/events', last_event_id='1')))
+    t.start()
+    deadline = time.time() + 5
+    while not len(hub) and time.time() < deadline:
+        time.sleep(0.001)
+    hub.publish('c')
+    hub.close()
+    t.join()
+    res = results[0]
+    assert res.headers['Content-Type'] == 'text/event-stream'
+    assert res.body == sse_event(data='b', id='2') + sse_event(data='c', id='3')
+
+
+def test_response_close():
+    hub = SSEHub()
+    app = Mapper()
+    app.add('/events', hub.response)
+    hub.publish('a')
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/events',
+               'HTTP_LAST_EVENT_ID': '0'}
+    app_iter = app.wsgi(environ, lambda status, headers: None)
+    assert len(hub) == 1
+    app_iter.close()
+    assert len(hub) == 0
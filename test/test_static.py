@@ -1,11 +1,13 @@
+import mimetypes
 import os
 import shutil
 import tempfile
 
+import mock
 import pytest
 from pytest import raises as assert_raises
 from rhino.mapper import Mapper
-from rhino.static import StaticFile, StaticDirectory
+from rhino.static import StaticFile, StaticDirectory, StaticCache
 from rhino.test import TestClient
 
 
@@ -72,6 +74,19 @@ def test_binary(client):
     assert res.headers['Allow'] == 'GET, HEAD'
 
 
+def test_file_wrapper(client):
+    from wsgiref.util import FileWrapper
+    file_wrapper = mock.Mock(side_effect=FileWrapper)
+    res = client.get('/robots.txt',
+                     environ={'wsgi.file_wrapper': file_wrapper})
+    assert res.status == "200 OK"
+    assert res.body == "robots.txt"
+    assert file_wrapper.call_count == 1
+    f = file_wrapper.call_args[0][0]
+    assert f.name.endswith('robots.txt')
+    assert f.closed
+
+
 def test_static_dir(client):
     res = client.get('/static/index.html')
     assert res.status == "200 OK"
@@ -97,3 +112,501 @@ def test_no_pathname_leak(client, tmpdir):
     assert res.status == "404 Not Found"
     res = client.get('/static/foo/../../%s/index.html' % dirname)
     assert res.status == "404 Not Found"
+
+
+def test_range_single(client):
+    res = client.get('/robots.txt', range='bytes=2-5')
+    assert res.status == "206 Partial Content"
+    assert res.body == "bots"
+    assert res.headers['Content-Range'] == 'bytes 2-5/10'
+    assert res.headers['Content-Length'] == '4'
+    assert res.headers['Content-Type'] == 'text/plain'
+    assert 'ETag' in res.headers
+
+    res = client.get('/robots.txt', range='bytes=-3')
+    assert res.body == "txt"
+    res = client.get('/robots.txt', range='bytes=7-100')
+    assert res.body == "txt"
+    assert res.headers['Content-Range'] == 'bytes 7-9/10'
+
+
+def test_range_full_response(client):
+    res = client.get('/robots.txt')
+    assert res.headers['Accept-Ranges'] == 'bytes'
+    assert 'Last-Modified' in res.headers
+    etag = res.headers['ETag']
+
+    for header in ('bytes=5-2', 'lines=1-2', 'bytes=a-b'):
+        res = client.get('/robots.txt', range=header)
+        assert res.status == "200 OK"
+        assert res.body == "robots.txt"
+
+    res = client.head('/robots.txt', range='bytes=0-1')
+    assert res.status == "200 OK"
+
+    res = client.get('/robots.txt', range='bytes=0-1', if_none_match=etag)
+    assert res.status == "304 Not Modified"
+
+
+def test_range_not_satisfiable(client):
+    res = client.get('/robots.txt', range='bytes=10-')
+    assert res.status == "416 Requested Range Not Satisfiable"
+    assert res.headers['Content-Range'] == 'bytes */10'
+    assert res.body == ''
+
+
+def test_if_range(client):
+    res = client.get('/robots.txt')
+    etag, last_modified = res.headers['ETag'], res.headers['Last-Modified']
+
+    res = client.get('/robots.txt', range='bytes=0-1', if_range=etag)
+    assert res.status == "206 Partial Content"
+    res = client.get('/robots.txt', range='bytes=0-1', if_range='"other"')
+    assert res.status == "200 OK"
+    assert res.body == "robots.txt"
+    res = client.get('/robots.txt', range='bytes=0-1', if_range='W/' + etag)
+    assert res.status == "200 OK"
+    res = client.get('/robots.txt', range='bytes=0-1', if_range=last_modified)
+    assert res.status == "206 Partial Content"
+    res = client.get('/robots.txt', range='bytes=0-1',
+                     if_range='Thu, 01 Jan 1970 00:00:00 GMT')
+    assert res.status == "200 OK"
+
+
+def test_range_multipart(client):
+    res = client.get('/robots.txt', range='bytes=0-1, -3')
+    assert res.status == "206 Partial Content"
+    content_type = res.headers['Content-Type']
+    assert content_type.startswith('multipart/byteranges; boundary=')
+    boundary = content_type.split('=', 1)[1]
+    assert res.headers['Content-Length'] == str(len(res.body))
+    assert res.body == (
+        '\r\n--%(b)s\r\nContent-Type: text/plain\r\n'
+        'Content-Range: bytes 0-1/10\r\n\r\nro'
+        '\r\n--%(b)s\r\nContent-Type: text/plain\r\n'
+        'Content-Range: bytes 7-9/10\r\n\r\ntxt'
+        '\r\n--%(b)s--\r\n') % {'b': boundary}
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_static_cache_interval(tmpdir):
+    path = os.path.join(tmpdir, 'cached.txt')
+    with open(path, 'w') as f:
+        f.write('one')
+    clock = FakeClock()
+    cache = StaticCache(interval=10, clock=clock)
+    app = Mapper()
+    app.add('/', StaticFile(path, cache=cache))
+    client = TestClient(app.wsgi)
+
+    res = client.get('/')
+    assert res.body == 'one'
+    etag = res.headers['ETag']
+    with mock.patch('os.stat') as stat:
+        res = client.get('/', if_none_match=etag)
+        assert res.status == "304 Not Modified"
+        assert not stat.called
+
+    os.unlink(path)
+    clock.now += 10
+    assert client.get('/').status == "404 Not Found"
+
+    with open(path, 'w') as f:
+        f.write('two!')
+    res = client.get('/')
+    assert res.body == 'two!'
+    assert res.headers['Content-Length'] == '4'
+    assert res.headers['ETag'] != etag
+
+
+def test_static_cache_fds(tmpdir):
+    paths = []
+    for name in ('a.txt', 'b.txt', 'c.txt'):
+        paths.append(os.path.join(tmpdir, name))
+        with open(paths[-1], 'w') as f:
+            f.write('file %s' % name)
+    clock = FakeClock()
+    cache = StaticCache(interval=10, max_fds=2, clock=clock)
+
+    a = cache.open(cache.lookup(paths[0]))
+    a2 = cache.open(cache.lookup(paths[0]))
+    assert a._desc is a2._desc
+    assert a.read(4) == 'file'
+    assert a2.read() == 'file a.txt'
+    a2.close()
+
+    cache.open(cache.lookup(paths[1])).close()
+    with mock.patch('os.open') as os_open:
+        b = cache.open(cache.lookup(paths[1]))
+        assert not os_open.called
+    b.close()
+
+    # Evicting a descriptor that is in use closes it after use.
+    cache.open(cache.lookup(paths[2])).close()
+    assert paths[0] not in cache._fds
+    a.seek(-5, os.SEEK_END)
+    assert a.tell() == 5
+    assert a.read() == 'a.txt'
+    fd = a._desc.fd
+    a.close()
+    assert_raises(OSError, os.fstat, fd)
+
+    # A changed file gets a new descriptor after revalidation.
+    with open(paths[1], 'w') as f:
+        f.write('changed')
+    clock.now += 10
+    b = cache.open(cache.lookup(paths[1]))
+    assert b.read() == 'changed'
+    b.close()
+    cache.clear()
+    assert len(cache._fds) == 0
+
+
+def test_static_cache_serving(tmpdir):
+    cache = StaticCache(interval=10, max_fds=10)
+    app = Mapper()
+    app.add('/static/{path:any}', StaticDirectory(tmpdir, cache=cache))
+    client = TestClient(app.wsgi)
+    res = client.get('/static/robots.txt')
+    assert res.body == 'robots.txt'
+    assert res.headers['Content-Type'] == 'text/plain'
+    res = client.get('/static/robots.txt', range='bytes=2-5')
+    assert res.body == 'bots'
+    res = client.get('/static/robots.txt', range='bytes=0-1,-3')
+    assert res.status == "206 Partial Content"
+    assert client.get('/static/nope.txt').status == "404 Not Found"
+    assert client.post('/static/robots.txt', {}).status \
+            == "405 Method Not Allowed"
+    assert cache._fds.get(os.path.join(tmpdir, 'robots.txt')).refs == 0
+
+
+@pytest.fixture
+def tree(request):
+    root = tempfile.mkdtemp(prefix='rhino_test')
+    request.addfinalizer(lambda: shutil.rmtree(root))
+    os.makedirs(os.path.join(root, 'docs', 'api'))
+    os.makedirs(os.path.join(root, 'empty'))
+    for path in ('a.txt', 'docs/index.html', 'docs/api/<b>.txt'):
+        with open(os.path.join(root, path), 'w') as f:
+            f.write(path)
+    return root
+
+
+def test_static_dir_index(tree):
+    clock = FakeClock()
+    static = StaticDirectory(tree, index=True, index_file='index.html',
+                             refresh_interval=60, clock=clock)
+    app = Mapper()
+    app.add('/static/{path:any}', static)
+    client = TestClient(app.wsgi)
+
+    assert client.get('/static/a.txt').body == 'a.txt'
+    assert client.get('/static/docs/../a.txt').body == 'a.txt'
+    assert client.get('/static/docs/api/<b>.txt').body == 'docs/api/<b>.txt'
+    assert client.get('/static/docs/').body == 'docs/index.html'
+    res = client.get('/static/docs')
+    assert res.status == "301 Moved Permanently"
+    assert res.headers['Location'] == 'http://localhost/static/docs/'
+    assert client.get('/static/').status == "404 Not Found"
+    assert client.get('/static/empty/').status == "404 Not Found"
+    assert client.post('/static/a.txt', {}).status == "405 Method Not Allowed"
+
+    dirname = os.path.basename(tree)
+    assert client.get('/static/../%s/a.txt' % dirname).status \
+            == "404 Not Found"
+
+    with open(os.path.join(tree, 'new.txt'), 'w') as f:
+        f.write('new')
+    with mock.patch('os.stat') as stat:
+        assert client.get('/static/new.txt').status == "404 Not Found"
+        assert client.get('/static/nope.php').status == "404 Not Found"
+        assert not stat.called
+    clock.now += 60
+    assert client.get('/static/new.txt').body == 'new'
+
+    with open(os.path.join(tree, 'newer.txt'), 'w') as f:
+        f.write('newer')
+    assert client.get('/static/newer.txt').status == "404 Not Found"
+    static.refresh()
+    assert client.get('/static/newer.txt').body == 'newer'
+
+    os.unlink(os.path.join(tree, 'newer.txt'))
+    assert client.get('/static/newer.txt').status == "404 Not Found"
+
+
+def test_static_dir_listings(tree):
+    static = StaticDirectory(tree, index=True, listings=True)
+    app = Mapper()
+    app.add('/static/', static)
+    app.add('/static/{path:any}', static)
+    client = TestClient(app.wsgi)
+
+    res = client.get('/static/')
+    assert res.status == "200 OK"
+    assert res.headers['Content-Type'] == 'text/html; charset=utf-8'
+    assert '<a href="docs/">docs/</a>' in res.body
+    assert '<a href="a.txt">a.txt</a>' in res.body
+    assert '../' not in res.body
+    assert client.get('/static/', if_none_match=res.headers['ETag']).status \
+            == "304 Not Modified"
+
+    res = client.get('/static/docs/api/')
+    assert '<a href="%3Cb%3E.txt">&lt;b&gt;.txt</a>' in res.body
+    assert '<a href="../">../</a>' in res.body
+    assert client.get('/static/docs/api').status == "301 Moved Permanently"
+
+    assert_raises(ValueError, StaticDirectory, tree, listings=True)
+
+
+def test_static_dir_index_file(tree):
+    app = Mapper()
+    app.add('/static/{path:any}', StaticDirectory(tree, index_file='index.html'))
+    client = TestClient(app.wsgi)
+    assert client.get('/static/docs/').body == 'docs/index.html'
+    assert client.get('/static/docs').status == "301 Moved Permanently"
+    assert client.get('/static/').status == "404 Not Found"
+    assert client.get('/static/empty/').status == "404 Not Found"
+
+
+def test_precompressed(tree):
+    import gzip
+    from rhino.static import precompress_directory
+    js = os.path.join(tree, 'app.js')
+    with open(js, 'w') as f:
+        f.write('var x = 1;\n' * 200)
+    with open(os.path.join(tree, 'small.js'), 'w') as f:
+        f.write('var x;')
+    with open(os.path.join(tree, 'image.png'), 'w') as f:
+        f.write('\0' * 2000)
+
+    assert precompress_directory(tree) == [js + '.gz']
+    assert precompress_directory(tree) == []
+    assert precompress_directory(tree, force=True) == [js + '.gz']
+    with gzip.open(js + '.gz') as f:
+        assert f.read() == 'var x = 1;\n' * 200
+
+    app = Mapper()
+    app.add('/static/{path:any}',
+            StaticDirectory(tree, precompressed=['br', 'gzip']))
+    app.add('/app.js', StaticFile(js, precompressed=['gzip']))
+    client = TestClient(app.wsgi)
+
+    for url in ('/static/app.js', '/app.js'):
+        res = client.get(url, accept_encoding='gzip, deflate')
+        assert res.headers['Content-Encoding'] == 'gzip'
+        assert res.headers['Content-Type'] == mimetypes.guess_type(js)[0]
+        assert res.headers['Vary'] == 'Accept-Encoding'
+        assert res.headers['Content-Length'] == str(os.path.getsize(js + '.gz'))
+        assert res.body == open(js + '.gz').read()
+        gzip_etag = res.headers['ETag']
+
+        res = client.get(url)
+        assert 'Content-Encoding' not in res.headers
+        assert res.headers['Vary'] == 'Accept-Encoding'
+        assert res.body == open(js).read()
+        assert res.headers['ETag'] != gzip_etag
+
+        res = client.get(url, accept_encoding='gzip;q=0')
+        assert 'Content-Encoding' not in res.headers
+        res = client.get(url, accept_encoding='gzip', if_none_match=gzip_etag)
+        assert res.status == "304 Not Modified"
+
+    res = client.get('/static/small.js', accept_encoding='gzip')
+    assert 'Content-Encoding' not in res.headers
+    assert 'Vary' not in res.headers
+
+    res = client.get('/static/app.js.gz')
+    assert res.headers['Content-Type'] == 'application/octet-stream'
+    assert 'Content-Encoding' not in res.headers
+
+    # Stale sidecars are ignored.
+    stat = os.stat(js)
+    os.utime(js + '.gz', (stat.st_atime, stat.st_mtime - 10))
+    res = client.get('/static/app.js', accept_encoding='gzip')
+    assert 'Content-Encoding' not in res.headers
+
+    assert_raises(ValueError, StaticFile, js, precompressed=['compress'])
+
+
+def test_precompressed_cached(tmpdir):
+    path = os.path.join(tmpdir, 'app.js')
+    with open(path, 'w') as f:
+        f.write('var x = 1;\n' * 200)
+    clock = FakeClock()
+    cache = StaticCache(interval=10, clock=clock)
+    app = Mapper()
+    app.add('/', StaticFile(path, cache=cache, precompressed=['br', 'gzip']))
+    client = TestClient(app.wsgi)
+
+    assert 'Content-Encoding' not in client.get('/').headers
+    with mock.patch('os.stat') as stat:
+        res = client.get('/', accept_encoding='gzip, br')
+        assert 'Content-Encoding' not in res.headers
+        assert not stat.called
+
+    with open(path + '.gz', 'w') as f:
+        f.write('gzipped')
+    clock.now += 10
+    res = client.get('/', accept_encoding='gzip, br')
+    assert res.headers['Content-Encoding'] == 'gzip'
+
+
+def test_static_cache_memory(tree):
+    clock = FakeClock()
+    cache = StaticCache(interval=10, max_memory=30, max_file_size=20,
+                        clock=clock)
+    paths = {}
+    for name, size in (('a.css', 10), ('b.css', 15), ('big.css', 25)):
+        paths[name] = os.path.join(tree, name)
+        with open(paths[name], 'w') as f:
+            f.write(name[0] * size)
+    app = Mapper()
+    app.add('/static/{path:any}',
+            StaticDirectory(tree, cache=cache, expires=60))
+    client = TestClient(app.wsgi)
+
+    res = client.get('/static/a.css')
+    assert res.body == 'a' * 10
+    assert res.headers['Content-Type'] == 'text/css'
+    assert res.headers['Content-Length'] == '10'
+    assert 'Expires' in res.headers
+    with mock.patch('rhino.static.open', create=True) as mock_open:
+        assert client.get('/static/a.css').body == 'a' * 10
+        assert client.get('/static/a.css', range='bytes=0-1').body == 'aa'
+        assert not mock_open.called
+
+    assert client.get('/static/big.css').body == 'b' * 25
+    assert 'big.css' not in str(cache._data.keys())
+
+    client.get('/static/b.css')
+    assert cache._data.bytes == 25
+    client.get('/static/b.css')  # a.css is least recently used
+    with open(paths['b.css'], 'w') as f:
+        f.write('c' * 5)
+    assert client.get('/static/b.css').body == 'b' * 15
+    client.get('/static/a.css')
+    assert sorted(cache._data.keys()) == [paths['a.css'], paths['b.css']]
+
+    clock.now += 10
+    res = client.get('/static/b.css')
+    assert res.body == 'c' * 5
+    assert res.headers['Content-Length'] == '5'
+    assert cache._data.bytes == 15
+
+    cache.clear()
+    assert len(cache._data) == 0
+
+
+def test_static_dir_fingerprints(tree):
+    for index in (False, True):
+        static = StaticDirectory(tree, expires=60, fingerprints=True,
+                                 index=index)
+        app = Mapper()
+        app.add('/static/{path:any}', static, 'static')
+        client = TestClient(app.wsgi)
+
+        digest = static.fingerprint('a.txt')
+        assert len(digest) == 10
+        url = app.path('static', [], {'path': 'a.txt'})
+        assert url == '/static/a.%s.txt' % digest
+        assert app.path('static', [], {'path': 'docs/api/<b>.txt'}) \
+                .startswith('/static/docs/api/%3Cb%3E.')
+        assert app.path('static', [], {'path': 'missing.txt'}) \
+                == '/static/missing.txt'
+
+        res = client.get(url)
+        assert res.body == 'a.txt'
+        assert res.headers['Cache-Control'] \
+                == 'public, max-age=31536000, immutable'
+        assert 'Expires' not in res.headers
+
+        res = client.get('/static/a.txt')
+        assert 'Cache-Control' not in res.headers
+        assert 'Expires' in res.headers
+
+        # A stale fingerprint serves the current file with normal caching.
+        res = client.get('/static/a.0123456789.txt')
+        assert res.body == 'a.txt'
+        assert 'Cache-Control' not in res.headers
+        assert 'Expires' in res.headers
+
+        assert client.get('/static/b.%s.txt' % digest).status \
+                == "404 Not Found"
+
+    # Hashes are recomputed when the file changes.
+    path = os.path.join(tree, 'a.txt')
+    with open(path, 'w') as f:
+        f.write('changed')
+    os.utime(path, (0, 0))
+    assert static.fingerprint('a.txt') != digest
+    assert static.fingerprint('missing.txt') is None
+
+    static = StaticDirectory(tree, fingerprints=True, max_fingerprints=1)
+    digest = static.fingerprint('a.txt')
+    static.fingerprint('b.txt')
+    assert len(static._fingerprints) == 1
+    assert static.fingerprint('a.txt') == digest
+
+
+def test_offload(tree):
+    app = Mapper()
+    app.add('/a.txt', StaticFile(os.path.join(tree, 'a.txt'), expires=60,
+                                 offload='x-sendfile'))
+    app.add('/static/{path:any}',
+            StaticDirectory(tree, index_file='index.html',
+                            offload='x-accel-redirect',
+                            offload_location='/_static'))
+    client = TestClient(app.wsgi)
+
+    res = client.get('/a.txt')
+    assert res.status == "200 OK"
+    assert res.body == ''
+    assert res.headers['X-Sendfile'] == os.path.join(tree, 'a.txt')
+    assert res.headers['Content-Type'] == 'text/plain'
+    assert 'Content-Length' not in res.headers
+    assert 'Expires' in res.headers
+    res = client.get('/a.txt', if_none_match=res.headers['ETag'])
+    assert res.status == "304 Not Modified"
+
+    res = client.get('/static/docs/api/<b>.txt', range='bytes=0-1')
+    assert res.status == "200 OK"
+    assert res.body == ''
+    assert res.headers['X-Accel-Redirect'] == '/_static/docs/api/%3Cb%3E.txt'
+    assert 'Last-Modified' in res.headers
+    res = client.get('/static/docs/')
+    assert res.headers['X-Accel-Redirect'] == '/_static/docs/index.html'
+    assert client.get('/static/../a.txt').status == "200 OK"
+    assert client.get('/static/nope').status == "404 Not Found"
+
+    assert_raises(ValueError, StaticDirectory, tree, offload='x-accel-redirect')
+    assert_raises(ValueError, StaticDirectory, tree, offload='x-foo')
+
+
+def test_offload_relative_path(tree, monkeypatch):
+    monkeypatch.chdir(tree)
+    app = Mapper()
+    app.add('/a.txt', StaticFile('a.txt', offload='x-sendfile'))
+    monkeypatch.chdir('/')
+    res = TestClient(app.wsgi).get('/a.txt')
+    assert res.headers['X-Sendfile'] == os.path.join(tree, 'a.txt')
+
+
+def test_offload_compression(tree):
+    from rhino.compression import Compression
+    app = Mapper()
+    app.add_wrapper(Compression())
+    app.add('/a.txt', StaticFile(os.path.join(tree, 'a.txt'),
+                                 offload='x-sendfile'))
+    client = TestClient(app.wsgi)
+    res = client.get('/a.txt', accept_encoding='gzip')
+    assert res.body == ''
+    assert 'Content-Encoding' not in res.headers
+    assert 'Vary' not in res.headers
+    assert not res.headers['ETag'].startswith('W/')
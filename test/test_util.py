@@ -184,3 +184,22 @@ def test_sse_event_empty():
 
 def test_sse_event_unicode():
     assert sse_event(comment=u'★') == u': ★\n\n'.encode('utf-8')
+
+
+def test_lru_cache_max_bytes():
+    from rhino.util import LRUCache
+    evicted = []
+    cache = LRUCache(max_bytes=10, on_evict=lambda k, v: evicted.append(k))
+    cache['a'] = 'x' * 4
+    cache['b'] = 'x' * 4
+    cache.get('a')
+    cache['c'] = 'x' * 4
+    assert sorted(cache.keys()) == ['a', 'c']
+    assert evicted == ['b']
+    assert cache.bytes == 8
+    cache['a'] = 'x'
+    assert cache.bytes == 5
+    cache['d'] = 'x' * 11
+    assert len(cache) == 0
+    assert cache.bytes == 0
+    assert_raises(ValueError, LRUCache, 0)